@@ -0,0 +1,115 @@
+"""Compare detection sources on a synthetic repository.
+
+    PYTHONPATH=src python benchmarks/bench_detect.py [--files 200000]
+
+Builds a git checkout with the requested number of tracked files plus an
+untracked node_modules/ and build/ tree, then times the git index reader,
+the pruned walker and a plain os.walk over the same tree. The os.walk that
+sizes files builds the same byte histogram as the other two; the one that
+only classifies names is there to show what the sizes cost.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from citool.util.langmap import (
+    classify_file,
+    get_languages,
+    histogram_from_git_index,
+    histogram_from_walk,
+)
+
+EXTENSIONS = ("py", "py", "py", "js", "c", "h", "md", "json", "txt")
+
+
+def build_repo(root: Path, files: int) -> None:
+    per_dir = 100
+    for i in range(files):
+        directory = root / "src" / f"pkg{i // (per_dir * 50)}" / f"mod{i // per_dir}"
+        if i % per_dir == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"file{i}.{EXTENSIONS[i % len(EXTENSIONS)]}").write_text("x")
+
+    subprocess.run(["git", "init", "-q"], cwd=root, check=True)
+    subprocess.run(["git", "add", "."], cwd=root, check=True)
+
+    # Untracked output that the walker prunes and the index never lists.
+    for tree in ("node_modules", "build"):
+        for i in range(files // 10):
+            directory = root / tree / f"d{i // per_dir}"
+            if i % per_dir == 0:
+                directory.mkdir(parents=True, exist_ok=True)
+            (directory / f"f{i}.js").write_text("x")
+
+
+def plain_walk(path: Path, mapping: dict) -> list:
+    detected = set()
+    for _, _, names in os.walk(path):
+        for name in names:
+            language = classify_file(name, mapping)
+            if language:
+                detected.add(language)
+    return sorted(detected)
+
+
+def plain_walk_sizes(path: Path, mapping: dict, counted: frozenset) -> list:
+    histogram = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            language = classify_file(name, mapping)
+            if language in counted:
+                size = os.stat(os.path.join(root, name)).st_size
+                histogram[language] = histogram.get(language, 0) + size
+    return sorted(histogram, key=lambda language: -histogram[language])
+
+
+def timed(label: str, fn, repeat: int) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<16} {best * 1000:10.1f} ms  {result}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if shutil.which("git") is None:
+        raise SystemExit("git is required to build the synthetic repository")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        start = time.perf_counter()
+        build_repo(root, args.files)
+        print(f"Built {args.files} tracked files in {time.perf_counter() - start:.1f}s")
+
+        mapping, counted = get_languages()
+        timed(
+            "git index",
+            lambda: histogram_from_git_index(root, mapping, counted=counted).ranked(),
+            args.repeat,
+        )
+        timed(
+            "pruned walk",
+            lambda: histogram_from_walk(root, mapping, counted=counted).ranked(),
+            args.repeat,
+        )
+        timed(
+            "os.walk, sizes",
+            lambda: plain_walk_sizes(root, mapping, counted),
+            args.repeat,
+        )
+        timed("os.walk, names", lambda: plain_walk(root, mapping), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure CLI startup and fail when it exceeds the budget.
+
+    PYTHONPATH=src python benchmarks/bench_startup.py [--runs 7] [--scale 1.0]
+
+Each scenario runs the CLI in a fresh interpreter under -X importtime and
+reports the median time spent importing modules a bare interpreter does not
+import, and the median wall time. The run fails (exit 1) when a
+median exceeds its budget, or when a scenario imports a module it should
+not need. Scale the budgets for slow machines with --scale.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FIXTURES = Path(__file__).parents[1] / "tests" / "fixtures"
+
+# Budgets in milliseconds: (import time, wall time).
+BUDGETS = {
+    "help": (75, 150),
+    "render": (220, 400),
+    "detect": (220, 400),
+}
+
+CLI = "import sys; from citool.main import main; main(sys.argv[1:])"
+
+# Modules a scenario must not import.
+FORBIDDEN = {
+    "help": ("jinja2", "yaml", "citool.blueprint", "citool.util.langmap"),
+}
+
+
+def scenarios(root: Path) -> dict:
+    shutil.copytree(FIXTURES / "python_deploy", root / "render")
+    shutil.copytree(FIXTURES / "python_setup", root / "detect")
+    (root / "detect" / "blueprint.yaml").unlink(missing_ok=True)
+    return {
+        "help": ["--help"],
+        "render": [str(root / "render"), "--ci", "gitlab", "--env", "dev", "--dry-run"],
+        "detect": [str(root / "detect"), "--ci", "gitlab", "--env", "dev", "--dry-run"],
+    }
+
+
+def imports(stderr: str) -> dict:
+    # Lines are "import time: self | cumulative | name"; top-level imports
+    # are the ones whose name is not indented. Returns every module with the
+    # cumulative microseconds of the top-level ones (0 for nested ones).
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        modules[name.strip()] = 0 if name[1:].startswith(" ") else int(cumulative)
+    return modules
+
+
+def run(code: str, args: list, env: dict) -> tuple:
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code, *args],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    wall = (time.perf_counter() - start) * 1000
+    if proc.returncode:
+        sys.exit(f"citool {' '.join(args)} failed:\n{proc.stderr}")
+    return wall, imports(proc.stderr)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # A private cache so every run sees the same warm caches.
+        env["XDG_CACHE_HOME"] = str(Path(tmp) / "cache")
+        _, baseline = run("pass", [], env)
+        for name, argv in scenarios(Path(tmp)).items():
+            run(CLI, argv, env)  # warm the caches and the OS page cache
+            results = [run(CLI, argv, env) for _ in range(args.runs)]
+            own = statistics.median(
+                sum(t for m, t in modules.items() if m not in baseline) / 1000
+                for _, modules in results
+            )
+            wall = statistics.median(wall for wall, _ in results)
+            import_budget, wall_budget = (b * args.scale for b in BUDGETS[name])
+            print(
+                f"{name:<8} imports {own:7.1f} ms (budget {import_budget:5.0f})"
+                f"  wall {wall:7.1f} ms (budget {wall_budget:5.0f})"
+            )
+
+            if own > import_budget:
+                failures.append(f"{name}: imports took {own:.1f} ms")
+            if wall > wall_budget:
+                failures.append(f"{name}: wall time {wall:.1f} ms")
+            for module in FORBIDDEN.get(name, ()):
+                if module in results[0][1]:
+                    failures.append(f"{name}: imports {module}")
+
+    for failure in failures:
+        print(f"Over budget: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
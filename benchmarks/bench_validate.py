@@ -0,0 +1,119 @@
+"""Compare the compiled blueprint validator with interpreting validators.
+
+    PYTHONPATH=src python benchmarks/bench_validate.py [--blueprints 5000]
+
+The baseline walks the schema dicts on every call, which is what a
+straightforward validator does. jsonschema is timed too when installed.
+"""
+
+import argparse
+import copy
+import json
+import time
+
+from citool.util.schema_helper import SCHEMA_PATH
+from citool.validator import TYPE_CHECKS, compile_schema
+
+
+def interpret(schema, instance, root, pointer="", errors=None):
+    errors = [] if errors is None else errors
+    if schema is True or schema == {}:
+        return errors
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"][2:].split("/"):
+            target = target[part]
+        interpret(target, instance, root, pointer, errors)
+    if "type" in schema:
+        types = [schema["type"]] if isinstance(schema["type"], str) else schema["type"]
+        if not any(TYPE_CHECKS[t](instance) for t in types):
+            errors.append((pointer, "type"))
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append((pointer, "enum"))
+    if "const" in schema and instance != schema["const"]:
+        errors.append((pointer, "const"))
+    if isinstance(instance, dict):
+        for name in schema.get("required", []):
+            if name not in instance:
+                errors.append((pointer, "required"))
+        properties = schema.get("properties", {})
+        for name, value in instance.items():
+            if name in properties:
+                interpret(properties[name], value, root, f"{pointer}/{name}", errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append((pointer, "additional"))
+    if isinstance(instance, list) and "items" in schema:
+        for i, item in enumerate(instance):
+            interpret(schema["items"], item, root, f"{pointer}/{i}", errors)
+    for sub in schema.get("allOf", []):
+        interpret(sub, instance, root, pointer, errors)
+    if "if" in schema:
+        branch = "then" if not interpret(schema["if"], instance, root) else "else"
+        if branch in schema:
+            interpret(schema[branch], instance, root, pointer, errors)
+    return errors
+
+
+def make_blueprints(count: int) -> list:
+    base = {
+        "language": "python",
+        "build_system": "poetry",
+        "build_commands": ["poetry install"],
+        "test_commands": ["pytest"],
+        "lint_commands": ["ruff check ."],
+        "artifacts": {"paths": ["dist/"]},
+        "deployments": [
+            {"method": "docker", "registry": "r", "image_name": "i", "tag": "t"},
+            {"method": "ssh", "target_server": "h", "target_path": "/opt", "commands": ["x"]},
+            {"method": "rsync", "target_server": "h", "target_path": "/o", "artifact_path": "a"},
+        ],
+        "caching": {"enabled": True, "paths": [".venv/"], "key": "k"},
+        "branching": {"strategy": "gitflow", "protected_branches": ["main"]},
+        "tagging": {"scheme": "semantic", "prefix": "v"},
+        "ci": {"platform": "gitlab", "output_path": ".gitlab-ci.yml"},
+        "env": "dev",
+    }
+    blueprints = []
+    for i in range(count):
+        blueprint = copy.deepcopy(base)
+        if i % 10 == 0:
+            blueprint["deployments"][0].pop("tag")
+        blueprints.append(blueprint)
+    return blueprints
+
+
+def timed(label: str, fn, blueprints: list) -> None:
+    start = time.perf_counter()
+    invalid = sum(1 for blueprint in blueprints if fn(blueprint))
+    elapsed = time.perf_counter() - start
+    per_item = elapsed / len(blueprints) * 1e6
+    print(f"{label:<14} {elapsed * 1000:9.1f} ms  {per_item:7.1f} us/blueprint  {invalid} invalid")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blueprints", type=int, default=5000)
+    args = parser.parse_args()
+
+    with open(SCHEMA_PATH) as f:
+        schema = json.load(f)
+    blueprints = make_blueprints(args.blueprints)
+
+    start = time.perf_counter()
+    validate = compile_schema(schema)
+    print(f"compile        {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    timed("compiled", validate, blueprints)
+    timed("interpreted", lambda b: interpret(schema, b, schema), blueprints)
+
+    try:
+        import jsonschema
+    except ImportError:
+        print("jsonschema     not installed, skipped")
+    else:
+        validator = jsonschema.Draft202012Validator(schema)
+        timed("jsonschema", lambda b: list(validator.iter_errors(b)), blueprints)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import yaml
+from jinja2 import TemplateError
+
+from citool.blueprint import load_or_generate_blueprint
+from citool.config import Config
+from citool.generator import generate
+from citool.renderer import get_output_path, stream_template
+from citool.util import timing
+from citool.util.langmap import get_extension_map
+from citool.util.schema_helper import get_registry
+from citool.util.util import find_blueprint
+from citool.validator import get_validator
+
+DEFAULT_MAX_DEPTH = 3
+
+
+def discover_projects(source: Path, max_depth: int = DEFAULT_MAX_DEPTH) -> list[Path]:
+    # A list file holds one project directory per line, relative to the file.
+    if source.is_file():
+        projects = []
+        for line in source.read_text().splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                projects.append(source.parent / line)
+        return projects
+
+    return _discover(source, max_depth)
+
+
+def _discover(directory: Path, depth: int) -> list[Path]:
+    # Directories with a blueprint are projects. A git checkout without any
+    # blueprint projects beneath it is a project of its own (it will be detected).
+    if find_blueprint(directory) is not None:
+        return [directory]
+
+    found: list[Path] = []
+    if depth > 0:
+        try:
+            children = sorted(
+                entry
+                for entry in directory.iterdir()
+                if entry.is_dir() and not entry.name.startswith(".")
+            )
+        except OSError:
+            children = []
+        for child in children:
+            found.extend(_discover(child, depth - 1))
+
+    if not found and (directory / ".git").exists():
+        return [directory]
+    return found
+
+
+def _init_worker() -> None:
+    # Pay the one-off costs (extension map, schema) once per worker process
+    # instead of once per project.
+    get_extension_map()
+    get_validator()
+
+
+def process_project(path: Path, options: dict) -> dict:
+    start = time.perf_counter()
+    result: dict = {"path": str(path), "status": "error", "output_path": None}
+    config = Config(path=path, interactive=False, **options)
+    recorder = timing.enable() if config.timings or config.trace_file else None
+
+    try:
+        # Per-project chatter would corrupt the machine-readable summary.
+        with (
+            timing.span("project", path=str(path)),
+            contextlib.redirect_stdout(io.StringIO()),
+        ):
+            blueprint = load_or_generate_blueprint(path, config)
+            if config.dry_run:
+                # The output is discarded, so render it without holding it.
+                with timing.span("render"):
+                    for _ in stream_template(blueprint, config):
+                        pass
+                result["output_path"] = str(get_output_path(config, blueprint))
+                result["status"] = "rendered"
+            else:
+                statuses = generate(blueprint, config, [(config.ci, config.env)])
+                [(output_path, status)] = statuses.items()
+                result["output_path"] = str(output_path)
+                result["status"] = status
+    except (OSError, ValueError, yaml.YAMLError, TemplateError) as e:
+        # Problems of this project; anything else is a bug and stops the run.
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    if recorder is not None:
+        # Workers are reused across projects, so each starts a fresh recorder.
+        timing.disable()
+        result["timings"] = timing.phase_totals(recorder.events)
+        result["trace"] = recorder.events
+    return result
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool batch",
+        description="Render pipelines for many projects in one process",
+    )
+    parser.add_argument(
+        "source",
+        type=Path,
+        help="Root directory to search for projects, or a file listing project paths",
+    )
+    parser.add_argument(
+        "--ci",
+        choices=get_registry().enum_choices("ci.platform"),
+        required=True,
+        help="Target CI platform",
+    )
+    parser.add_argument("--env", required=True, help="Deployment environment")
+    parser.add_argument("--template", help="Custom template set name (e.g., team_xyz)")
+    parser.add_argument(
+        "--user-templates",
+        type=Path,
+        help="Template root checked before the built-in templates "
+        "(default: user_templates/)",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=Path,
+        help="Precompiled template bundle from 'citool precompile' "
+        "(default: the one in the cache directory, if any)",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Render but do not write files"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Overwrite existing output"
+    )
+    parser.add_argument(
+        "--sample",
+        action="store_true",
+        help="Stop language detection once the primary language is settled",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the detection cache",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Record phase timings per project and print a summary of all of them",
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=Path,
+        help="Write the phase timings of every project as one Chrome trace",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help="How deep to search the root directory for projects",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    if not args.source.exists():
+        print(f"Error: {args.source} does not exist", file=sys.stderr)
+        sys.exit(1)
+
+    projects = discover_projects(args.source, args.max_depth)
+    options = {
+        "ci": args.ci,
+        "env": args.env,
+        "template": args.template,
+        "user_templates": args.user_templates,
+        "bundle": args.bundle,
+        "dry_run": args.dry_run,
+        "force": args.force,
+        "sample": args.sample,
+        "use_cache": not args.no_cache,
+        "timings": args.timings,
+        "trace_file": args.trace_file,
+    }
+
+    counts: dict[str, int] = {}
+    events: list[dict] = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, args.workers), initializer=_init_worker
+    ) as pool:
+        futures = [
+            pool.submit(process_project, project, options) for project in projects
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            events.extend(result.pop("trace", None) or ())
+            counts[result["status"]] = counts.get(result["status"], 0) + 1
+            print(json.dumps(result), flush=True)
+
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(
+        f"Processed {len(projects)} project(s): {summary or 'nothing to do'}",
+        file=sys.stderr,
+    )
+
+    if args.timings:
+        print(timing.format_summary(events), file=sys.stderr)
+    if args.trace_file:
+        timing.write_trace(args.trace_file, events)
+        print(f"Trace written to {args.trace_file}", file=sys.stderr)
+
+    if counts.get("error"):
+        sys.exit(1)
@@ -1,26 +1,200 @@
+import copy
 import json
-from typing import Dict
-import yaml
+import logging
+import os
 import sys
-
 from pathlib import Path
 
+import yaml
+
 from citool.config import Config
-from citool.util.util import ask
-from citool.util.langmap import detect_languages
+from citool.util.cache import CACHE_VERSION, DetectionCache, repository_state
+from citool.util.langmap import detect_language_histogram
+from citool.util.timing import timed
+from citool.util.util import ask, find_blueprint
+from citool.validator import validate_blueprint
+
+logger = logging.getLogger("citool")
+
+
+# Resolved base blueprints by path: the (path, mtime, size) of every file
+# they were built from, the merged blueprint and the file behind each key.
+# A fleet sharing a base reads and merges it once per process. The least
+# recently used bases are dropped past MAX_RESOLVED_BASES, which keeps a
+# long-running 'citool serve' from holding every base it ever saw.
+Stamps = tuple[tuple[str, int, int], ...]
+MAX_RESOLVED_BASES = 256
+_resolved_bases: dict[str, tuple[Stamps, dict, dict[str, str]]] = {}
+
+# The blueprint language of each detected (Linguist) language the schema
+# knows; any other is written as 'unknown'.
+BLUEPRINT_LANGUAGES = {
+    "C": "c",
+    "C++": "cpp",
+    "Go": "go",
+    "Java": "java",
+    "JavaScript": "nodejs",
+    "Python": "python",
+    "TypeScript": "nodejs",
+}
+
+# Files whose content decides a build system's dependencies, most specific
+# first. Cache keys are derived from them so a cache lives exactly as long as
+# the dependencies do.
+LOCKFILES = {
+    "poetry": ("poetry.lock",),
+    "setuptools": ("requirements*.txt",),
+    "pip": ("requirements*.txt",),
+    "maven": ("pom.xml",),
+    "gradle": ("gradle.lockfile", "build.gradle", "build.gradle.kts"),
+    "npm": ("package-lock.json",),
+    "yarn": ("yarn.lock",),
+}
+
+
+def read_blueprint(file: Path) -> dict:
+    with open(file, "r") as f:
+        if file.suffix == ".json":
+            return json.load(f)
+        return yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _stamp(file: str) -> tuple[str, int, int]:
+    stat = os.stat(file)
+    return file, stat.st_mtime_ns, stat.st_size
+
+
+def _record(value, key: str, source: str, origins: dict[str, str]) -> None:
+    if isinstance(value, dict) and value:
+        for name, item in value.items():
+            _record(item, f"{key}.{name}", source, origins)
+    else:
+        origins[key] = source
+
+
+def deep_merge(
+    base: dict, layer: dict, source: str, origins: dict[str, str], prefix: str = ""
+) -> dict:
+    # Mappings merge key by key; anything else, lists included, is replaced
+    # by the layer's value. origins maps dotted keys to the file that set them.
+    merged = dict(base)
+    for name, value in layer.items():
+        key = prefix + name
+        if isinstance(value, dict) and isinstance(base.get(name), dict):
+            merged[name] = deep_merge(base[name], value, source, origins, key + ".")
+            continue
+        for stale in [k for k in origins if k == key or k.startswith(key + ".")]:
+            del origins[stale]
+        merged[name] = value
+        _record(value, key, source, origins)
+    return merged
+
+
+def _resolve(file: str, chain: tuple[str, ...]) -> tuple[Stamps, dict, dict[str, str]]:
+    if file in chain:
+        cycle = chain[chain.index(file) :] + (file,)
+        raise ValueError("Blueprint extends form a cycle: " + " -> ".join(cycle))
+
+    cached = _resolved_bases.get(file) if chain else None
+    if cached is not None:
+        try:
+            if all(_stamp(stamp[0]) == stamp for stamp in cached[0]):
+                _resolved_bases[file] = _resolved_bases.pop(file)
+                return cached
+        except OSError:
+            pass
+
+    stamps = [_stamp(file)]
+    layer = read_blueprint(Path(file))
+    if not isinstance(layer, dict):
+        raise ValueError(f"Blueprint {file} is not a mapping")
+    extends = layer.pop("extends", [])
+    merged: dict = {}
+    origins: dict[str, str] = {}
+    for base in [extends] if isinstance(extends, str) else extends:
+        base_file = os.path.normpath(
+            os.path.join(os.path.dirname(file), os.path.expanduser(base))
+        )
+        try:
+            base_stamps, base_merged, base_origins = _resolve(
+                base_file, chain + (file,)
+            )
+        except FileNotFoundError as e:
+            raise FileNotFoundError(
+                f"Blueprint {file} extends missing file {base_file}"
+            ) from e
+        stamps.extend(base_stamps)
+        merged = deep_merge(merged, copy.deepcopy(base_merged), base_file, origins)
+        # Keys the base itself inherited keep pointing at their own file.
+        origins.update(base_origins)
+    merged = deep_merge(merged, layer, file, origins)
+
+    result = (tuple(stamps), merged, origins)
+    if chain:
+        _resolved_bases.pop(file, None)
+        _resolved_bases[file] = result
+        while len(_resolved_bases) > MAX_RESOLVED_BASES:
+            del _resolved_bases[next(iter(_resolved_bases))]
+    return result
 
 
-def load_or_generate_blueprint(path: Path, config: Config) -> Dict:
-    for ext in ("yaml", "yml", "json"):
-        file = path / f"blueprint.{ext}"
-        if file.exists():
-            print(f"Loading existing blueprint from {file}")
-            with open(file, "r") as f:
-                return yaml.safe_load(f) if ext in ("yaml", "yml") else json.load(f)
+def resolve_layers(file: Path) -> tuple[dict, dict[str, str]]:
+    # The blueprint with every base it extends merged in, bases first, and
+    # the file that supplied each (dotted) key.
+    _, blueprint, origins = _resolve(os.path.abspath(file), ())
+    return blueprint, origins
+
+
+def resolve_blueprint(file: Path) -> dict:
+    return resolve_layers(file)[0]
+
+
+def explain_blueprint(file: Path) -> list[tuple[str, str]]:
+    # Every key of the resolved blueprint, in blueprint order, with the file
+    # that supplied it.
+    blueprint, origins = resolve_layers(file)
+    keys: dict[str, str] = {}
+    for name, value in blueprint.items():
+        _record(value, name, "", keys)
+    return [(key, origins[key]) for key in keys]
+
+
+def find_lockfiles(path: Path, build_system: str | None) -> list[str]:
+    files = []
+    for pattern in LOCKFILES.get(build_system, ()):
+        for file in sorted(path.glob(pattern)):
+            if file.is_file() and file.name not in files:
+                files.append(file.name)
+    return files
+
+
+def add_cache_key_files(blueprint: dict, path: Path) -> None:
+    caching = blueprint.get("caching")
+    if not caching or not caching.get("enabled", True) or "key_files" in caching:
+        return
+    key_files = find_lockfiles(path, blueprint.get("build_system"))
+    if key_files:
+        logger.debug("Cache key files for %s: %s", path, ", ".join(key_files))
+        caching["key_files"] = key_files
+
+
+@timed("blueprint")
+def load_or_generate_blueprint(path: Path, config: Config) -> dict:
+    file = find_blueprint(path)
+    if file is not None:
+        print(f"Loading existing blueprint from {file}")
+        blueprint = resolve_blueprint(file)
+        errors = validate_blueprint(blueprint)
+        if errors:
+            raise ValueError(f"Invalid blueprint {file}:\n  " + "\n  ".join(errors))
+        add_cache_key_files(blueprint, path)
+        return blueprint
 
     print("No blueprint found. Detecting project stack...")
-    blueprint = detect_stack(path)
+    blueprint = detect_stack(path, sample=config.sample, use_cache=config.use_cache)
     if blueprint is None:
+        if not config.interactive:
+            raise ValueError(f"Unable to detect language/build system in {path}")
         if not ask(
             "Unable to detect language/build system. Create a minimal empty blueprint?"
         ):
@@ -39,7 +213,7 @@ def load_or_generate_blueprint(path: Path, config: Config) -> Dict:
         print("--- Generated Blueprint ---")
         print(yaml.dump(blueprint, sort_keys=False))
     else:
-        if ask("Create blueprint.yaml now?"):
+        if config.interactive and ask("Create blueprint.yaml now?"):
             file = path / "blueprint.yaml"
             with open(file, "w") as f:
                 yaml.dump(blueprint, f, sort_keys=False)
@@ -48,16 +222,46 @@ def load_or_generate_blueprint(path: Path, config: Config) -> Dict:
     return blueprint
 
 
-def detect_stack(path: Path) -> Dict | None:
-    languages = detect_languages(path)
+def detect_stack(
+    path: Path, sample: bool = False, use_cache: bool = False
+) -> dict | None:
+    if use_cache:
+        cache = DetectionCache()
+        key = f"{CACHE_VERSION}:{sample}:{repository_state(path)}"
+        entry = cache.get(path, key)
+        if entry is not None:
+            logger.debug("Using cached detection result for %s", path.resolve())
+            blueprint = entry["result"]
+        else:
+            blueprint = _detect_stack(path, sample)
+            cache.put(path, key, blueprint)
+    else:
+        blueprint = _detect_stack(path, sample)
 
-    if not languages:
+    if blueprint is None:
         print("No known languages detected.")
         return None
 
-    primary = languages[0]
+    histogram = blueprint["metadata"]["languages"]
+    total = sum(histogram.values()) or 1
+    for language, size in histogram.items():
+        logger.debug("  %-20s %10d bytes %6.1f%%", language, size, 100 * size / total)
+
+    print(f"Detected language: {next(iter(histogram))}")
+    print(f"Build system: {blueprint['build_system']}")
+
+    return blueprint
+
+
+def _detect_stack(path: Path, sample: bool) -> dict | None:
+    histogram = detect_language_histogram(path, sample=sample)
+
+    if not histogram:
+        return None
+
+    primary = next(iter(histogram))
     blueprint = {
-        "language": primary.lower(),
+        "language": BLUEPRINT_LANGUAGES.get(primary, "unknown"),
         "build_system": "none",
         "build_commands": [],
     }
@@ -81,7 +285,6 @@ def detect_stack(path: Path) -> Dict | None:
             blueprint["build_system"] = "gradle"
             blueprint["build_commands"] = ["gradle build"]
 
-    print(f"Detected language: {primary}")
-    print(f"Build system: {blueprint['build_system']}")
+    blueprint["metadata"] = {"languages": histogram}
 
     return blueprint
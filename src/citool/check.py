@@ -0,0 +1,192 @@
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import yaml
+from jinja2 import TemplateError
+
+from citool.batch import DEFAULT_MAX_DEPTH, _init_worker, discover_projects
+from citool.blueprint import load_or_generate_blueprint
+from citool.config import Config
+from citool.generator import blueprint_targets, plan_targets, target_inputs
+from citool.manifest import content_hash, file_hash, is_up_to_date, read_lock
+from citool.renderer import render_template
+from citool.util.util import find_blueprint
+
+
+def _split(value: str | None) -> list[str]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else []
+
+
+def unified_diff(output_path: Path, expected: str) -> str:
+    try:
+        current = output_path.read_text()
+    except OSError:
+        current = ""
+    return "".join(
+        difflib.unified_diff(
+            current.splitlines(keepends=True),
+            expected.splitlines(keepends=True),
+            fromfile=f"{output_path} (committed)",
+            tofile=f"{output_path} (rendered)",
+        )
+    )
+
+
+def check_project(path: Path, options: dict) -> dict:
+    # Compares each output with what would be rendered, by hash first. A diff
+    # is only built for outputs that do not match. Checkouts without a
+    # blueprint have nothing committed to compare with and are skipped.
+    result: dict = {"path": str(path), "status": "error", "outputs": []}
+    if find_blueprint(path) is None:
+        return dict(result, status="skipped", reason="no blueprint")
+    config = Config(path=path, interactive=False, **options)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            blueprint = load_or_generate_blueprint(path, config)
+            planned = plan_targets(
+                blueprint, config, blueprint_targets(config, blueprint)
+            )
+            output_paths = [output_path for _, output_path, _, _ in planned]
+
+            # A lock that matches the inputs and the files on disk means they
+            # are in sync without rendering anything.
+            if is_up_to_date(
+                read_lock(path),
+                target_inputs(blueprint, config, planned),
+                path,
+                output_paths,
+            ):
+                planned = []
+                result["outputs"] = [
+                    {"output_path": str(p), "status": "in-sync"} for p in output_paths
+                ]
+
+            for (ci, env), output_path, target_blueprint, target_config in planned:
+                expected = render_template(target_blueprint, target_config)
+                current = file_hash(output_path)
+                entry = {"ci": ci, "env": env, "output_path": str(output_path)}
+                if current == content_hash(expected):
+                    entry["status"] = "in-sync"
+                else:
+                    entry["status"] = "missing" if current is None else "drift"
+                    entry["diff"] = unified_diff(output_path, expected)
+                result["outputs"].append(entry)
+
+        statuses = {entry["status"] for entry in result["outputs"]}
+        result["status"] = "in-sync" if statuses == {"in-sync"} else "drift"
+    except (OSError, ValueError, yaml.YAMLError, TemplateError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool check",
+        description="Fail when committed pipelines differ from what their blueprints render",
+    )
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        type=Path,
+        default=[Path(".")],
+        help="Project directories, directories to search for projects, "
+        "or files listing project paths (default: .)",
+    )
+    parser.add_argument("--ci", help="CI platform(s) to check, comma-separated")
+    parser.add_argument("--env", help="Environment(s) to check, comma-separated")
+    parser.add_argument("--template", help="Custom template set name (e.g., team_xyz)")
+    parser.add_argument(
+        "--user-templates",
+        type=Path,
+        help="Template root checked before the built-in templates "
+        "(default: user_templates/)",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=Path,
+        help="Precompiled template bundle from 'citool precompile' "
+        "(default: the one in the cache directory, if any)",
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="Only list drifted files, without diffs"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print one JSON result per project"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=DEFAULT_MAX_DEPTH,
+        help="How deep to search directories for projects",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    projects: list[Path] = []
+    for source in args.sources:
+        if not source.exists():
+            print(f"Error: {source} does not exist", file=sys.stderr)
+            sys.exit(1)
+        projects.extend(discover_projects(source, args.max_depth))
+
+    platforms, envs = _split(args.ci), _split(args.env)
+    options = {
+        "ci": platforms[0] if platforms else None,
+        "env": envs[0] if envs else None,
+        "platforms": platforms,
+        "envs": envs,
+        "template": args.template,
+        "user_templates": args.user_templates,
+        "bundle": args.bundle,
+    }
+
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(args.workers, len(projects) or 1)),
+        initializer=_init_worker,
+    ) as pool:
+        # Results come back in project order so the report is stable.
+        results = list(pool.map(check_project, projects, [options] * len(projects)))
+
+    counts: dict[str, int] = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        if args.json:
+            print(json.dumps(result))
+            continue
+        if result["status"] == "error":
+            print(f"{result['path']}: error: {result['error']}")
+        elif result["status"] == "skipped" and not args.quiet:
+            print(f"{result['path']}: skipped ({result['reason']})")
+        for entry in result["outputs"]:
+            if entry["status"] == "in-sync":
+                continue
+            print(f"{entry['output_path']}: {entry['status']}")
+            if not args.quiet:
+                print(entry["diff"], end="")
+
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    print(
+        f"Checked {len(projects)} project(s): {summary or 'nothing to do'}",
+        file=sys.stderr,
+    )
+
+    if counts.get("drift") or counts.get("error"):
+        sys.exit(1)
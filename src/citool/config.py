@@ -4,13 +4,23 @@ from pathlib import Path
 class Config:
     def __init__(
         self,
-        ci: str,
-        env: str,
+        ci: str | None,
+        env: str | None,
         template: str | None = None,
         path: Path = Path("."),
         dry_run: bool = False,
         force: bool = False,
         verbose: bool = False,
+        interactive: bool = True,
+        sample: bool = False,
+        use_cache: bool = True,
+        user_templates: Path | None = None,
+        bundle: Path | None = None,
+        platforms: list[str] | None = None,
+        envs: list[str] | None = None,
+        timings: bool = False,
+        trace_file: Path | None = None,
+        explain: bool = False,
     ):
         self.ci = ci
         self.env = env
@@ -19,3 +29,15 @@ class Config:
         self.dry_run = dry_run
         self.force = force
         self.verbose = verbose
+        self.interactive = interactive
+        self.sample = sample
+        self.use_cache = use_cache
+        self.user_templates = user_templates
+        self.bundle = bundle
+        # Every platform and environment asked for; ci and env are the
+        # target being rendered.
+        self.platforms = platforms if platforms is not None else [ci] if ci else []
+        self.envs = envs if envs is not None else [env] if env else []
+        self.timings = timings
+        self.trace_file = trace_file
+        self.explain = explain
@@ -0,0 +1,533 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import logging
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+from citool.blueprint import load_or_generate_blueprint
+from citool.config import Config
+from citool.generator import blueprint_targets
+from citool.pipeline import Graph, critical_path
+from citool.renderer import render_template
+
+logger = logging.getLogger("citool")
+
+# Top-level GitLab keys that are not jobs.
+GITLAB_KEYWORDS = frozenset(
+    (
+        "stages",
+        "default",
+        "variables",
+        "workflow",
+        "include",
+        "image",
+        "services",
+        "cache",
+        "before_script",
+        "after_script",
+    )
+)
+GITLAB_DEFAULT_STAGES = [".pre", "build", "test", "deploy", ".post"]
+
+# Matrix and shard suffixes CI systems add to job names in their exports:
+# "test: [tests/a.py]", "test 1/4", "test (tests/a.py)".
+INSTANCE_SUFFIX = re.compile(r"(: \[.*\]| \d+/\d+| \(.*\))$")
+
+DEFAULT_SECONDS = 60.0
+
+
+class Job:
+    def __init__(
+        self,
+        needs: list[str],
+        instances: int = 1,
+        cached: bool = False,
+        path_filtered: bool = False,
+        ref_filtered: bool = False,
+        manual: bool = False,
+    ):
+        self.needs = needs
+        # Matrix or parallel copies; they run side by side, each taking the
+        # job's duration.
+        self.instances = instances
+        self.cached = cached
+        # Runs only when files matching its path filters changed.
+        self.path_filtered = path_filtered
+        # Runs only in some pipelines: if: conditions (protected branches,
+        # release tags), only: refs or except:.
+        self.ref_filtered = ref_filtered
+        # Runs only when started by hand; not part of the estimate.
+        self.manual = manual
+
+
+def _matrix_size(entries: list) -> int:
+    size = 0
+    for entry in entries:
+        combinations = 1
+        for values in (entry or {}).values():
+            combinations *= len(values) if isinstance(values, list) else 1
+        size += combinations
+    return size or 1
+
+
+def _gitlab_conditions(job: dict) -> tuple[bool, bool, bool] | None:
+    # (path filtered, ref filtered, manual), or None for a job that never
+    # runs. Rules apply first match first; a rule without if, changes or
+    # exists matches every pipeline, so the rules after it never apply.
+    when = job.get("when", "on_success")
+    if "rules" not in job:
+        only, excluded = job.get("only"), job.get("except")
+        changes_only = isinstance(only, dict) and set(only) <= {"changes"}
+        path_filtered = isinstance(only, dict) and "changes" in only
+        ref_filtered = bool(excluded) or (only is not None and not changes_only)
+        return path_filtered, ref_filtered, when == "manual"
+
+    reachable = []
+    for rule in job["rules"] or []:
+        if not isinstance(rule, dict):
+            continue
+        reachable.append(rule)
+        if not {"if", "changes", "exists"} & set(rule):
+            break
+    running = [rule for rule in reachable if rule.get("when", when) != "never"]
+    if not running:
+        return None
+    path_filtered = all("changes" in rule for rule in running)
+    ref_filtered = all("if" in rule for rule in running) or any(
+        "if" in rule and rule.get("when", when) == "never" for rule in reachable
+    )
+    manual = all(rule.get("when", when) == "manual" for rule in running)
+    return path_filtered, ref_filtered, manual
+
+
+def gitlab_jobs(document: dict) -> dict[str, Job]:
+    # Jobs with needs run when those are done; other jobs wait for every job
+    # of the stages before theirs, like pipeline.job_graph in stages mode.
+    stages = document.get("stages") or GITLAB_DEFAULT_STAGES
+    default_cache = bool(
+        (document.get("default") or {}).get("cache") or document.get("cache")
+    )
+
+    definitions = {
+        name: job
+        for name, job in document.items()
+        if isinstance(name, str)
+        and name not in GITLAB_KEYWORDS
+        and not name.startswith(".")
+        and isinstance(job, dict)
+    }
+    # Jobs that never run are not part of any stage.
+    conditions = {name: _gitlab_conditions(job) for name, job in definitions.items()}
+    by_stage: dict[str, list[str]] = {}
+    for name, job in definitions.items():
+        if conditions[name] is not None:
+            by_stage.setdefault(job.get("stage", "test"), []).append(name)
+
+    jobs: dict[str, Job] = {}
+    previous: list[str] = []
+    for stage in stages:
+        for name in by_stage.get(stage, []):
+            job = definitions[name]
+            if "needs" in job:
+                needs = [
+                    need["job"] if isinstance(need, dict) else need
+                    for need in job["needs"]
+                ]
+            else:
+                needs = list(previous)
+
+            parallel = job.get("parallel")
+            if isinstance(parallel, int):
+                instances = parallel
+            elif isinstance(parallel, dict):
+                instances = _matrix_size(parallel.get("matrix") or [])
+            else:
+                instances = 1
+
+            cache = job.get("cache", default_cache)
+            jobs[name] = Job(needs, instances, bool(cache), *conditions[name])
+        previous = by_stage.get(stage) or previous
+    return jobs
+
+
+def github_jobs(document: dict) -> dict[str, Job]:
+    # Jobs without needs start right away. Path filters apply to the whole
+    # workflow. YAML 1.1 reads the 'on' key as True.
+    triggers = document.get("on", document.get(True)) or {}
+    path_filtered = isinstance(triggers, dict) and any(
+        isinstance(trigger, dict) and "paths" in trigger
+        for trigger in triggers.values()
+    )
+
+    jobs: dict[str, Job] = {}
+    for name, job in (document.get("jobs") or {}).items():
+        needs = job.get("needs") or []
+        needs = [needs] if isinstance(needs, str) else list(needs)
+
+        matrix = (job.get("strategy") or {}).get("matrix")
+        instances = 1
+        if isinstance(matrix, dict):
+            axes = {
+                key: value
+                for key, value in matrix.items()
+                if key not in ("include", "exclude")
+            }
+            instances = _matrix_size([axes]) if axes else 0
+            instances += len(matrix.get("include") or []) if not axes else 0
+            instances -= len(matrix.get("exclude") or [])
+            instances = max(instances, 1)
+
+        cached = any(
+            str(step.get("uses", "")).startswith("actions/cache")
+            for step in job.get("steps") or []
+            if isinstance(step, dict)
+        )
+        jobs[name] = Job(
+            needs, instances, cached, path_filtered, ref_filtered="if" in job
+        )
+    return jobs
+
+
+def pipeline_jobs(document: dict, platform: str) -> dict[str, Job]:
+    jobs = github_jobs(document) if platform == "github" else gitlab_jobs(document)
+    # Needs on jobs this pipeline does not define (e.g. from includes) are
+    # outside what can be estimated.
+    for job in jobs.values():
+        job.needs = [need for need in job.needs if need in jobs]
+    return jobs
+
+
+def _seconds(row: dict) -> float | None:
+    for key in ("duration", "seconds", "duration_seconds"):
+        if row.get(key) not in (None, ""):
+            return float(row[key])
+    # GitHub's jobs API has timestamps only.
+    if row.get("started_at") and row.get("completed_at"):
+        started = datetime.fromisoformat(str(row["started_at"]))
+        completed = datetime.fromisoformat(str(row["completed_at"]))
+        return (completed - started).total_seconds()
+    return None
+
+
+def read_history(file: Path) -> dict[str, dict[str, list[float]]]:
+    # Durations per job from a CSV or JSON export: rows with a job name
+    # ("job" or "name") and seconds ("duration", "seconds" or GitHub's
+    # started_at/completed_at), optionally with "cache" set to hit or miss.
+    # JSON may also map job names straight to seconds.
+    text = file.read_text()
+    if file.suffix == ".csv":
+        rows: list = list(csv.DictReader(io.StringIO(text)))
+    else:
+        data = json.loads(text)
+        if isinstance(data, dict) and "jobs" in data:
+            data = data["jobs"]
+        if isinstance(data, dict):
+            data = [{"job": job, "duration": seconds} for job, seconds in data.items()]
+        if not isinstance(data, list):
+            raise ValueError("expected a list of jobs or a mapping of job names")
+        rows = data
+
+    history: dict[str, dict[str, list[float]]] = {}
+    for index, row in enumerate(rows):
+        if not isinstance(row, dict):
+            logger.warning("Skipping history entry %d: not an object", index + 1)
+            continue
+        name = row.get("job") or row.get("name")
+        seconds = _seconds(row)
+        if not name or seconds is None:
+            continue
+        samples = history.setdefault(
+            INSTANCE_SUFFIX.sub("", str(name)), {"all": [], "hit": [], "miss": []}
+        )
+        samples["all"].append(seconds)
+        cache = str(row.get("cache", "")).lower()
+        if cache in ("hit", "true", "1"):
+            samples["hit"].append(seconds)
+        elif cache in ("miss", "false", "0"):
+            samples["miss"].append(seconds)
+    return history
+
+
+def _mean(values: list[float]) -> float:
+    return sum(values) / len(values)
+
+
+def _without(graph: Graph, dropped: list[str]) -> Graph:
+    # The graph of a pipeline the dropped jobs are not part of. A need on a
+    # dropped job passes on to what that job needed, the way a job waits for
+    # the stage before an empty one.
+    def resolve(need: str) -> list[str]:
+        if need not in dropped:
+            return [need]
+        return [n for m in graph[need] for n in resolve(m)]
+
+    return {
+        name: list(dict.fromkeys(n for need in needs for n in resolve(need)))
+        for name, needs in graph.items()
+        if name not in dropped
+    }
+
+
+def estimate(
+    jobs: dict[str, Job],
+    history: dict[str, dict[str, list[float]]],
+    cache_hit_rate: float | None = None,
+    change_rate: float = 1.0,
+    default_seconds: float = DEFAULT_SECONDS,
+    ref_rate: float = 1.0,
+) -> dict:
+    # Expected seconds per job: the history mean, or for jobs with cache hit
+    # and miss samples, the mix of both at the given (else the observed) hit
+    # rate. Jobs that do not cache take the miss duration. Manual jobs are
+    # left out; path- and ref-filtered jobs count in change_rate and
+    # ref_rate of the pipelines.
+    manual = sorted(name for name, job in jobs.items() if job.manual)
+    graph = _without({name: job.needs for name, job in jobs.items()}, manual)
+    jobs = {name: job for name, job in jobs.items() if not job.manual}
+    durations: dict[str, float] = {}
+    miss_durations: dict[str, float] = {}
+    missing = []
+    for name, job in jobs.items():
+        samples = history.get(name)
+        if not samples:
+            missing.append(name)
+            durations[name] = miss_durations[name] = default_seconds
+            continue
+        seconds = _mean(samples["all"])
+        miss = _mean(samples["miss"]) if samples["miss"] else seconds
+        if job.cached and samples["hit"] and samples["miss"]:
+            rate = cache_hit_rate
+            if rate is None:
+                rate = len(samples["hit"]) / (
+                    len(samples["hit"]) + len(samples["miss"])
+                )
+            seconds = rate * _mean(samples["hit"]) + (1 - rate) * miss
+        elif not job.cached:
+            seconds = miss
+        durations[name] = seconds
+        miss_durations[name] = miss
+
+    # The longest chain when every job runs, and in the pipelines where the
+    # ref-filtered jobs are left out.
+    path = critical_path(graph, durations)
+    other_path = critical_path(
+        _without(graph, [name for name, job in jobs.items() if job.ref_filtered]),
+        durations,
+    )
+
+    def expected(seconds: dict[str, float]) -> float:
+        # Runner seconds per pipeline, on average.
+        return sum(
+            seconds[name]
+            * job.instances
+            * (change_rate if job.path_filtered else 1.0)
+            * (ref_rate if job.ref_filtered else 1.0)
+            for name, job in jobs.items()
+        )
+
+    def filtered(flag: str) -> float:
+        return sum(
+            durations[name] * job.instances
+            for name, job in jobs.items()
+            if getattr(job, flag)
+        )
+
+    runner = expected(durations)
+    return {
+        "jobs": len(jobs),
+        "critical_path": path,
+        "wall_minutes": round(sum(durations[name] for name in path) / 60, 2),
+        "other_refs_critical_path": other_path,
+        "other_refs_wall_minutes": round(
+            sum(durations[name] for name in other_path) / 60, 2
+        ),
+        "runner_minutes": round(runner / 60, 2),
+        "cache_saves_minutes": round((expected(miss_durations) - runner) / 60, 2),
+        "path_filtered_minutes": round(filtered("path_filtered") / 60, 2),
+        "ref_filtered_minutes": round(filtered("ref_filtered") / 60, 2),
+        "without_history": sorted(missing),
+        "manual": manual,
+    }
+
+
+def render_document(path: Path, config: Config) -> dict:
+    # Render chatter (blueprint loading) stays out of the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        blueprint = load_or_generate_blueprint(path, config)
+        if config.ci is None or config.env is None:
+            targets = blueprint_targets(config, blueprint)
+            if not targets:
+                raise ValueError(f"No target of {path} matches --ci/--env")
+            ci, env = targets[0]
+            config.ci, config.env = config.ci or ci, config.env or env
+        return yaml.safe_load(render_template(blueprint, config))
+
+
+def format_report(
+    label: str, result: dict, change_rate: float, ref_rate: float = 1.0
+) -> str:
+    lines = [
+        f"{label}:",
+        (
+            f"  critical path   {' -> '.join(result['critical_path'])} "
+            f"({result['wall_minutes']:.1f} min)"
+        ),
+    ]
+    if result["other_refs_critical_path"] != result["critical_path"]:
+        lines.append(
+            f"  other refs      {' -> '.join(result['other_refs_critical_path'])} "
+            f"({result['other_refs_wall_minutes']:.1f} min)"
+        )
+    lines += [
+        (
+            f"  runner minutes  {result['runner_minutes']:.1f} "
+            f"across {result['jobs']} job(s)"
+        ),
+        (
+            f"  caching saves   {result['cache_saves_minutes']:.1f} "
+            "runner min per pipeline"
+        ),
+        f"  path filters    {result['path_filtered_minutes']:.1f} "
+        "runner min skippable"
+        + (
+            f", {change_rate:.0%} of pipelines assumed to run them"
+            if change_rate < 1
+            else ""
+        ),
+    ]
+    if result["ref_filtered_minutes"]:
+        lines.append(
+            f"  ref rules       {result['ref_filtered_minutes']:.1f} "
+            "runner min on matching refs only"
+            + (
+                f", {ref_rate:.0%} of pipelines assumed to run them"
+                if ref_rate < 1
+                else ""
+            )
+        )
+    if result["manual"]:
+        lines.append(f"  manual          {', '.join(result['manual'])} (not counted)")
+    if result["without_history"]:
+        lines.append(f"  no history      {', '.join(result['without_history'])}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool estimate",
+        description="Estimate wall-clock time and runner minutes "
+        "of a generated pipeline",
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        type=Path,
+        default=Path("."),
+        help="Project directory (default: .)",
+    )
+    parser.add_argument(
+        "--history",
+        type=Path,
+        required=True,
+        help="Job durations exported from CI, as CSV or JSON",
+    )
+    parser.add_argument("--ci", help="CI platform (default: the blueprint's)")
+    parser.add_argument("--env", help="Environment (default: the blueprint's)")
+    parser.add_argument(
+        "--template", default="base", help="Template set (default: base)"
+    )
+    parser.add_argument(
+        "--compare", metavar="TEMPLATE", help="Template set to compare with"
+    )
+    parser.add_argument(
+        "--user-templates",
+        type=Path,
+        help="Template root checked before the built-in templates "
+        "(default: user_templates/)",
+    )
+    parser.add_argument(
+        "--cache-hit-rate",
+        type=float,
+        help="Share of runs with a cache hit (default: as observed in the history)",
+    )
+    parser.add_argument(
+        "--change-rate",
+        type=float,
+        default=1.0,
+        help="Share of pipelines whose changes match the path filters (default: 1)",
+    )
+    parser.add_argument(
+        "--ref-rate",
+        type=float,
+        default=1.0,
+        help="Share of pipelines on refs that match if: rules, only: or except: "
+        "(protected branches, release tags; default: 1)",
+    )
+    parser.add_argument(
+        "--default-seconds",
+        type=float,
+        default=DEFAULT_SECONDS,
+        help="Duration of jobs missing from the history "
+        f"(default: {DEFAULT_SECONDS:.0f})",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the estimates as JSON"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    try:
+        history = read_history(args.history)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Error: unable to read {args.history}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    results = {}
+    for template in filter(None, (args.template, args.compare)):
+        config = Config(
+            ci=args.ci,
+            env=args.env,
+            template=template,
+            path=args.path,
+            dry_run=True,
+            interactive=False,
+            user_templates=args.user_templates,
+        )
+        try:
+            document = render_document(args.path, config)
+            jobs = pipeline_jobs(document, config.ci)
+            results[template] = estimate(
+                jobs,
+                history,
+                args.cache_hit_rate,
+                args.change_rate,
+                args.default_seconds,
+                args.ref_rate,
+            )
+        except (ValueError, FileNotFoundError, yaml.YAMLError) as e:
+            print(f"Error: {template}: {e}", file=sys.stderr)
+            sys.exit(1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for template, result in results.items():
+        print(format_report(template, result, args.change_rate, args.ref_rate))
+    if args.compare:
+        base, other = results[args.template], results[args.compare]
+        print(
+            f"{args.compare} vs {args.template}: "
+            f"wall clock {other['wall_minutes'] - base['wall_minutes']:+.1f} min, "
+            f"runner minutes {other['runner_minutes'] - base['runner_minutes']:+.1f}"
+        )
@@ -0,0 +1,184 @@
+import copy
+import os
+from pathlib import Path
+
+from citool.config import Config
+from citool.manifest import (
+    file_hash,
+    is_up_to_date,
+    lock_inputs,
+    lock_key,
+    read_lock,
+    write_lock,
+)
+from citool.renderer import (
+    DEFAULT_TEMPLATE_ROOT,
+    USER_TEMPLATE_ROOT,
+    get_output_path,
+    stream_template,
+    template_roots,
+)
+from citool.sharding import PLAN_FILE
+from citool.util.timing import span
+from citool.util.util import stage_chunks
+
+Target = tuple[str, str]
+
+
+def select_targets(
+    platforms: list[str], envs: list[str], blueprint: dict
+) -> list[Target]:
+    # Every combination of the platforms and environments given on the
+    # command line. Without both, the blueprint's targets are used, narrowed
+    # to the platforms or environments that were given.
+    if platforms and envs:
+        return [(ci, env) for ci in platforms for env in envs]
+
+    targets = []
+    for target in blueprint.get("targets") or []:
+        if platforms and target["ci"] not in platforms:
+            continue
+        if envs and target["env"] not in envs:
+            continue
+        targets.append((target["ci"], target["env"]))
+    return targets
+
+
+def blueprint_targets(config: Config, blueprint: dict) -> list[Target]:
+    # --ci/--env or the blueprint's targets, else the platform and environment
+    # the blueprint itself names.
+    targets = select_targets(config.platforms, config.envs, blueprint)
+    if targets or "ci" not in blueprint:
+        return targets
+    ci = (
+        blueprint["ci"]["platform"]
+        if isinstance(blueprint["ci"], dict)
+        else blueprint["ci"]
+    )
+    return [(ci, blueprint["env"])]
+
+
+def target_output_path(config: Config, blueprint: dict, targets: list[Target]) -> Path:
+    for target in blueprint.get("targets") or []:
+        if (target["ci"], target["env"]) == (
+            config.ci,
+            config.env,
+        ) and "output_path" in target:
+            return config.path / target["output_path"]
+
+    output_path = get_output_path(config, blueprint)
+    if sum(1 for ci, _ in targets if ci == config.ci) > 1:
+        # Several environments for one platform would share a file.
+        stem, dot, suffix = output_path.name.rpartition(".")
+        name = (
+            f"{stem}-{config.env}.{suffix}"
+            if dot
+            else f"{output_path.name}-{config.env}"
+        )
+        output_path = output_path.with_name(name)
+    return output_path
+
+
+def plan_targets(
+    blueprint: dict, config: Config, targets: list[Target]
+) -> list[tuple[Target, Path, dict, Config]]:
+    # The blueprint, config and output path of every target.
+    planned = []
+    paths: dict[Path, Target] = {}
+    for ci, env in targets:
+        target_config = copy.copy(config)
+        target_config.ci, target_config.env = ci, env
+        target_blueprint = dict(blueprint, env=env)
+        named = blueprint.get("ci")
+        if named != ci and not (isinstance(named, dict) and named["platform"] == ci):
+            target_blueprint["ci"] = ci
+
+        output_path = target_output_path(target_config, target_blueprint, targets)
+        if output_path in paths:
+            raise ValueError(
+                f"Targets {paths[output_path]} and {(ci, env)} both write {output_path}"
+            )
+        paths[output_path] = (ci, env)
+        planned.append(((ci, env), output_path, target_blueprint, target_config))
+    return planned
+
+
+def target_inputs(blueprint: dict, config: Config, planned: list) -> dict:
+    # The lock inputs of rendering the planned targets.
+    roots = template_roots(
+        DEFAULT_TEMPLATE_ROOT, config.user_templates or USER_TEMPLATE_ROOT
+    )
+    sharding = blueprint.get("test_sharding")
+    options = {
+        "targets": [
+            [ci, env, lock_key(config.path, p)] for (ci, env), p, _, _ in planned
+        ],
+        "template": config.template,
+        "shard_plan": file_hash(config.path / sharding.get("plan_file", PLAN_FILE))
+        if sharding
+        else None,
+    }
+    return lock_inputs(blueprint, roots, options)
+
+
+def generate(blueprint: dict, config: Config, targets: list[Target]) -> dict[Path, str]:
+    # Renders and writes the targets, returning a status per output path:
+    #   up-to-date  inputs and outputs match the lock, nothing was rendered
+    #   unchanged   rendered, but the file already holds the same bytes
+    #   written     the file was (re)written
+    #   exists      the file was changed by hand; needs --force
+    #   skipped     not written because another output needs --force
+    # Files citool wrote itself (per the lock) are replaced without --force.
+    planned = plan_targets(blueprint, config, targets)
+    inputs = target_inputs(blueprint, config, planned)
+    lock = read_lock(config.path)
+    output_paths = [output_path for _, output_path, _, _ in planned]
+
+    if not config.force and is_up_to_date(lock, inputs, config.path, output_paths):
+        return {output_path: "up-to-date" for output_path in output_paths}
+
+    recorded = (lock or {}).get("outputs") or {}
+    statuses: dict[Path, str] = {}
+    staged: list[tuple[Path, Path]] = []
+    hashes = {}
+    try:
+        # Every output is streamed into a temporary file next to it and only
+        # moved into place once all of them rendered, so memory stays flat
+        # however large the pipelines are and a failure writes nothing.
+        for _, output_path, target_blueprint, target_config in planned:
+            with span("render"):
+                tmp, digest = stage_chunks(
+                    output_path, stream_template(target_blueprint, target_config)
+                )
+            key = lock_key(config.path, output_path)
+            hashes[key] = digest
+            current = file_hash(output_path)
+            if current == digest:
+                statuses[output_path] = "unchanged"
+                tmp.unlink()
+            elif (
+                current is not None
+                and current != recorded.get(key)
+                and not config.force
+            ):
+                statuses[output_path] = "exists"
+                tmp.unlink()
+            else:
+                statuses[output_path] = "written"
+                staged.append((tmp, output_path))
+
+        if "exists" in statuses.values():
+            return {p: "skipped" if s == "written" else s for p, s in statuses.items()}
+
+        with span("write"):
+            while staged:
+                tmp, output_path = staged.pop()
+                os.replace(tmp, output_path)
+    finally:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+
+    written = "written" in statuses.values()
+    if written or lock is None or lock.get("inputs") != inputs or recorded != hashes:
+        write_lock(config.path, inputs, hashes)
+    return statuses
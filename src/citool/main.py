@@ -1,33 +1,96 @@
 import argparse
-from pathlib import Path
-import sys
+import importlib
 import logging
+import os
+import sys
+from pathlib import Path
 
 from citool.config import Config
-from citool.util.schema_helper import load_enum_choices, load_examples
-from citool.blueprint import load_or_generate_blueprint
-from citool.renderer import get_output_path, render_template
+from citool.util import timing
+from citool.util.schema_helper import get_registry
+from citool.util.util import find_blueprint
+
+# Blueprint loading and rendering (yaml, jinja2, the language map) are
+# imported only once arguments are parsed, so --help and argument errors
+# stay fast.
+
+
+def ci_choices() -> list[str]:
+    return get_registry().enum_choices("ci.platform")
 
 
-SCHEMA_PATH = Path(__file__).parent / "schemas" / "blueprint.schema.json"
-CI_CHOICES = load_enum_choices(SCHEMA_PATH, "ci.platform")
-RECOMMENDED_ENVS = load_examples(SCHEMA_PATH, "env")
+def recommended_envs() -> list[str]:
+    return get_registry().examples_for("env")
+
+
+def __getattr__(name: str):
+    # CI_CHOICES and RECOMMENDED_ENVS used to be read from the schema at
+    # import; they are now loaded on first use.
+    if name == "CI_CHOICES":
+        return ci_choices()
+    if name == "RECOMMENDED_ENVS":
+        return recommended_envs()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Subcommands are dispatched on the first argument; anything else renders a
+# single project as before.
+COMMANDS = {
+    "batch": "citool.batch",
+    "validate": "citool.validator",
+    "precompile": "citool.precompile",
+    "shard": "citool.sharding",
+    "check": "citool.check",
+    "serve": "citool.serve",
+    "estimate": "citool.estimate",
+}
 
 logger = logging.getLogger("citool")
 logging.basicConfig(level=logging.INFO)
 
 
-def parse_args() -> Config:
-    parser = argparse.ArgumentParser(description="citool: CI/CD pipeline generator")
+def missing_arguments(missing: list[str]) -> None:
+    print(
+        f"Error: Missing required argument(s): {', '.join(missing)}",
+        file=sys.stderr,
+    )
+    print(f"Available CI platforms: {', '.join(ci_choices())}")
+    print(f"Recommended environments: {', '.join(recommended_envs())}")
+    sys.exit(1)
+
+
+def parse_args(argv: list[str] | None = None) -> Config:
+    parser = argparse.ArgumentParser(
+        description="citool: CI/CD pipeline generator",
+        epilog=f"Subcommands: {', '.join(COMMANDS)} (see 'citool <command> --help')",
+    )
 
     parser.add_argument(
         "path", nargs="?", type=Path, default=Path("."), help="Target project directory"
     )
     parser.add_argument(
-        "--ci", choices=CI_CHOICES, help="Target CI platform (required)"
+        "--ci",
+        help=f"Target CI platform(s), comma-separated ({', '.join(ci_choices())}; "
+        "required unless the blueprint lists targets)",
+    )
+    parser.add_argument(
+        "--env",
+        help="Deployment environment(s), comma-separated "
+        "(required unless the blueprint lists targets)",
     )
-    parser.add_argument("--env", help="Deployment environment (required)")
     parser.add_argument("--template", help="Custom template set name (e.g., team_xyz)")
+    parser.add_argument(
+        "--user-templates",
+        type=Path,
+        help="Template root checked before the built-in templates "
+        "(default: user_templates/)",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=Path,
+        help="Precompiled template bundle from 'citool precompile' "
+        "(default: the one in the cache directory, if any)",
+    )
     parser.add_argument(
         "--dry-run", action="store_true", help="Render but do not write files"
     )
@@ -35,65 +98,211 @@ def parse_args() -> Config:
         "--force", action="store_true", help="Overwrite existing output"
     )
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument(
+        "--sample",
+        action="store_true",
+        help="Stop language detection once the primary language is settled",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read or write the detection cache",
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Show which blueprint file (after 'extends') supplied each key, then exit",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print how long each phase "
+        "(detect, blueprint, template load, render, write) took",
+    )
+    parser.add_argument(
+        "--trace-file",
+        type=Path,
+        help="Write the phase timings as a Chrome trace (chrome://tracing, Perfetto)",
+    )
+
+    args = parser.parse_args(argv)
 
-    args = parser.parse_args()
+    platforms = [ci for ci in (args.ci or "").split(",") if ci]
+    envs = [env for env in (args.env or "").split(",") if env]
+    for ci in platforms:
+        if ci not in ci_choices():
+            choices = ", ".join(ci_choices())
+            parser.error(
+                f"argument --ci: invalid choice: '{ci}' (choose from {choices})"
+            )
 
     missing = []
-    if not args.ci:
+    if not platforms:
         missing.append("--ci")
-    if not args.env:
+    if not envs:
         missing.append("--env")
 
-    if missing:
-        print(
-            f"Error: Missing required argument(s): {', '.join(missing)}",
-            file=sys.stderr,
-        )
-        print(f"Available CI platforms: {', '.join(CI_CHOICES)}")
-        print(f"Recommended environments: {', '.join(RECOMMENDED_ENVS)}")
-        sys.exit(1)
+    # A blueprint with targets can stand in for either list.
+    if missing and not args.explain and find_blueprint(args.path) is None:
+        missing_arguments(missing)
 
     config = Config(
-        ci=args.ci,
-        env=args.env,
+        ci=platforms[0] if platforms else None,
+        env=envs[0] if envs else None,
+        platforms=platforms,
+        envs=envs,
         template=args.template,
+        user_templates=args.user_templates,
+        bundle=args.bundle,
         path=args.path,
         dry_run=args.dry_run,
         force=args.force,
         verbose=args.verbose,
+        sample=args.sample,
+        use_cache=not args.no_cache,
+        timings=args.timings,
+        trace_file=args.trace_file,
+        explain=args.explain,
     )
 
     if config.verbose:
         logger.setLevel(logging.DEBUG)
 
-    if config.env not in RECOMMENDED_ENVS:
-        print(f"Note: '{config.env}' is not a recommended environment.")
-        print(f"Suggested environments: {', '.join(RECOMMENDED_ENVS)}")
+    for env in config.envs:
+        if env not in recommended_envs():
+            print(f"Note: '{env}' is not a recommended environment.")
+            print(f"Suggested environments: {', '.join(recommended_envs())}")
 
     logger.debug("Parsed config: %s", vars(config))
 
     return config
 
 
-def main() -> None:
-    config = parse_args()
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        importlib.import_module(COMMANDS[argv[0]]).main(argv[1:])
+        return
+
+    config = parse_args(argv)
     logger.debug("Running citool with config: %s", vars(config))
 
-    blueprint = load_or_generate_blueprint(config.path, config)
-    output = render_template(blueprint, config)
-    output_path = get_output_path(config, blueprint)
+    recorder = timing.enable() if config.timings or config.trace_file else None
+    try:
+        run(config)
+    finally:
+        if recorder is not None:
+            timing.disable()
+            report_timings(recorder.events, config)
+
+
+def report_timings(events: list, config: Config) -> None:
+    # On stderr, so dry-run output stays clean.
+    if config.timings:
+        print(timing.format_summary(events), file=sys.stderr)
+    if config.trace_file:
+        timing.write_trace(config.trace_file, events)
+        print(f"Trace written to {config.trace_file}", file=sys.stderr)
 
-    if output_path.exists() and not config.force:
-        print(f"Pipeline already exists: {output_path}. Use --force to overwrite.")
+
+def explain(config: Config) -> None:
+    from citool.blueprint import explain_blueprint
+
+    file = find_blueprint(config.path)
+    if file is None:
+        print(f"Error: no blueprint in {config.path}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        rows = explain_blueprint(file)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
-    if config.dry_run:
-        print("--- Rendered Pipeline ---")
-        print(output)
-    else:
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(output)
-        print(f"Pipeline written to {output_path}")
+    width = max((len(key) for key, _ in rows), default=0)
+    for key, source in rows:
+        print(f"{key:<{width}}  {os.path.relpath(source)}")
+
+
+def run(config: Config) -> None:
+    if config.explain:
+        explain(config)
+        return
+
+    from citool.blueprint import load_or_generate_blueprint
+    from citool.generator import generate, plan_targets, select_targets
+    from citool.pipeline import critical_path, job_graph, pipeline_mode
+    from citool.renderer import stream_template
+
+    try:
+        blueprint = load_or_generate_blueprint(config.path, config)
+        targets = select_targets(config.platforms, config.envs, blueprint)
+        if not targets:
+            given = (("--ci", config.platforms), ("--env", config.envs))
+            missing_arguments([name for name, values in given if not values])
+        if pipeline_mode(blueprint) == "dag":
+            path = critical_path(job_graph(blueprint))
+            logger.info("Critical path: %s (%d jobs)", " -> ".join(path), len(path))
+        if config.dry_run:
+            # Opening every stream rejects missing templates and invalid
+            # pipelines before anything is printed; rendering happens as the
+            # chunks are written out.
+            planned = plan_targets(blueprint, config, targets)
+            streams = [
+                (target, output_path, stream_template(target_blueprint, target_config))
+                for target, output_path, target_blueprint, target_config in planned
+            ]
+        else:
+            statuses = generate(blueprint, config, targets)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if not config.dry_run:
+        for output_path, status in statuses.items():
+            if status == "exists":
+                print(
+                    f"Pipeline already exists: {output_path}. Use --force to overwrite."
+                )
+            elif status == "up-to-date":
+                print(f"Pipeline up to date: {output_path}")
+            elif status == "unchanged":
+                print(f"Pipeline unchanged: {output_path}")
+            elif status == "written":
+                print(f"Pipeline written to {output_path}")
+        if "exists" in statuses.values():
+            sys.exit(1)
+        return
+
+    existing = [output_path for _, output_path, _ in streams if output_path.exists()]
+    if existing and not config.force:
+        for output_path in existing:
+            print(f"Pipeline already exists: {output_path}. Use --force to overwrite.")
+        sys.exit(1)
+
+    try:
+        for (ci, env), output_path, chunks in streams:
+            if len(streams) > 1:
+                print(f"--- Rendered Pipeline ({ci}, {env}): {output_path} ---")
+            else:
+                print("--- Rendered Pipeline ---")
+            with timing.span("render"):
+                write_chunks(chunks)
+            print()
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader stopped early (`| head`). Point stdout at /dev/null so
+        # the flush at interpreter exit does not fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+
+def write_chunks(chunks) -> None:
+    # The first chunk is flushed right away so readers see output while the
+    # rest renders; after that stdout's own buffering applies.
+    for i, chunk in enumerate(chunks):
+        sys.stdout.write(chunk)
+        if i == 0:
+            sys.stdout.flush()
 
 
 if __name__ == "__main__":
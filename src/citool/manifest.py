@@ -0,0 +1,81 @@
+import functools
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from citool import __version__
+from citool.renderer import template_hashes
+from citool.util.schema_helper import SCHEMA_PATH
+from citool.util.util import atomic_write
+
+LOCK_NAME = ".citool.lock"
+LOCK_VERSION = 1
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Path) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    except OSError:
+        return None
+
+
+@functools.cache
+def schema_hash() -> str:
+    return file_hash(SCHEMA_PATH) or ""
+
+
+@functools.cache
+def templates_hash(roots: tuple[str, ...]) -> str:
+    # Every template name with the file it resolves to through the overlay,
+    # so adding, changing or shadowing any template (or macro) counts.
+    return content_hash(json.dumps([roots, template_hashes(roots)], sort_keys=True))
+
+
+def lock_inputs(blueprint: dict, roots: tuple[str, ...], extra: dict) -> dict:
+    # Everything a render depends on. The blueprint is hashed as loaded, so
+    # derived values like cache key files count too.
+    return {
+        "citool": __version__,
+        "schema": schema_hash(),
+        "templates": templates_hash(roots),
+        "blueprint": content_hash(json.dumps(blueprint, sort_keys=True, default=str)),
+        "options": content_hash(json.dumps(extra, sort_keys=True, default=str)),
+    }
+
+
+def read_lock(path: Path) -> dict | None:
+    try:
+        lock = json.loads((path / LOCK_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(lock, dict) or lock.get("version") != LOCK_VERSION:
+        return None
+    return lock
+
+
+def write_lock(path: Path, inputs: dict, outputs: dict[str, str]) -> None:
+    lock = {"version": LOCK_VERSION, "inputs": inputs, "outputs": outputs}
+    atomic_write(path / LOCK_NAME, json.dumps(lock, indent=2, sort_keys=True) + "\n")
+
+
+def lock_key(path: Path, output_path: Path) -> str:
+    return Path(os.path.relpath(output_path, path)).as_posix()
+
+
+def is_up_to_date(
+    lock: dict | None, inputs: dict, path: Path, output_paths: list[Path]
+) -> bool:
+    # Nothing to render when the inputs match and every output still holds
+    # exactly what was generated last time.
+    if lock is None or lock.get("inputs") != inputs:
+        return False
+    recorded = lock.get("outputs") or {}
+    if set(recorded) != {lock_key(path, p) for p in output_paths}:
+        return False
+    return all(file_hash(p) == recorded[lock_key(path, p)] for p in output_paths)
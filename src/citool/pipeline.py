@@ -0,0 +1,110 @@
+# Check jobs and the blueprint keys that enable them. Checks gate a
+# deployment without producing anything it uses.
+CHECK_JOBS = (
+    ("lint", "lint_commands"),
+    ("static_analysis", "static_analysis_commands"),
+    ("security_scan", "security_scan_commands"),
+)
+
+Graph = dict[str, list[str]]
+
+
+def pipeline_mode(blueprint: dict) -> str:
+    return (blueprint.get("pipeline") or {}).get("mode", "stages")
+
+
+def check_jobs(blueprint: dict) -> list[str]:
+    return [job for job, key in CHECK_JOBS if blueprint.get(key)]
+
+
+def deploy_jobs(blueprint: dict) -> list[str]:
+    jobs: list[str] = []
+    for deploy in blueprint.get("deployments") or []:
+        job = f"{deploy['method']}_deploy"
+        if job not in jobs:
+            jobs.append(job)
+    return jobs
+
+
+def job_graph(blueprint: dict) -> Graph:
+    # The jobs each job needs. In stages mode a job needs every job of the
+    # stage before it. In dag mode checks, tests and the build start right
+    # away, and deployments need the build they ship plus every check and
+    # test that gates them. pipeline.needs replaces the needs of single jobs,
+    # but a job can't need one of a later stage: GitLab rejects that pipeline.
+    checks = check_jobs(blueprint)
+    deploys = deploy_jobs(blueprint)
+    stages = (checks, ["test"], ["build"], deploys)
+    graph: Graph = {}
+    if pipeline_mode(blueprint) == "dag":
+        for job in checks + ["test", "build"]:
+            graph[job] = []
+        for job in deploys:
+            graph[job] = ["build", *checks, "test"]
+    else:
+        previous: list[str] = []
+        for stage in stages:
+            for job in stage:
+                graph[job] = list(previous)
+            previous = stage or previous
+
+    for job, needs in ((blueprint.get("pipeline") or {}).get("needs") or {}).items():
+        if job not in graph:
+            raise ValueError(f"pipeline.needs names unknown job '{job}'")
+        graph[job] = list(needs)
+
+    stage_of = {job: index for index, stage in enumerate(stages) for job in stage}
+    for job, needs in graph.items():
+        for need in needs:
+            if need not in graph:
+                raise ValueError(f"Job '{job}' needs unknown job '{need}'")
+            if stage_of[need] > stage_of[job]:
+                raise ValueError(
+                    f"Job '{job}' needs '{need}', which runs in a later stage"
+                )
+    return graph
+
+
+def topological_order(graph: Graph) -> list[str]:
+    order: list[str] = []
+    state: dict[str, int] = {}  # 1 while visiting, 2 when done
+
+    def visit(job: str, path: list[str]) -> None:
+        if state.get(job) == 2:
+            return
+        if state.get(job) == 1:
+            cycle = path[path.index(job) :] + [job]
+            raise ValueError("Pipeline jobs form a cycle: " + " -> ".join(cycle))
+        state[job] = 1
+        for need in graph[job]:
+            visit(need, path + [job])
+        state[job] = 2
+        order.append(job)
+
+    for job in graph:
+        visit(job, [])
+    return order
+
+
+def critical_path(graph: Graph, durations: dict[str, float] | None = None) -> list[str]:
+    # The longest chain of jobs, counting each job as one unit of time unless
+    # durations are given.
+    finish: dict[str, float] = {}
+    previous: dict[str, str | None] = {}
+    for job in topological_order(graph):
+        start = 0.0
+        previous[job] = None
+        for need in graph[job]:
+            if finish[need] > start:
+                start = finish[need]
+                previous[job] = need
+        finish[job] = start + (durations.get(job, 0.0) if durations else 1.0)
+
+    if not finish:
+        return []
+    job: str | None = max(finish, key=finish.get)
+    path = []
+    while job is not None:
+        path.append(job)
+        job = previous[job]
+    return path[::-1]
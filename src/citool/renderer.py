@@ -1,15 +1,161 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+import zipfile
+from collections.abc import Iterator
 from pathlib import Path
-from jinja2 import Environment, FileSystemLoader, TemplateNotFound
-from citool.config import Config
-from citool.util.schema_helper import get_output_path_for_platform
 
+from jinja2 import (
+    BaseLoader,
+    ChoiceLoader,
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    ModuleLoader,
+    PrefixLoader,
+    Template,
+    TemplateNotFound,
+)
+from jinja2.loaders import split_template_path
+
+from citool.config import Config
+from citool.pipeline import critical_path, job_graph, pipeline_mode
+from citool.sharding import load_shard_plan
+from citool.util.cache import cache_dir
+from citool.util.schema_helper import get_registry
+from citool.util.timing import span, timed
 
 DEFAULT_TEMPLATE_ROOT = Path(__file__).parent / "templates"
+USER_TEMPLATE_ROOT = Path(__file__).parents[2] / "user_templates"
+MACRO_ROOT = Path(__file__).parent / "macros"
 
+BUNDLE_NAME = "templates.zip"
+BUNDLE_MANIFEST = "citool-manifest.json"
 
-def render_template(
-    blueprint: dict, config: Config, template_root: Path = DEFAULT_TEMPLATE_ROOT
-) -> str:
+logger = logging.getLogger("citool")
+
+
+class OverlayLoader(ChoiceLoader):
+    # A ChoiceLoader over template roots, highest priority first, followed by
+    # the shared macro library as macros/. A cached template also goes stale
+    # when a file with the same name appears in a higher priority root, so
+    # every cache layer resolves a name to the same file a fresh lookup would.
+
+    def __init__(self, roots: tuple[str, ...]):
+        loaders = [FileSystemLoader(root) for root in roots]
+        loaders.append(PrefixLoader({"macros": FileSystemLoader(str(MACRO_ROOT))}))
+        super().__init__(loaders)
+        self.roots = roots
+
+    def get_source(self, environment, template):
+        pieces = split_template_path(template)
+        for i, loader in enumerate(self.loaders):
+            try:
+                source, filename, uptodate = loader.get_source(environment, template)
+            except TemplateNotFound:
+                continue
+
+            shadows = [os.path.join(root, *pieces) for root in self.roots[:i]]
+
+            def overlay_uptodate(uptodate=uptodate, shadows=shadows) -> bool:
+                if uptodate is not None and not uptodate():
+                    return False
+                return not any(os.path.exists(shadow) for shadow in shadows)
+
+            return source, filename, overlay_uptodate
+        raise TemplateNotFound(template)
+
+    # ChoiceLoader.load bypasses get_source; go through it like other loaders.
+    load = BaseLoader.load
+
+
+def template_roots(
+    template_root: Path = DEFAULT_TEMPLATE_ROOT,
+    user_template_root: Path | None = USER_TEMPLATE_ROOT,
+) -> tuple[str, ...]:
+    roots = [template_root]
+    if user_template_root is not None:
+        roots.insert(0, user_template_root)
+    return tuple(str(Path(root).resolve()) for root in roots)
+
+
+def get_environment(
+    template_root: Path = DEFAULT_TEMPLATE_ROOT,
+    user_template_root: Path | None = USER_TEMPLATE_ROOT,
+) -> Environment:
+    return _build_environment(template_roots(template_root, user_template_root))
+
+
+@functools.cache
+def _build_environment(roots: tuple[str, ...]) -> Environment:
+    # One environment per set of template roots and process, so templates are
+    # only compiled once; the bytecode cache carries compiled templates across
+    # invocations. Its entries are keyed by template file name and source hash.
+    bytecode_dir = cache_dir() / "jinja"
+    try:
+        bytecode_dir.mkdir(parents=True, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(str(bytecode_dir))
+    except OSError:
+        bytecode_cache = None
+
+    return Environment(
+        loader=OverlayLoader(roots),
+        bytecode_cache=bytecode_cache,
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+
+
+def template_hashes(roots: tuple[str, ...]) -> dict[str, str]:
+    # The source hash of the file every template name currently resolves to.
+    env = _build_environment(roots)
+    hashes = {}
+    for name in env.list_templates():
+        source, _, _ = env.loader.get_source(env, name)
+        hashes[name] = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    return hashes
+
+
+def get_bundle_environment(bundle: Path, roots: tuple[str, ...]) -> Environment | None:
+    # An environment serving precompiled template modules from a bundle
+    # written by 'citool precompile', or None when the bundle is missing or
+    # no longer matches the template sources.
+    try:
+        mtime = bundle.stat().st_mtime_ns
+    except OSError:
+        return None
+    return _load_bundle(str(bundle.resolve()), mtime, roots)
+
+
+@functools.cache
+def _load_bundle(bundle: str, mtime: int, roots: tuple[str, ...]) -> Environment | None:
+    try:
+        with zipfile.ZipFile(bundle) as archive:
+            manifest = json.loads(archive.read(BUNDLE_MANIFEST))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+        logger.debug("Ignoring template bundle %s: %s", bundle, e)
+        return None
+
+    if (
+        manifest.get("cache_tag") != sys.implementation.cache_tag
+        or manifest.get("roots") != list(roots)
+        or manifest.get("templates") != template_hashes(roots)
+    ):
+        logger.debug("Template bundle %s is stale, using template sources", bundle)
+        return None
+
+    return Environment(
+        loader=ModuleLoader(bundle), trim_blocks=True, lstrip_blocks=True
+    )
+
+
+def _prepare(
+    blueprint: dict, config: Config, template_root: Path
+) -> tuple[Template, dict]:
+    # The template for a blueprint and config, and its extra context.
     ci = config.ci
     env_name = config.env
     template_set = config.template or "base"
@@ -17,27 +163,54 @@ def render_template(
 
     relative_path = Path(ci) / template_set / f"{language}-{env_name}.yml.j2"
 
-    jinja_env = Environment(
-        loader=FileSystemLoader(template_root), trim_blocks=True, lstrip_blocks=True
-    )
+    with span("template_load"):
+        roots = template_roots(
+            template_root, config.user_templates or USER_TEMPLATE_ROOT
+        )
+        jinja_env = get_bundle_environment(
+            config.bundle or cache_dir() / BUNDLE_NAME, roots
+        )
+        if jinja_env is None:
+            jinja_env = _build_environment(roots)
 
-    try:
-        template = jinja_env.get_template(str(relative_path))
-    except TemplateNotFound as e:
-        raise FileNotFoundError(f"Template missing in Jinja: {e.name}")
+        try:
+            template = jinja_env.get_template(relative_path.as_posix())
+        except TemplateNotFound as e:
+            raise FileNotFoundError(f"Template missing in Jinja: {e.name}") from e
 
-    return template.render(blueprint)
+    # Rejects unknown jobs and cycles before anything is rendered.
+    job_needs = job_graph(blueprint)
+    path = critical_path(job_needs)
+    if pipeline_mode(blueprint) == "dag":
+        logger.debug("Critical path: %s (%d jobs)", " -> ".join(path), len(path))
+
+    test_shards = load_shard_plan(config.path, blueprint)
+
+    return template, dict(blueprint, job_needs=job_needs, test_shards=test_shards)
+
+
+@timed("render")
+def render_template(
+    blueprint: dict, config: Config, template_root: Path = DEFAULT_TEMPLATE_ROOT
+) -> str:
+    template, context = _prepare(blueprint, config, template_root)
+    return template.render(context)
+
+
+def stream_template(
+    blueprint: dict, config: Config, template_root: Path = DEFAULT_TEMPLATE_ROOT
+) -> Iterator[str]:
+    # The same output as render_template, chunk by chunk as Jinja produces
+    # it, so it never has to be held in memory at once. Missing templates and
+    # invalid pipelines raise here, before the first chunk.
+    template, context = _prepare(blueprint, config, template_root)
+    return template.generate(context)
 
 
 def get_output_path(config: Config, blueprint: dict) -> Path:
-    if isinstance(blueprint["ci"], dict) and "output_path" in blueprint["ci"]:
-        return config.path / blueprint["ci"]["output_path"]
-
-    schema_path = Path(__file__).parent / "schemas" / "blueprint.schema.json"
-    platform = (
-        blueprint["ci"]["platform"]
-        if isinstance(blueprint["ci"], dict)
-        else blueprint["ci"]
-    )
-    output_path = get_output_path_for_platform(schema_path, platform)
-    return config.path / output_path
+    ci = blueprint["ci"]
+    platform = config.ci or (ci["platform"] if isinstance(ci, dict) else ci)
+    if isinstance(ci, dict) and ci["platform"] == platform and "output_path" in ci:
+        return config.path / ci["output_path"]
+
+    return config.path / get_registry().output_path(platform)
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+from jinja2 import TemplateError
+
+from citool import manifest
+from citool.blueprint import load_or_generate_blueprint
+from citool.config import Config
+from citool.generator import generate
+from citool.renderer import (
+    DEFAULT_TEMPLATE_ROOT,
+    MACRO_ROOT,
+    USER_TEMPLATE_ROOT,
+    _build_environment,
+    _load_bundle,
+    get_output_path,
+    render_template,
+    template_roots,
+)
+from citool.util import langmap
+from citool.util.cache import cache_dir
+from citool.util.schema_helper import SCHEMA_PATH, _load_registry
+from citool.validator import get_validator
+
+logger = logging.getLogger("citool")
+
+SOCKET_NAME = "citool.sock"
+
+# Request fields and the types they must have; path, ci and env are required.
+REQUEST_FIELDS = {
+    "path": str,
+    "ci": str,
+    "env": str,
+    "template": str,
+    "dry_run": bool,
+    "force": bool,
+}
+
+
+def file_state(files: list[Path]) -> tuple:
+    # (name, mtime, size) of each file that exists.
+    state = []
+    for file in files:
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        state.append((str(file), stat.st_mtime_ns, stat.st_size))
+    return tuple(state)
+
+
+class WatchedFiles:
+    # The files under some paths, to notice an edit, a new file or a removed
+    # one. Adding, removing or renaming an entry changes its directory's
+    # mtime, so the tree is only listed again when a directory changed; any
+    # other check is one stat per file.
+
+    def __init__(self, paths: list[Path]):
+        self.paths = paths
+        self.scan()
+        self.state = file_state(self.files)
+
+    def scan(self) -> None:
+        # The paths themselves count as directories, so one that is created
+        # or replaced later is noticed too.
+        self.dirs = list(self.paths)
+        self.files = []
+        for path in self.paths:
+            if not path.is_dir():
+                self.files.append(path)
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                self.dirs.extend(Path(root, name) for name in dirs)
+                self.files.extend(Path(root, name) for name in sorted(files))
+        self.dir_state = file_state(self.dirs)
+
+    def changed(self) -> bool:
+        if file_state(self.dirs) != self.dir_state:
+            self.scan()
+        state = file_state(self.files)
+        if state == self.state:
+            return False
+        self.state = state
+        return True
+
+
+class RenderServer:
+    # Keeps the schema, the extension map and the compiled templates of one
+    # set of template roots in memory between requests. Sources are checked
+    # before every request and only the caches of changed ones are dropped.
+
+    def __init__(self, user_templates: Path | None = None, bundle: Path | None = None):
+        self.user_templates = user_templates
+        self.bundle = bundle
+        self.roots = template_roots(
+            DEFAULT_TEMPLATE_ROOT, user_templates or USER_TEMPLATE_ROOT
+        )
+        self.watched = {
+            "schema": WatchedFiles([SCHEMA_PATH]),
+            "languages": WatchedFiles([langmap.LANGUAGES_PATH]),
+            "templates": WatchedFiles(
+                [Path(root) for root in self.roots] + [MACRO_ROOT]
+            ),
+        }
+        # Requests run one at a time on a worker thread, so the event loop
+        # keeps accepting connections meanwhile. One thread, because
+        # redirect_stdout and the caches are process-global.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def warm(self) -> int:
+        # Pays every one-off cost up front; returns the number of templates.
+        get_validator()
+        langmap.get_extension_map()
+        env = _build_environment(self.roots)
+        names = env.list_templates()
+        for name in names:
+            env.get_template(name)
+        return len(names)
+
+    def reload_changed(self) -> list[str]:
+        changed = [name for name, files in self.watched.items() if files.changed()]
+
+        if "schema" in changed:
+            _load_registry.cache_clear()
+            get_validator.cache_clear()
+            manifest.schema_hash.cache_clear()
+        if "languages" in changed:
+            langmap.get_languages.cache_clear()
+        if "templates" in changed:
+            # Jinja notices edited sources itself; the bundle freshness check
+            # and the template hashes are memoized per process.
+            _load_bundle.cache_clear()
+            manifest.templates_hash.cache_clear()
+        for name in changed:
+            logger.info("Reloaded %s", name)
+        return changed
+
+    def handle(self, request: dict) -> dict:
+        start = time.perf_counter()
+        try:
+            if not isinstance(request, dict):
+                raise TypeError("Request must be a JSON object")
+            for field in ("path", "ci", "env"):
+                if field not in request:
+                    raise ValueError(f"Missing required field '{field}'")
+            for field, value in request.items():
+                if field not in REQUEST_FIELDS:
+                    raise ValueError(f"Unknown field '{field}'")
+                if not isinstance(value, REQUEST_FIELDS[field]):
+                    raise TypeError(
+                        f"Field '{field}' must be a {REQUEST_FIELDS[field].__name__}"
+                    )
+
+            self.reload_changed()
+            config = Config(
+                ci=request["ci"],
+                env=request["env"],
+                template=request.get("template"),
+                path=Path(request["path"]),
+                dry_run=request.get("dry_run", False),
+                force=request.get("force", False),
+                interactive=False,
+                user_templates=self.user_templates,
+                bundle=self.bundle,
+            )
+            if not config.path.is_dir():
+                raise FileNotFoundError(f"{config.path} is not a directory")
+
+            messages = io.StringIO()
+            with contextlib.redirect_stdout(messages):
+                blueprint = load_or_generate_blueprint(config.path, config)
+                if config.dry_run:
+                    response = {
+                        "ok": True,
+                        "status": "rendered",
+                        "output_path": str(get_output_path(config, blueprint)),
+                        "output": render_template(blueprint, config),
+                    }
+                else:
+                    [(output_path, status)] = generate(
+                        blueprint, config, [(config.ci, config.env)]
+                    ).items()
+                    response = {
+                        "ok": True,
+                        "status": status,
+                        "output_path": str(output_path),
+                    }
+            response["messages"] = messages.getvalue().splitlines()
+        except (OSError, ValueError, TypeError, yaml.YAMLError, TemplateError) as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+        response["seconds"] = round(time.perf_counter() - start, 6)
+        return response
+
+    async def on_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        # One JSON request per line, answered by one JSON response per line,
+        # until the client closes the connection.
+        try:
+            while line := await reader.readline():
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {"ok": False, "error": f"Invalid JSON: {e}"}
+                else:
+                    response = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, self.handle, request
+                    )
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, ValueError) as e:
+            logger.debug("Dropping connection: %s", e)
+        finally:
+            writer.close()
+
+
+async def start_server(
+    socket_path: Path, server: RenderServer
+) -> asyncio.AbstractServer:
+    if socket_path.exists():
+        # Left behind by a server that did not shut down cleanly.
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(str(socket_path))
+            except OSError:
+                socket_path.unlink()
+            else:
+                raise OSError(f"A server is already listening on {socket_path}")
+
+    socket_path.parent.mkdir(parents=True, exist_ok=True)
+    unix_server = await asyncio.start_unix_server(
+        server.on_connection, path=str(socket_path)
+    )
+    os.chmod(socket_path, 0o600)
+    return unix_server
+
+
+async def serve(socket_path: Path, server: RenderServer) -> None:
+    unix_server = await start_server(socket_path, server)
+    print(f"Serving on {socket_path}", flush=True)
+    try:
+        async with unix_server:
+            await unix_server.serve_forever()
+    finally:
+        socket_path.unlink(missing_ok=True)
+        server.executor.shutdown()
+
+
+def send_request(socket_path: Path, request: dict) -> dict:
+    # A minimal client, for scripts and tests.
+    with socket.socket(socket.AF_UNIX) as client:
+        client.connect(str(socket_path))
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile("rb") as responses:
+            return json.loads(responses.readline())
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool serve",
+        description="Render pipelines for JSON requests on a Unix socket",
+    )
+    parser.add_argument(
+        "--socket",
+        type=Path,
+        help=f"Socket path (default: {SOCKET_NAME} in the cache directory)",
+    )
+    parser.add_argument(
+        "--user-templates",
+        type=Path,
+        help="Template root checked before the built-in templates "
+        "(default: user_templates/)",
+    )
+    parser.add_argument(
+        "--bundle",
+        type=Path,
+        help="Precompiled template bundle from 'citool precompile' "
+        "(default: the one in the cache directory, if any)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    socket_path = args.socket or cache_dir() / SOCKET_NAME
+
+    server = RenderServer(args.user_templates, args.bundle)
+    count = server.warm()
+    logger.info("Loaded schema, extension map and %d templates", count)
+
+    try:
+        asyncio.run(serve(socket_path, server))
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
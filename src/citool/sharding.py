@@ -0,0 +1,193 @@
+import argparse
+import heapq
+import json
+import logging
+import math
+import sys
+from collections import defaultdict
+from collections.abc import Iterable
+from pathlib import Path
+from xml.etree import ElementTree
+
+from citool.blueprint import resolve_blueprint
+from citool.util.util import atomic_write, find_blueprint
+
+logger = logging.getLogger("citool")
+
+PLAN_FILE = ".citool-shards.json"
+PLAN_VERSION = 1
+
+
+def report_files(paths: Iterable[Path]) -> list[Path]:
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.rglob("*.xml")))
+        else:
+            files.append(path)
+    return files
+
+
+def _test_file(
+    testcase: ElementTree.Element, root: Path, resolved: dict[str, str]
+) -> str:
+    # Reports from pytest with junit_family=xunit1 (and most other tools)
+    # name the file; otherwise map a dotted class name back to a .py file
+    # under the project, or keep the class name for runners that take those.
+    file = testcase.get("file")
+    if file:
+        return file
+    classname = testcase.get("classname") or testcase.get("name") or ""
+    if classname not in resolved:
+        resolved[classname] = classname
+        parts = classname.split(".")
+        for n in range(len(parts), 0, -1):
+            candidate = "/".join(parts[:n]) + ".py"
+            if (root / candidate).is_file():
+                resolved[classname] = candidate
+                break
+    return resolved[classname]
+
+
+def read_durations(reports: Iterable[Path], root: Path = Path(".")) -> dict[str, float]:
+    # Seconds per test file, averaged over the reports that ran the file.
+    # Reports are parsed incrementally and every element is dropped once it
+    # has been seen, so memory stays flat however large the reports are.
+    totals: dict[str, float] = defaultdict(float)
+    runs: dict[str, int] = defaultdict(int)
+    resolved: dict[str, str] = {}
+
+    for report in reports:
+        durations: dict[str, float] = defaultdict(float)
+        stack: list[ElementTree.Element] = []
+        try:
+            for event, elem in ElementTree.iterparse(report, events=("start", "end")):
+                if event == "start":
+                    stack.append(elem)
+                    continue
+                stack.pop()
+                if elem.tag == "testcase":
+                    file = _test_file(elem, root, resolved)
+                    durations[file] += float(elem.get("time") or 0)
+                if stack:
+                    stack[-1].remove(elem)
+        except (ElementTree.ParseError, ValueError) as e:
+            raise ValueError(f"Unable to read JUnit report {report}: {e}") from e
+
+        for file, seconds in durations.items():
+            totals[file] += seconds
+            runs[file] += 1
+
+    return {file: totals[file] / runs[file] for file in totals}
+
+
+def balance(durations: dict[str, float], shards: int) -> list[dict]:
+    # Longest processing time first: hand each file, slowest first, to the
+    # shard with the least work so far. Ties go by name to keep plans stable.
+    bins = [(0.0, i) for i in range(shards)]
+    files: list[list[str]] = [[] for _ in range(shards)]
+    seconds = [0.0] * shards
+    for file in sorted(durations, key=lambda f: (-durations[f], f)):
+        load, i = heapq.heappop(bins)
+        files[i].append(file)
+        seconds[i] = load + durations[file]
+        heapq.heappush(bins, (seconds[i], i))
+    return [
+        {"files": sorted(files[i]), "seconds": round(seconds[i], 3)}
+        for i in range(shards)
+        if files[i]
+    ]
+
+
+def shard_count(
+    durations: dict[str, float], shards: int | None, target: float | None
+) -> int:
+    if shards is None:
+        shards = math.ceil(sum(durations.values()) / target) if target else 1
+    return max(1, min(shards, len(durations)))
+
+
+def write_plan(file: Path, plan: list[dict]) -> None:
+    atomic_write(
+        file, json.dumps({"version": PLAN_VERSION, "shards": plan}, indent=2) + "\n"
+    )
+
+
+def load_shard_plan(path: Path, blueprint: dict) -> list[list[str]] | None:
+    # The file lists of the shards planned for a blueprint with test_sharding.
+    sharding = blueprint.get("test_sharding")
+    if not sharding:
+        return None
+    file = path / sharding.get("plan_file", PLAN_FILE)
+    try:
+        data = json.loads(file.read_text())
+    except (OSError, ValueError):
+        logger.warning(
+            "No shard plan at %s (run 'citool shard'), rendering a single test job.",
+            file,
+        )
+        return None
+    if data.get("version") != PLAN_VERSION:
+        raise ValueError(f"Unsupported shard plan version in {file}")
+    return [shard["files"] for shard in data["shards"]]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool shard",
+        description="Split test files into shards balanced by JUnit durations",
+    )
+    parser.add_argument(
+        "reports", nargs="+", type=Path, help="JUnit XML reports or directories of them"
+    )
+    parser.add_argument(
+        "--path", type=Path, default=Path("."), help="Project directory (default: .)"
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--shards", type=int, help="Number of shards")
+    group.add_argument(
+        "--target-seconds", type=float, help="Wall-clock time to aim for per shard"
+    )
+    parser.add_argument(
+        "--discover",
+        metavar="GLOB",
+        help="Also plan test files matching GLOB that have no recorded duration",
+    )
+    parser.add_argument(
+        "-o", "--output", type=Path, help=f"Plan file (default: <path>/{PLAN_FILE})"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    sharding: dict = {}
+    file = find_blueprint(args.path)
+    if file is not None:
+        sharding = resolve_blueprint(file).get("test_sharding") or {}
+    shards = args.shards or (None if args.target_seconds else sharding.get("shards"))
+    target = args.target_seconds or sharding.get("target_seconds")
+    output = args.output or args.path / sharding.get("plan_file", PLAN_FILE)
+
+    try:
+        durations = read_durations(report_files(args.reports), args.path)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.discover:
+        known = sum(durations.values()) / len(durations) if durations else 1.0
+        for test in sorted(args.path.glob(args.discover)):
+            durations.setdefault(test.relative_to(args.path).as_posix(), known)
+
+    if not durations:
+        print("Error: no test cases found in the reports", file=sys.stderr)
+        sys.exit(1)
+
+    plan = balance(durations, shard_count(durations, shards, target))
+    write_plan(output, plan)
+
+    for i, shard in enumerate(plan, 1):
+        print(f"Shard {i}: {len(shard['files'])} file(s), {shard['seconds']:.1f}s")
+    print(f"Shard plan written to {output}")
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from collections import deque
+from pathlib import Path
+
+from citool.util.gitindex import find_git_dir
+from citool.util.walk import PRUNED_DIRS
+
+logger = logging.getLogger("citool")
+
+CACHE_VERSION = 5
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+# Eviction lists the whole cache directory, so it only runs on every
+# EVICT_EVERY-th write of a process (and on the first one).
+EVICT_EVERY = 64
+_writes = 0
+
+
+def cache_dir() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "citool"
+
+
+def _common_dir(git_dir: Path) -> Path:
+    # Worktrees keep shared refs and objects in the main git dir.
+    try:
+        return (git_dir / (git_dir / "commondir").read_text().strip()).resolve()
+    except OSError:
+        return git_dir
+
+
+def _read_ref(git_dir: Path, ref: str) -> str | None:
+    common = _common_dir(git_dir)
+    for base in (git_dir, common):
+        try:
+            return (base / ref).read_text().strip()
+        except OSError:
+            continue
+
+    try:
+        with open(common / "packed-refs") as f:
+            for line in f:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+def head_state(git_dir: Path) -> str | None:
+    # The tree id of HEAD when the commit is a loose object, otherwise the
+    # commit id itself (packed objects are not worth decoding for a key).
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+    except OSError:
+        return None
+
+    commit = _read_ref(git_dir, head[5:].strip()) if head.startswith("ref:") else head
+    if not commit:
+        return None
+
+    try:
+        raw = (_common_dir(git_dir) / "objects" / commit[:2] / commit[2:]).read_bytes()
+        body = zlib.decompress(raw).split(b"\0", 1)[1]
+        if body.startswith(b"tree "):
+            return "tree:" + body[5:45].decode()
+    except (OSError, zlib.error, IndexError, UnicodeDecodeError):
+        pass
+    return "commit:" + commit
+
+
+def directory_fingerprint(path: Path) -> str:
+    # Directory mtimes change whenever an entry is added, removed or renamed
+    # below them, which is what detection cares about. Pruned trees are skipped.
+    digest = hashlib.sha1()
+    queue = deque([path])
+    while queue:
+        directory = queue.popleft()
+        try:
+            digest.update(f"{directory}:{directory.stat().st_mtime_ns}\n".encode())
+            with os.scandir(directory) as scanner:
+                for entry in scanner:
+                    if entry.name not in PRUNED_DIRS and entry.is_dir(
+                        follow_symlinks=False
+                    ):
+                        queue.append(Path(entry.path))
+        except OSError:
+            continue
+    return digest.hexdigest()
+
+
+def repository_state(path: Path) -> str:
+    found = find_git_dir(path)
+    if found is not None:
+        _, git_dir = found
+        state = head_state(git_dir)
+        if state is not None:
+            # Detection reads the index, and untracked files at the project
+            # root change the root directory's mtime.
+            try:
+                index = (git_dir / "index").stat()
+                index_state = f"{index.st_mtime_ns}:{index.st_size}"
+            except OSError:
+                index_state = "none"
+            return f"git:{state}:{index_state}:{path.stat().st_mtime_ns}"
+
+    return "mtime:" + directory_fingerprint(path)
+
+
+class DetectionCache:
+    def __init__(
+        self, directory: Path | None = None, max_bytes: int = DEFAULT_MAX_BYTES
+    ):
+        self.directory = (directory or cache_dir()) / "detect"
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, project: Path) -> Path:
+        name = hashlib.sha256(str(project.resolve()).encode()).hexdigest()[:32]
+        return self.directory / f"{name}.json"
+
+    def get(self, project: Path, key: str) -> dict | None:
+        file = self._entry_path(project)
+        try:
+            with open(file, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("version") != CACHE_VERSION or entry.get("key") != key:
+            return None
+
+        # The file mtime doubles as the last-used time for LRU eviction.
+        try:
+            os.utime(file)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, project: Path, key: str, result: dict | None) -> None:
+        global _writes
+        entry = {
+            "version": CACHE_VERSION,
+            "path": str(project.resolve()),
+            "key": key,
+            "result": result,
+        }
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._entry_path(project))
+        except OSError as e:
+            logger.debug("Could not write detection cache: %s", e)
+            return
+
+        if _writes % EVICT_EVERY == 0:
+            self.evict()
+        _writes += 1
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        try:
+            with os.scandir(self.directory) as scanner:
+                for entry in scanner:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                        total += stat.st_size
+        except OSError:
+            return
+
+        entries.sort()
+        for _, size, file in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(file)
+            except OSError:
+                continue
+            total -= size
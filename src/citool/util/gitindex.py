@@ -0,0 +1,118 @@
+import logging
+import struct
+from pathlib import Path
+
+logger = logging.getLogger("citool")
+
+SUPPORTED_VERSIONS = (2, 3, 4)
+
+# Every entry starts with 62 fixed bytes: ctime, mtime, dev, ino, mode, uid,
+# gid, size, object id and flags. Only mode, size and flags are unpacked.
+ENTRY_HEADER_SIZE = 62
+ENTRY_FIELDS = struct.Struct(">24xI8xI20xH")
+
+FLAG_EXTENDED = 0x4000
+NAME_MASK = 0x0FFF
+MODE_TYPE_MASK = 0o170000
+MODE_REGULAR = 0o100000
+
+
+def find_git_dir(path: Path) -> tuple[Path, Path] | None:
+    # Returns (worktree root, git dir) for the checkout containing path.
+    # A '.git' file is how worktrees and submodules point at their git dir.
+    path = path.resolve()
+    for root in (path, *path.parents):
+        dotgit = root / ".git"
+        if dotgit.is_dir():
+            return root, dotgit
+        if dotgit.is_file():
+            content = dotgit.read_text(errors="replace").strip()
+            if content.startswith("gitdir:"):
+                return root, (root / content[len("gitdir:") :].strip()).resolve()
+            return None
+    return None
+
+
+def _read_offset_varint(data: bytes, pos: int) -> tuple[int, int]:
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def parse_index(data: bytes) -> list[tuple[str, int]]:
+    # Returns (path, size) for every regular file in the index. Raises
+    # ValueError for data that is not an index this parser understands.
+    if len(data) < 12 or data[:4] != b"DIRC":
+        raise ValueError("Not a git index file")
+
+    version, count = struct.unpack_from(">II", data, 4)
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported git index version: {version}")
+
+    entries: list[tuple[str, int]] = []
+    offset = 12
+    previous = b""
+    try:
+        for _ in range(count):
+            mode, size, flags = ENTRY_FIELDS.unpack_from(data, offset)
+            pos = offset + ENTRY_HEADER_SIZE
+            if flags & FLAG_EXTENDED:
+                pos += 2
+
+            if version == 4:
+                # Names are prefix-compressed against the previous entry.
+                strip, pos = _read_offset_varint(data, pos)
+                end = data.index(b"\0", pos)
+                name = previous[: len(previous) - strip] + data[pos:end]
+                previous = name
+                offset = end + 1
+            else:
+                length = flags & NAME_MASK
+                end = data.index(b"\0", pos) if length == NAME_MASK else pos + length
+                name = data[pos:end]
+                # Entries are NUL-padded to a multiple of eight bytes.
+                offset += (end - offset + 8) & ~7
+
+            # Skip gitlinks, symlinks, sparse directories and conflict stages
+            # other than "ours".
+            stage = (flags >> 12) & 0x3
+            if (mode & MODE_TYPE_MASK) == MODE_REGULAR and stage in (0, 2):
+                entries.append((name.decode("utf-8", "surrogateescape"), size))
+    except (struct.error, ValueError, IndexError) as e:
+        raise ValueError(f"Corrupt git index: {e}") from e
+
+    return entries
+
+
+def read_tracked_files(path: Path) -> list[tuple[str, int]] | None:
+    # Returns (path relative to 'path', size) for the tracked files below
+    # path, or None when path is not in a checkout with a readable index.
+    found = find_git_dir(path)
+    if found is None:
+        return None
+    root, git_dir = found
+
+    try:
+        data = (git_dir / "index").read_bytes()
+    except OSError:
+        return None
+
+    try:
+        entries = parse_index(data)
+    except ValueError as e:
+        logger.debug("Ignoring git index in %s: %s", git_dir, e)
+        return None
+
+    prefix = path.resolve().relative_to(root).as_posix()
+    if prefix == ".":
+        return entries
+
+    prefix += "/"
+    return [
+        (name[len(prefix) :], size) for name, size in entries if name.startswith(prefix)
+    ]
@@ -1,94 +1,482 @@
+import functools
+import hashlib
+import logging
+import marshal
+import math
 import os
-import subprocess
-import yaml
-
+import tempfile
+from collections.abc import Callable, Iterable, Iterator
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List
+from typing import Any
+
+from citool.util.cache import cache_dir
+from citool.util.gitindex import read_tracked_files
+from citool.util.sniff import HEURISTICS, sniff_files
+from citool.util.timing import timed
+from citool.util.walk import IgnoreRules, WalkStats, walk_files
+
+logger = logging.getLogger("citool")
+
+LANGUAGES_PATH = Path(__file__).parents[1] / "vendor" / "languages.yml"
+COMPILED_MAP_NAME = "extension-map.marshal"
+COMPILED_MAP_VERSION = 2
+
+COUNTED_TYPES = ("programming", "markup")
+
+# Sampling stops once the lead of the top language over the runner-up is
+# this many standard errors, after at least SAMPLE_MIN_FILES files.
+SAMPLE_Z = 3.0
+SAMPLE_MIN_FILES = 500
+SAMPLE_CHECK_EVERY = 250
+
+# Past this many files of one extension, their bytes are summed from the
+# sizes of this many spread over the tree and scaled up to all of them. The
+# git index has every size for free; a walk has to stat each file it sizes,
+# which is what makes it slower than listing.
+SIZE_SAMPLE = 1000
+
 
+def load_extension_map(path: Path = LANGUAGES_PATH) -> tuple[dict[str, str], frozenset]:
+    # Every extension to its language, the last one listed winning, and the
+    # languages that count. Like Linguist's language statistics, only
+    # programming and markup count; data and prose (JSON, YAML, Markdown,
+    # ...) are recognized but never decide what a project is written in.
+    import yaml
 
-def load_extension_map() -> Dict[str, str]:
-    path = Path(__file__).parents[1] / "vendor" / "languages.yml"
-    with open(path, encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path, "rb") as f:
+        data = yaml.load(f, Loader=loader)
 
-    mapping: Dict[str, str] = {}
+    mapping: dict[str, str] = {}
+    counted = set()
     for lang, meta in data.items():
+        if meta.get("type") in COUNTED_TYPES:
+            counted.add(lang)
         for ext in meta.get("extensions", []):
             mapping[ext.lstrip(".")] = lang
-    return mapping
+    return mapping, frozenset(counted)
 
 
-EXTENSION_MAP: Dict[str, str] = load_extension_map()
+def load_compiled_extension_map(
+    source: Path = LANGUAGES_PATH, compiled: Path | None = None
+) -> tuple[dict[str, str], frozenset]:
+    # Serves the map from a marshal file next to the other caches. It is
+    # trusted while the source's mtime and size match, revalidated by content
+    # hash when they don't (fresh checkouts touch every mtime), and rebuilt
+    # from the YAML otherwise.
+    compiled = compiled or cache_dir() / COMPILED_MAP_NAME
+    stat = source.stat()
+    digest = None
 
+    try:
+        with open(compiled, "rb") as f:
+            header, languages = marshal.load(f)
+        if header["version"] == COMPILED_MAP_VERSION:
+            if (header["mtime_ns"], header["size"]) == (stat.st_mtime_ns, stat.st_size):
+                return languages
+            digest = hashlib.sha256(source.read_bytes()).hexdigest()
+            if header["sha256"] == digest:
+                _write_compiled_map(compiled, stat, digest, languages)
+                return languages
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    logger.debug("Compiling extension map from %s", source)
+    languages = load_extension_map(source)
+    if digest is None:
+        digest = hashlib.sha256(source.read_bytes()).hexdigest()
+    _write_compiled_map(compiled, stat, digest, languages)
+    return languages
 
-def has_linguist() -> bool:
-    # NOTE: This approach assumes the 'linguist' gem is globally available,
-    # but GitHub's official gem is not published to RubyGems by design.
-    # It must be used via Bundler from the GitHub repository.
-    #
-    # I kinda forgot about that when writing this, so this isn’t tested
-    # and probably won’t work out of the box. I left it here to show the initial idea.
-    return False
 
+def _write_compiled_map(
+    compiled: Path,
+    stat: os.stat_result,
+    digest: str,
+    languages: tuple[dict[str, str], frozenset],
+) -> None:
+    header = {
+        "version": COMPILED_MAP_VERSION,
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": digest,
+    }
     try:
-        subprocess.run(
-            ["ruby", "-e", "require 'linguist'; puts Linguist::VERSION"],
-            capture_output=True,
-            check=True,
+        compiled.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=compiled.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            marshal.dump((header, languages), f)
+        os.replace(tmp, compiled)
+    except OSError as e:
+        logger.debug("Could not write compiled extension map: %s", e)
+
+
+@functools.cache
+def get_languages() -> tuple[dict[str, str], frozenset]:
+    return load_compiled_extension_map()
+
+
+def get_extension_map() -> dict[str, str]:
+    return get_languages()[0]
+
+
+def get_counted_languages() -> frozenset:
+    return get_languages()[1]
+
+
+def __getattr__(name: str):
+    # EXTENSION_MAP used to be built at import; it is now loaded on first use.
+    if name == "EXTENSION_MAP":
+        return get_extension_map()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+SPECIAL_FILES = {
+    "Makefile": "C",
+    "pom.xml": "Java",
+    "build.gradle": "Java",
+    "setup.py": "Python",
+    "pyproject.toml": "Python",
+}
+
+
+def classify_file(name: str, mapping: dict[str, str]) -> str | None:
+    if name in SPECIAL_FILES:
+        return SPECIAL_FILES[name]
+    # Same as os.path.splitext for file names, without its per-call overhead.
+    dot = name.rfind(".")
+    if dot <= 0:
+        return None
+    return mapping.get(name[dot + 1 :].lower())
+
+
+class LanguageHistogram:
+    def __init__(self, counted: frozenset | None = None):
+        # Languages outside counted, when given, are not added.
+        self.counted = counted
+        self.bytes: dict[str, int] = {}
+        self.squares: dict[str, int] = {}
+        self.files = 0
+        self.total = 0
+        self.total_squares = 0
+
+    def counts(self, language: str | None) -> bool:
+        return bool(language) and (self.counted is None or language in self.counted)
+
+    def add(self, language: str, size: int) -> None:
+        self.add_sizes(language, [size])
+
+    def add_sizes(self, language: str, sizes: list[int], scale: float = 1.0) -> None:
+        # Sizes of files of one language; with a scale, those of a sample
+        # that stands for scale times as many files.
+        size = round(sum(sizes) * scale)
+        squares = round(sum(s * s for s in sizes) * scale)
+        self.bytes[language] = self.bytes.get(language, 0) + size
+        self.squares[language] = self.squares.get(language, 0) + squares
+        self.files += round(len(sizes) * scale)
+        self.total += size
+        self.total_squares += squares
+
+    def ranked(self) -> list[str]:
+        return sorted(self.bytes, key=lambda lang: (-self.bytes[lang], lang))
+
+    def as_dict(self) -> dict[str, int]:
+        return {lang: self.bytes[lang] for lang in self.ranked()}
+
+    def settled(self, z: float = SAMPLE_Z, min_files: int = SAMPLE_MIN_FILES) -> bool:
+        # Treats the files seen so far as a sample and estimates the
+        # byte-share lead d of the top language over the runner-up with a
+        # ratio estimator; its standard error is sqrt(sum(z_f^2)) / total
+        # where z_f = size_f * (I_top - I_second - d).
+        if self.files < min_files or not self.total:
+            return False
+        ranked = self.ranked()
+        if len(ranked) == 1:
+            return True
+
+        first, second = ranked[0], ranked[1]
+        lead = (self.bytes[first] - self.bytes[second]) / self.total
+        sq_first, sq_second = self.squares[first], self.squares[second]
+        residual = (
+            sq_first * (1 - lead) ** 2
+            + sq_second * (1 + lead) ** 2
+            + (self.total_squares - sq_first - sq_second) * lead**2
         )
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        return False
+        return lead > z * math.sqrt(residual) / self.total
 
 
-def detect_with_linguist(path: Path) -> List[str]:
-    # NOTE: See above
-    return []
-    try:
-        result = subprocess.run(
-            [
-                "ruby",
-                "-r",
-                "linguist",
-                "-e",
-                f'puts Linguist::Repository.new("{path.resolve()}").languages.keys',
-            ],
-            capture_output=True,
-            text=True,
-            check=True,
+def spread_order(items: list) -> Iterator:
+    # Every item once, in an order where each prefix is spread evenly over
+    # the whole list: a stride of the golden ratio times its length. Listings
+    # come a directory at a time, so a sample that stops early in listing
+    # order only sees the first directories.
+    count = len(items)
+    stride = max(1, round(count * 0.6180339887))
+    while math.gcd(stride, count) != 1:
+        stride += 1
+    for i in range(count):
+        yield items[i * stride % count]
+
+
+def group_files(
+    listing: Iterable[tuple[str, Any]], groups: dict[str, list] | None = None
+) -> dict[str, list[tuple[str, Any]]]:
+    # Buckets (relative path, size or DirEntry) pairs by what decides their
+    # language, so the mapping is consulted once per extension rather than
+    # once per file: the extension as written, '/' and the name for special
+    # files, and '' for names without an extension. Dotfiles are left out.
+    groups = {} if groups is None else groups
+    for item in listing:
+        relpath = item[0]
+        name = relpath[relpath.rfind("/") + 1 :]
+        dot = name.rfind(".")
+        if name in SPECIAL_FILES:
+            key = "/" + name
+        elif dot > 0:
+            key = name[dot + 1 :]
+        elif dot < 0:
+            key = ""
+        else:
+            continue
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [item]
+        else:
+            group.append(item)
+    return groups
+
+
+def spread_sample(items: list, limit: int | None) -> list:
+    # At most limit of items, spread over all of them.
+    if limit is None or len(items) <= limit:
+        return items
+    return list(islice(spread_order(items), limit))
+
+
+def add_groups(
+    histogram: LanguageHistogram,
+    groups: dict[str, list[tuple[str, Any]]],
+    mapping: dict[str, str],
+    size_of: Callable[[Any], int | None],
+    sniff: list[tuple[str, int, float]],
+    size_sample: int | None = None,
+) -> None:
+    # size_of turns the second item of a pair into a size, or None for a
+    # file that is gone. Files the name alone cannot place, possible scripts
+    # without an extension and ambiguous extensions, go to sniff with the
+    # scale of their sample instead.
+    for key, items in groups.items():
+        if key.startswith("/"):
+            language = SPECIAL_FILES[key[1:]]
+        else:
+            ext = key.lower()
+            if not ext or (ext in HEURISTICS and ext in mapping):
+                sampled = spread_sample(items, size_sample)
+                scale = len(items) / len(sampled)
+                for relpath, item in sampled:
+                    size = size_of(item)
+                    if size is not None:
+                        sniff.append((relpath, size, scale))
+                continue
+            language = mapping.get(ext)
+        if not histogram.counts(language):
+            continue
+        sampled = spread_sample(items, size_sample)
+        sizes = [
+            size for size in (size_of(item) for _, item in sampled) if size is not None
+        ]
+        histogram.add_sizes(language, sizes, len(items) / len(sampled))
+
+
+def add_sniffed(
+    histogram: LanguageHistogram, root: Path, sniff: list[tuple[str, int, float]]
+) -> None:
+    # Deferred until the listing is done so the reads can overlap.
+    files = [(relpath, size) for relpath, size, _ in sniff]
+    sizes: dict[tuple[str, float], list[int]] = {}
+    for (_, size, scale), language in zip(sniff, sniff_files(root, files), strict=True):
+        if histogram.counts(language):
+            sizes.setdefault((language, scale), []).append(size)
+    for (language, scale), language_sizes in sizes.items():
+        histogram.add_sizes(language, language_sizes, scale)
+
+
+def add_listing(
+    histogram: LanguageHistogram,
+    listing: Iterable[tuple[str, Any]],
+    mapping: dict[str, str],
+    size_of: Callable[[Any], int | None],
+    sample: bool,
+    size_sample: int | None = None,
+) -> list[tuple[str, int, float]]:
+    # Adds the files of a listing and returns those left to sniff. When
+    # sampling, the listing is taken a chunk at a time until the language
+    # shares settle; otherwise all at once.
+    sniff: list[tuple[str, int, float]] = []
+    if not sample:
+        add_groups(
+            histogram, group_files(listing), mapping, size_of, sniff, size_sample
         )
-        return [line.strip() for line in result.stdout.splitlines() if line.strip()]
-    except Exception as e:
-        print(f"Failed to run Linguist: {e}")
-        return []
-
-
-def detect_from_extensions(path: Path, mapping: Dict[str, str]) -> List[str]:
-    special_files = {
-        "Makefile": "C",
-        "pom.xml": "Java",
-        "build.gradle": "Java",
-        "setup.py": "Python",
-        "pyproject.toml": "Python",
-    }
+        return sniff
+
+    listing = iter(listing)
+    while True:
+        chunk = list(islice(listing, SAMPLE_CHECK_EVERY))
+        if not chunk:
+            return sniff
+        add_groups(histogram, group_files(chunk), mapping, size_of, sniff)
+        if histogram.settled():
+            logger.debug("Language shares settled after %d files", histogram.files)
+            return sniff
+
 
-    detected = set()
+def tracked_listing(
+    entries: Iterable[tuple[str, int]],
+    ignore: IgnoreRules,
+    max_depth: int | None,
+    max_files: int | None,
+    stats: WalkStats,
+) -> Iterator[tuple[str, int]]:
+    # The index entries a walk would have listed. Entries come sorted by
+    # path, so a directory is looked up once for its whole run of files.
+    match = ignore.match if ignore.rules else None
+    budget = max_files if max_files is not None else -1
+    last = None
+    excluded = False
+    for entry in entries:
+        relpath = entry[0]
+        slash = relpath.rfind("/")
+        if slash >= 0:
+            directory = relpath[:slash]
+            if directory != last:
+                last = directory
+                excluded = (
+                    max_depth is not None and directory.count("/") >= max_depth
+                ) or ignore.excludes_dir(directory)
+            if excluded:
+                stats.skipped += 1
+                continue
+        if match and match(relpath):
+            stats.skipped += 1
+            continue
+        if stats.files == budget:
+            stats.truncated = True
+            return
+        stats.files += 1
+        yield entry
 
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            ext = Path(file).suffix.lstrip(".").lower()
-            name = Path(file).name
-            if name in special_files:
-                detected.add(special_files[name])
-            elif ext in mapping:
-                detected.add(mapping[ext])
 
-    return sorted(detected)
+def _entry_size(entry: os.DirEntry) -> int | None:
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return None
+
+
+def histogram_from_git_index(
+    path: Path,
+    mapping: dict[str, str],
+    max_depth: int | None = None,
+    max_files: int | None = None,
+    sample: bool = False,
+    counted: frozenset | None = None,
+) -> LanguageHistogram | None:
+    # Tracked files only, straight from .git/index. Returns None when there
+    # is no usable index so the caller can fall back to walking the tree.
+    entries = read_tracked_files(path)
+    if not entries:
+        return None
+
+    # Tracked files are not subject to .gitignore, only to .citoolignore.
+    ignore = IgnoreRules.from_directory(path, names=(".citoolignore",))
+    histogram = LanguageHistogram(counted)
+    stats = WalkStats()
+    listing = tracked_listing(
+        spread_order(entries) if sample else entries,
+        ignore,
+        max_depth,
+        max_files,
+        stats,
+    )
+
+    sniff = add_listing(histogram, listing, mapping, lambda size: size, sample)
+    add_sniffed(histogram, path, sniff)
+    logger.debug(
+        "Read %d tracked files from git index, skipped %d", stats.files, stats.skipped
+    )
+    return histogram
+
+
+def histogram_from_walk(
+    path: Path,
+    mapping: dict[str, str],
+    max_depth: int | None = None,
+    max_files: int | None = None,
+    sample: bool = False,
+    counted: frozenset | None = None,
+) -> LanguageHistogram:
+    histogram = LanguageHistogram(counted)
+    stats = WalkStats()
+
+    listing = walk_files(path, max_depth=max_depth, max_files=max_files, stats=stats)
+    if sample:
+        # Sampling saves the stats, not the walk: the whole listing is needed
+        # to sample across it.
+        listing = spread_order(list(listing))
 
+    # Only files that map to a counted language, or may, are stat'ed.
+    sniff = add_listing(histogram, listing, mapping, _entry_size, sample, SIZE_SAMPLE)
+    add_sniffed(histogram, path, sniff)
+    logger.debug(
+        "Scanned %d files, skipped %d entries%s",
+        stats.files,
+        stats.skipped,
+        " (file budget reached)" if stats.truncated else "",
+    )
+    return histogram
+
+
+def detect_from_git_index(
+    path: Path,
+    mapping: dict[str, str],
+    max_depth: int | None = None,
+    max_files: int | None = None,
+) -> list[str] | None:
+    histogram = histogram_from_git_index(path, mapping, max_depth, max_files)
+    return None if histogram is None else histogram.ranked()
+
+
+def detect_from_extensions(
+    path: Path,
+    mapping: dict[str, str],
+    max_depth: int | None = None,
+    max_files: int | None = None,
+) -> list[str]:
+    return histogram_from_walk(path, mapping, max_depth, max_files).ranked()
+
+
+@timed("detect")
+def detect_language_histogram(
+    path: Path,
+    max_depth: int | None = None,
+    max_files: int | None = None,
+    sample: bool = False,
+) -> dict[str, int]:
+    # Bytes per language, largest first.
+    mapping, counted = get_languages()
+    histogram = histogram_from_git_index(
+        path, mapping, max_depth, max_files, sample, counted
+    )
+    if histogram is None:
+        histogram = histogram_from_walk(
+            path, mapping, max_depth, max_files, sample, counted
+        )
+    return histogram.as_dict()
 
-def detect_languages(path: Path) -> List[str]:
-    if has_linguist():
-        return detect_with_linguist(path)
 
-    print("Linguist not available, falling back to extension-based detection.")
-    return detect_from_extensions(path, EXTENSION_MAP)
+def detect_languages(
+    path: Path, max_depth: int | None = None, max_files: int | None = None
+) -> list[str]:
+    # Most significant language first.
+    return list(detect_language_histogram(path, max_depth, max_files))
@@ -1,50 +1,84 @@
+import functools
 import json
 from pathlib import Path
-from typing import List
 
+SCHEMA_PATH = Path(__file__).parents[1] / "schemas" / "blueprint.schema.json"
 
-def load_enum_choices(schema_path: Path, property_path: str) -> List[str]:
-    with open(schema_path, "r", encoding="utf-8") as f:
-        schema = json.load(f)
+# In current schema, there's only one output_path per platform
+# so we keep a hardcoded map for now
+DEFAULT_OUTPUT_PATHS = {
+    "gitlab": ".gitlab-ci.yml",
+    "github": ".github/workflows/ci.yml",
+}
 
-    parts = property_path.split(".")
-    current = schema.get("properties", {})
 
-    for part in parts:
-        current = current.get(part)
-        if current is None:
+class SchemaRegistry:
+    def __init__(self, schema: dict):
+        self.schema = schema
+        self.properties: set = set()
+        self.enums: dict[str, list] = {}
+        self.examples: dict[str, list] = {}
+        self._index(schema.get("properties", {}), "")
+
+        self.output_paths = {
+            platform: DEFAULT_OUTPUT_PATHS[platform]
+            for platform in self.enums.get("ci.platform", [])
+            if platform in DEFAULT_OUTPUT_PATHS
+        }
+
+    @classmethod
+    def from_file(cls, schema_path: Path) -> "SchemaRegistry":
+        with open(schema_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _index(self, properties: dict, prefix: str) -> None:
+        for name, prop in properties.items():
+            dotted = prefix + name
+            self.properties.add(dotted)
+            if "enum" in prop:
+                self.enums[dotted] = prop["enum"]
+            if "examples" in prop:
+                self.examples[dotted] = prop["examples"]
+            if "properties" in prop:
+                self._index(prop["properties"], dotted + ".")
+
+    def enum_choices(self, property_path: str) -> list[str]:
+        if property_path not in self.properties:
             raise ValueError(f"Property '{property_path}' not found in schema")
-        if "properties" in current:
-            current = current["properties"]
+        if property_path not in self.enums:
+            raise ValueError(f"No enum found for property '{property_path}'")
+        return self.enums[property_path]
 
-    if "enum" not in current:
-        raise ValueError(f"No enum found for property '{property_path}'")
+    def examples_for(self, property_path: str) -> list[str]:
+        return self.examples.get(property_path, [])
 
-    return current["enum"]
+    def output_path(self, platform: str) -> str:
+        if platform not in self.enums.get("ci.platform", []):
+            raise ValueError(f"Unknown CI platform: '{platform}'")
+        if platform not in self.output_paths:
+            raise ValueError(
+                f"No default output path defined for platform: '{platform}'"
+            )
+        return self.output_paths[platform]
 
 
-def load_examples(schema_path: Path, property_name: str) -> List[str]:
-    with open(schema_path) as f:
-        schema = json.load(f)
-    prop = schema.get("properties", {}).get(property_name, {})
-    return prop.get("examples", [])
+def get_registry(schema_path: Path = SCHEMA_PATH) -> SchemaRegistry:
+    # Parsed once per process and schema file.
+    return _load_registry(Path(schema_path).resolve())
 
 
-def get_output_path_for_platform(schema_path: Path, platform: str) -> str:
-    with open(schema_path, "r") as f:
-        schema = json.load(f)
+@functools.cache
+def _load_registry(schema_path: Path) -> SchemaRegistry:
+    return SchemaRegistry.from_file(schema_path)
+
 
-    ci_props = schema["properties"]["ci"]["properties"]
-    platform_enum = ci_props["platform"]["enum"]
+def load_enum_choices(schema_path: Path, property_path: str) -> list[str]:
+    return get_registry(schema_path).enum_choices(property_path)
 
-    if platform not in platform_enum:
-        raise ValueError(f"Unknown CI platform: '{platform}'")
 
-    # In current schema, there's only one output_path per platform
-    # so we return a hardcoded map for now
-    default_paths = {"gitlab": ".gitlab-ci.yml", "github": ".github/workflows/ci.yml"}
+def load_examples(schema_path: Path, property_name: str) -> list[str]:
+    return get_registry(schema_path).examples_for(property_name)
 
-    if platform not in default_paths:
-        raise ValueError(f"No default output path defined for platform: '{platform}'")
 
-    return default_paths[platform]
+def get_output_path_for_platform(schema_path: Path, platform: str) -> str:
+    return get_registry(schema_path).output_path(platform)
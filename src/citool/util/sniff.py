@@ -0,0 +1,202 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+logger = logging.getLogger("citool")
+
+# How much of a file is read: enough for the keyword heuristics of an
+# ambiguous extension, only the first lines (shebang, modeline) of a file
+# without one. Reads across a whole detection stop at SNIFF_BUDGET; files
+# past it get their extension's default language. Opening a file costs
+# about as much as reading a page of it, so every read is charged at least
+# READ_COST, which also caps the number of files opened.
+SNIFF_BYTES = 4096
+SHEBANG_BYTES = 512
+READ_COST = 4096
+SNIFF_BUDGET = 4 * 1024 * 1024
+SNIFF_WORKERS = 8
+SNIFF_PARALLEL_MIN = 64
+
+# Interpreter and editor mode names, lowercased, for shebangs and modelines.
+NAMES = {
+    "bash": "Shell",
+    "c": "C",
+    "c++": "C++",
+    "cperl": "Perl",
+    "cpp": "C++",
+    "dash": "Shell",
+    "deno": "TypeScript",
+    "groovy": "Groovy",
+    "ksh": "Shell",
+    "lua": "Lua",
+    "make": "Makefile",
+    "matlab": "MATLAB",
+    "node": "JavaScript",
+    "nodejs": "JavaScript",
+    "objc": "Objective-C",
+    "objective-c": "Objective-C",
+    "octave": "MATLAB",
+    "perl": "Perl",
+    "perl6": "Raku",
+    "php": "PHP",
+    "prolog": "Prolog",
+    "pwsh": "PowerShell",
+    "py": "Python",
+    "pypy": "Python",
+    "python": "Python",
+    "raku": "Raku",
+    "rscript": "R",
+    "ruby": "Ruby",
+    "sh": "Shell",
+    "swipl": "Prolog",
+    "tclsh": "Tcl",
+    "zsh": "Shell",
+}
+
+_OBJC = re.compile(
+    r"^\s*(@(interface|implementation|protocol|class|property|end|selector)\b|#import\s+[<\"])",
+    re.MULTILINE,
+)
+_CPP = re.compile(
+    r"^\s*(template\s*<|namespace\s+\w+|class\s+\w+\s*[:{]|using\s+namespace\b"
+    r"|(public|private|protected)\s*:|#include\s*<(string|vector|map|memory|iostream|cstdint)>)",
+    re.MULTILINE,
+)
+_PERL = re.compile(
+    r"^\s*(use\s+(strict|warnings)\b|package\s+[\w:]+\s*;|sub\s+\w+\s*\{)", re.MULTILINE
+)
+_RAKU = re.compile(
+    r"^\s*(use\s+v6\b|unit\s+(module|class|grammar)\b|(class|grammar|role)\s+[\w:]+\s*\{)",
+    re.MULTILINE,
+)
+_PROLOG = re.compile(r"^\s*(:-\s*\w|[a-z]\w*(\([^)]*\))?\s*:-)", re.MULTILINE)
+_MATLAB = re.compile(
+    r"^\s*(function\s+(\[[^\]]*\]|\w+)\s*=|%[%{ ]|end\s*$)", re.MULTILINE
+)
+
+# Extensions several languages claim. The first matching keyword rule wins,
+# otherwise the default does; a shebang or modeline beats both.
+HEURISTICS: dict[str, tuple[list[tuple[str, re.Pattern]], str]] = {
+    "h": ([("Objective-C", _OBJC), ("C++", _CPP)], "C"),
+    "m": ([("Objective-C", _OBJC), ("MATLAB", _MATLAB)], "Objective-C"),
+    "pl": ([("Raku", _RAKU), ("Perl", _PERL), ("Prolog", _PROLOG)], "Perl"),
+    "pm": ([("Raku", _RAKU)], "Perl"),
+    "t": ([("Raku", _RAKU)], "Perl"),
+}
+
+_SHEBANG = re.compile(rb"#![ \t]*(\S+)[ \t]*([^\r\n]*)")
+_VIM_MODELINE = re.compile(r"\b(?:vim?|ex):.*?\b(?:ft|filetype|syntax)=([\w+-]+)")
+_EMACS_MODELINE = re.compile(
+    r"-\*-\s*(?:.*?\bmode:\s*)?([\w+-]+)\s*(?:;.*?)?-\*-", re.IGNORECASE
+)
+
+
+def extension(name: str) -> str | None:
+    dot = name.rfind(".")
+    return name[dot + 1 :].lower() if dot > 0 else None
+
+
+def default_language(name: str) -> str | None:
+    # What a file is taken to be without looking inside.
+    ext = extension(name)
+    return HEURISTICS[ext][1] if ext in HEURISTICS else None
+
+
+def from_shebang(head: bytes) -> str | None:
+    match = _SHEBANG.match(head)
+    if not match:
+        return None
+    program, rest = match.group(1), match.group(2).split()
+    name = os.path.basename(program).decode(errors="replace")
+    if name == "env":
+        # /usr/bin/env [-S] [VAR=value ...] python3 -u
+        args = [a.decode(errors="replace") for a in rest]
+        name = next((a for a in args if not a.startswith("-") and "=" not in a), "")
+    name = name.lower()
+    # python3.12, perl5.36 and the like.
+    return NAMES.get(name) or NAMES.get(name.rstrip("0123456789."))
+
+
+def from_modeline(text: str) -> str | None:
+    for pattern in (_VIM_MODELINE, _EMACS_MODELINE):
+        match = pattern.search(text)
+        if match:
+            return NAMES.get(match.group(1).lower())
+    return None
+
+
+def sniff_language(name: str, head: bytes) -> str | None:
+    # head is the start of the file. Returns None for a file without an
+    # extension that does not say what it is.
+    ext = extension(name)
+    if b"\0" in head:
+        return default_language(name)
+
+    language = from_shebang(head)
+    if language:
+        return language
+    text = head.decode("utf-8", errors="replace")
+    language = from_modeline(text)
+    if language or ext not in HEURISTICS:
+        return language
+
+    rules, default = HEURISTICS[ext]
+    for candidate, pattern in rules:
+        if pattern.search(text):
+            return candidate
+    return default
+
+
+def read_head(path: Path, limit: int) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return f.read(limit)
+    except OSError:
+        return b""
+
+
+def sniff_files(
+    root: Path, files: list[tuple[str, int]], budget: int = SNIFF_BUDGET
+) -> list[str | None]:
+    # Languages for (relative path, size) pairs, in order. Budget is handed
+    # out in that order too, so the same tree always gets the same answer.
+    reads = []
+    results: list[str | None] = []
+    unread = 0
+    for relpath, size in files:
+        name = relpath.rpartition("/")[2]
+        limit = min(size, SNIFF_BYTES if extension(name) else SHEBANG_BYTES)
+        cost = max(limit, READ_COST)
+        if limit and cost > budget:
+            unread += 1
+        if not limit or cost > budget:
+            # Empty files and those past the budget are judged by name.
+            results.append(default_language(name))
+            continue
+        budget -= cost
+        reads.append((len(results), name, root / relpath, limit))
+        results.append(None)
+
+    if unread:
+        logger.debug("Sniff budget reached, %d files judged by name only", unread)
+    if not reads:
+        return results
+
+    # One batch per worker: a future per file would cost more than the read
+    # when the page cache is warm. Threads pay off when it is not.
+    if len(reads) < SNIFF_PARALLEL_MIN:
+        batches = [read_batch(reads)]
+    else:
+        split = [reads[i::SNIFF_WORKERS] for i in range(SNIFF_WORKERS)]
+        with ThreadPoolExecutor(max_workers=SNIFF_WORKERS) as pool:
+            batches = list(pool.map(read_batch, split))
+    for batch in batches:
+        for index, name, head in batch:
+            results[index] = sniff_language(name, head)
+    return results
+
+
+def read_batch(reads: list[tuple[int, str, Path, int]]) -> list[tuple[int, str, bytes]]:
+    return [(index, name, read_head(path, limit)) for index, name, path, limit in reads]
@@ -0,0 +1,106 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from citool.util.util import atomic_write
+
+# Spans are recorded only while a Recorder is installed. When none is,
+# span() hands out one shared no-op context manager and timed() functions
+# call straight through, so instrumentation costs a global lookup.
+_recorder: "Recorder | None" = None
+_NO_SPAN = contextlib.nullcontext()
+
+
+class Recorder:
+    def __init__(self):
+        # One dict per span, in Chrome trace-event form ("X" = complete
+        # event, times in microseconds).
+        self.events: list[dict] = []
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.events.append(
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": start / 1000,
+                    "dur": (end - start) / 1000,
+                    "pid": os.getpid(),
+                    "tid": threading.get_ident(),
+                    "args": args,
+                }
+            )
+
+
+def enable() -> Recorder:
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable() -> None:
+    global _recorder
+    _recorder = None
+
+
+def span(name: str, **args):
+    if _recorder is None:
+        return _NO_SPAN
+    return _recorder.span(name, **args)
+
+
+def timed(name: str) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if _recorder is None:
+                return fn(*a, **kw)
+            with _recorder.span(name):
+                return fn(*a, **kw)
+
+        return wrapper
+
+    return decorate
+
+
+def phase_totals(events: list[dict]) -> dict[str, float]:
+    # Seconds per span name. Nested spans are counted in their parents too.
+    totals: dict[str, float] = {}
+    for event in events:
+        totals[event["name"]] = totals.get(event["name"], 0.0) + event["dur"] / 1e6
+    return {name: round(seconds, 6) for name, seconds in totals.items()}
+
+
+def format_summary(events: list[dict]) -> str:
+    rows: dict[str, list[float]] = {}
+    for event in events:
+        rows.setdefault(event["name"], []).append(event["dur"] / 1000)
+
+    lines = [
+        f"{'phase':<16} {'count':>6} {'total ms':>10} {'mean ms':>10} {'max ms':>10}"
+    ]
+    for name, durations in sorted(rows.items(), key=lambda row: -sum(row[1])):
+        lines.append(
+            f"{name:<16} {len(durations):>6} {sum(durations):>10.1f} "
+            f"{sum(durations) / len(durations):>10.1f} {max(durations):>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def write_trace(path: Path, events: list[dict]) -> None:
+    # Loads in chrome://tracing and Perfetto.
+    trace = {
+        "traceEvents": sorted(events, key=lambda e: e["ts"]),
+        "displayTimeUnit": "ms",
+    }
+    atomic_write(path, json.dumps(trace) + "\n")
@@ -1,6 +1,53 @@
+import hashlib
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+# Here rather than in citool.blueprint so that finding a blueprint does not
+# import yaml and the validator.
+BLUEPRINT_NAMES = ("blueprint.yaml", "blueprint.yml", "blueprint.json")
+
+
+def find_blueprint(path: Path) -> Path | None:
+    for name in BLUEPRINT_NAMES:
+        file = path / name
+        if file.exists():
+            return file
+    return None
+
+
 def ask(prompt: str, default: bool = True) -> bool:
     suffix = "[Y/n]" if default else "[y/N]"
     response = input(f"{prompt} {suffix} ").strip().lower()
     if not response:
         return default
     return response in ("y", "yes")
+
+
+def stage_chunks(path: Path, chunks: Iterable[str]) -> tuple[Path, str]:
+    # Writes chunks to a temporary file next to path as they come and returns
+    # it with the sha256 of its content. Moving it into place is up to the
+    # caller; on errors it is removed.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    digest = hashlib.sha256()
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                data = chunk.encode("utf-8")
+                digest.update(data)
+                f.write(data)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return tmp, digest.hexdigest()
+
+
+def atomic_write(path: Path, text: str) -> None:
+    # Readers see either the old file or the new one, never a partial write.
+    tmp, _ = stage_chunks(path, [text])
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,230 @@
+import os
+import re
+from collections import deque
+from collections.abc import Iterator
+from pathlib import Path
+
+# Directories that never say anything about the project language: VCS
+# metadata, dependency trees, virtualenvs, build output and tool caches.
+PRUNED_DIRS = frozenset(
+    {
+        ".git",
+        ".hg",
+        ".svn",
+        ".venv",
+        "venv",
+        ".tox",
+        ".nox",
+        ".eggs",
+        ".gradle",
+        ".idea",
+        ".mypy_cache",
+        ".pytest_cache",
+        ".ruff_cache",
+        "__pycache__",
+        "node_modules",
+        "bower_components",
+        "vendor",
+        "third_party",
+        "build",
+        "dist",
+        "target",
+    }
+)
+
+IGNORE_FILES = (".gitignore", ".citoolignore")
+
+
+def _translate(pattern: str) -> str:
+    # gitignore globs: '*' and '?' stay within one path segment, '**' spans them.
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 2 :]:
+            end = pattern.index("]", i + 2)
+            chars = pattern[i + 1 : end]
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            out.append(f"[{chars}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(out)
+
+
+class IgnoreRules:
+    def __init__(self, patterns: list[str] | None = None):
+        self.rules: list[tuple[re.Pattern, bool, bool]] = []
+        self._runs: dict[bool, list[tuple[re.Pattern, bool]]] | None = None
+        self._excluded_dirs: dict[str, bool] = {}
+        for line in patterns or []:
+            self.add(line)
+
+    def add(self, line: str) -> None:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            return
+
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return
+
+        # Patterns containing a slash are anchored at the root, the rest
+        # match at any depth.
+        if "/" in line:
+            regex = _translate(line.lstrip("/"))
+        else:
+            regex = "(?:.*/)?" + _translate(line)
+        self.rules.append((re.compile(regex + "$"), negated, dir_only))
+        self._runs = None
+
+    def _compile_runs(self) -> dict[bool, list[tuple[re.Pattern, bool]]]:
+        # Consecutive rules of the same polarity are joined into one regex,
+        # and the runs are tried last first: the first run that matches holds
+        # the last matching rule, which decides. Most ignore files are a
+        # single run, so a path costs one regex match however many rules
+        # there are.
+        runs: dict[bool, list[tuple[re.Pattern, bool]]] = {}
+        for is_dir in (False, True):
+            grouped: list[tuple[list[str], bool]] = []
+            for regex, negated, dir_only in self.rules:
+                if dir_only and not is_dir:
+                    continue
+                if grouped and grouped[-1][1] == negated:
+                    grouped[-1][0].append(regex.pattern)
+                else:
+                    grouped.append(([regex.pattern], negated))
+            runs[is_dir] = [
+                (re.compile("|".join(f"(?:{p})" for p in patterns)), negated)
+                for patterns, negated in reversed(grouped)
+            ]
+        return runs
+
+    @classmethod
+    def from_directory(
+        cls, root: Path, names: tuple[str, ...] = IGNORE_FILES
+    ) -> "IgnoreRules":
+        # Only the ignore files at the project root are honored.
+        rules = cls()
+        for name in names:
+            try:
+                with open(root / name, encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        rules.add(line)
+            except OSError:
+                continue
+        return rules
+
+    def match(self, relpath: str, is_dir: bool = False) -> bool:
+        if not self.rules:
+            return False
+        if self._runs is None:
+            self._runs = self._compile_runs()
+        for regex, negated in self._runs[is_dir]:
+            if regex.match(relpath):
+                return not negated
+        return False
+
+    def excludes(self, relpath: str) -> bool:
+        # For paths that did not come from a walk, an ignored or pruned parent
+        # directory excludes everything below it.
+        directory = relpath.rpartition("/")[0]
+        return bool(directory) and self.excludes_dir(directory) or self.match(relpath)
+
+    def excludes_dir(self, directory: str) -> bool:
+        excluded = self._excluded_dirs.get(directory)
+        if excluded is None:
+            parent, _, name = directory.rpartition("/")
+            excluded = (
+                name in PRUNED_DIRS
+                or (bool(parent) and self.excludes_dir(parent))
+                or self.match(directory, True)
+            )
+            self._excluded_dirs[directory] = excluded
+        return excluded
+
+
+class WalkStats:
+    def __init__(self):
+        self.files = 0
+        self.skipped = 0
+        self.truncated = False
+
+
+def walk_files(
+    root: Path,
+    max_depth: int | None = None,
+    max_files: int | None = None,
+    ignore: IgnoreRules | None = None,
+    stats: WalkStats | None = None,
+) -> Iterator[tuple[str, os.DirEntry]]:
+    # Yields (relative posix path, DirEntry) for the files below root,
+    # breadth first. Pruned and ignored directories are never opened;
+    # everything left out is counted in stats.skipped.
+    if ignore is None:
+        ignore = IgnoreRules.from_directory(root)
+    if stats is None:
+        stats = WalkStats()
+
+    match = ignore.match if ignore.rules else None
+    budget = max_files if max_files is not None else float("inf")
+    depth_limit = max_depth if max_depth is not None else float("inf")
+
+    queue = deque([("", os.fspath(root), 0)])
+    while queue:
+        prefix, directory, depth = queue.popleft()
+        try:
+            scanner = os.scandir(directory)
+        except OSError:
+            stats.skipped += 1
+            continue
+
+        with scanner:
+            for entry in scanner:
+                relpath = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if (
+                            entry.name in PRUNED_DIRS
+                            or depth >= depth_limit
+                            or (match and match(relpath, True))
+                        ):
+                            stats.skipped += 1
+                        else:
+                            queue.append((relpath + "/", entry.path, depth + 1))
+                        continue
+                    is_file = entry.is_file()
+                except OSError:
+                    stats.skipped += 1
+                    continue
+
+                if not is_file or (match and match(relpath)):
+                    stats.skipped += 1
+                    continue
+
+                if stats.files >= budget:
+                    stats.truncated = True
+                    return
+
+                stats.files += 1
+                yield relpath, entry
@@ -0,0 +1,422 @@
+import argparse
+import functools
+import os
+import re
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+from citool.util.schema_helper import SCHEMA_PATH, get_registry
+from citool.util.walk import PRUNED_DIRS
+
+BLUEPRINT_SUFFIXES = (".yaml", ".yml", ".json")
+
+# A compiled check appends (JSON pointer, message) pairs for every problem
+# it finds in the instance.
+Errors = list[tuple[str, str]]
+Check = Callable[[Any, str, Errors], None]
+
+TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+# Keywords that carry no validation semantics.
+ANNOTATIONS = frozenset(
+    {
+        "$schema",
+        "$id",
+        "$comment",
+        "$defs",
+        "title",
+        "description",
+        "default",
+        "examples",
+    }
+)
+
+
+def escape_pointer(segment: str) -> str:
+    return segment.replace("~", "~0").replace("/", "~1")
+
+
+def _type_name(value: Any) -> str:
+    for name in ("null", "boolean", "integer", "number", "string", "array", "object"):
+        if TYPE_CHECKS[name](value):
+            return name
+    return type(value).__name__
+
+
+def _accept(instance: Any, pointer: str, errors: Errors) -> None:
+    pass
+
+
+def _reject(instance: Any, pointer: str, errors: Errors) -> None:
+    errors.append((pointer, "no value is allowed here"))
+
+
+def _is_valid(check: Check, instance: Any, pointer: str) -> bool:
+    errors: Errors = []
+    check(instance, pointer, errors)
+    return not errors
+
+
+class SchemaCompiler:
+    # Turns a schema into nested closures once, so validating a blueprint
+    # never has to look at the schema dicts again. Only the keywords used by
+    # blueprint schemas are supported; anything else is a compile error.
+
+    def __init__(self, root: dict):
+        self.root = root
+        self.refs: dict[str, Check] = {}
+
+    def compile(self, schema: Any) -> Check:
+        if schema is True or schema == {}:
+            return _accept
+        if schema is False:
+            return _reject
+
+        checks: list[Check] = []
+        for keyword, value in schema.items():
+            # then/else belong to 'if', additionalProperties to 'properties'.
+            if keyword in ANNOTATIONS or keyword in ("then", "else"):
+                continue
+            if keyword == "additionalProperties" and "properties" in schema:
+                continue
+            compiler = getattr(self, "_" + keyword.lstrip("$"), None)
+            if compiler is None:
+                raise ValueError(f"Unsupported schema keyword: {keyword}")
+            checks.append(compiler(value, schema))
+
+        if not checks:
+            return _accept
+        if len(checks) == 1:
+            return checks[0]
+
+        checks_tuple = tuple(checks)
+
+        def check_all(instance: Any, pointer: str, errors: Errors) -> None:
+            for check in checks_tuple:
+                check(instance, pointer, errors)
+
+        return check_all
+
+    def _type(self, expected: str | list[str], keywords: dict) -> Check:
+        names = [expected] if isinstance(expected, str) else list(expected)
+        tests = tuple(TYPE_CHECKS[name] for name in names)
+        label = " or ".join(names)
+
+        def check_type(instance: Any, pointer: str, errors: Errors) -> None:
+            for test in tests:
+                if test(instance):
+                    return
+            errors.append((pointer, f"expected {label}, got {_type_name(instance)}"))
+
+        return check_type
+
+    def _enum(self, allowed: list, keywords: dict) -> Check:
+        def check_enum(instance: Any, pointer: str, errors: Errors) -> None:
+            if instance not in allowed:
+                errors.append((pointer, f"{instance!r} is not one of {allowed!r}"))
+
+        return check_enum
+
+    def _const(self, expected: Any, keywords: dict) -> Check:
+        def check_const(instance: Any, pointer: str, errors: Errors) -> None:
+            if instance != expected:
+                errors.append((pointer, f"{expected!r} was expected"))
+
+        return check_const
+
+    def _required(self, names: list[str], keywords: dict) -> Check:
+        names_tuple = tuple(names)
+
+        def check_required(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, dict):
+                for name in names_tuple:
+                    if name not in instance:
+                        errors.append((pointer, f"{name!r} is a required property"))
+
+        return check_required
+
+    def _dependentRequired(self, dependencies: dict, keywords: dict) -> Check:
+        rules = tuple((key, tuple(names)) for key, names in dependencies.items())
+
+        def check_dependent(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, dict):
+                for key, names in rules:
+                    if key in instance:
+                        for name in names:
+                            if name not in instance:
+                                errors.append(
+                                    (
+                                        pointer,
+                                        f"{name!r} is required when {key!r} is set",
+                                    )
+                                )
+
+        return check_dependent
+
+    def _properties(self, properties: dict, keywords: dict) -> Check:
+        known = tuple(
+            (name, "/" + escape_pointer(name), self.compile(sub))
+            for name, sub in properties.items()
+        )
+        additional = keywords.get("additionalProperties", True)
+        extra = None if additional is True else self.compile(additional)
+        names = frozenset(properties)
+
+        def check_properties(instance: Any, pointer: str, errors: Errors) -> None:
+            if not isinstance(instance, dict):
+                return
+            for name, segment, check in known:
+                if name in instance:
+                    check(instance[name], pointer + segment, errors)
+            if extra is None:
+                return
+            for name in instance:
+                if name not in names:
+                    if additional is False:
+                        errors.append(
+                            (pointer, f"additional property {name!r} is not allowed")
+                        )
+                    else:
+                        extra(
+                            instance[name], pointer + "/" + escape_pointer(name), errors
+                        )
+
+        return check_properties
+
+    def _additionalProperties(self, additional: Any, keywords: dict) -> Check:
+        # Only reached without 'properties' in the same schema.
+        return self._properties({}, keywords)
+
+    def _items(self, items: Any, keywords: dict) -> Check:
+        item_check = self.compile(items)
+
+        def check_items(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, list):
+                for i, item in enumerate(instance):
+                    item_check(item, f"{pointer}/{i}", errors)
+
+        return check_items
+
+    def _minItems(self, limit: int, keywords: dict) -> Check:
+        def check_min_items(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, list) and len(instance) < limit:
+                errors.append((pointer, f"expected at least {limit} item(s)"))
+
+        return check_min_items
+
+    def _maxItems(self, limit: int, keywords: dict) -> Check:
+        def check_max_items(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, list) and len(instance) > limit:
+                errors.append((pointer, f"expected at most {limit} item(s)"))
+
+        return check_max_items
+
+    def _minLength(self, limit: int, keywords: dict) -> Check:
+        def check_min_length(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, str) and len(instance) < limit:
+                errors.append((pointer, f"expected at least {limit} character(s)"))
+
+        return check_min_length
+
+    def _pattern(self, pattern: str, keywords: dict) -> Check:
+        regex = re.compile(pattern)
+
+        def check_pattern(instance: Any, pointer: str, errors: Errors) -> None:
+            if isinstance(instance, str) and not regex.search(instance):
+                errors.append((pointer, f"{instance!r} does not match {pattern!r}"))
+
+        return check_pattern
+
+    def _minimum(self, limit: float, keywords: dict) -> Check:
+        def check_minimum(instance: Any, pointer: str, errors: Errors) -> None:
+            if TYPE_CHECKS["number"](instance) and instance < limit:
+                errors.append((pointer, f"{instance!r} is less than {limit!r}"))
+
+        return check_minimum
+
+    def _maximum(self, limit: float, keywords: dict) -> Check:
+        def check_maximum(instance: Any, pointer: str, errors: Errors) -> None:
+            if TYPE_CHECKS["number"](instance) and instance > limit:
+                errors.append((pointer, f"{instance!r} is greater than {limit!r}"))
+
+        return check_maximum
+
+    def _allOf(self, schemas: list, keywords: dict) -> Check:
+        checks = tuple(self.compile(sub) for sub in schemas)
+
+        def check_all_of(instance: Any, pointer: str, errors: Errors) -> None:
+            for check in checks:
+                check(instance, pointer, errors)
+
+        return check_all_of
+
+    def _anyOf(self, schemas: list, keywords: dict) -> Check:
+        checks = tuple(self.compile(sub) for sub in schemas)
+
+        def check_any_of(instance: Any, pointer: str, errors: Errors) -> None:
+            if not any(_is_valid(check, instance, pointer) for check in checks):
+                errors.append((pointer, "does not match any of the allowed forms"))
+
+        return check_any_of
+
+    def _oneOf(self, schemas: list, keywords: dict) -> Check:
+        checks = tuple(self.compile(sub) for sub in schemas)
+
+        def check_one_of(instance: Any, pointer: str, errors: Errors) -> None:
+            matches = sum(_is_valid(check, instance, pointer) for check in checks)
+            if matches != 1:
+                errors.append(
+                    (pointer, f"matches {matches} of the allowed forms, expected 1")
+                )
+
+        return check_one_of
+
+    def _not(self, schema: Any, keywords: dict) -> Check:
+        inner = self.compile(schema)
+
+        def check_not(instance: Any, pointer: str, errors: Errors) -> None:
+            if _is_valid(inner, instance, pointer):
+                errors.append((pointer, "matches a form that is not allowed"))
+
+        return check_not
+
+    def _if(self, schema: Any, keywords: dict) -> Check:
+        condition = self.compile(schema)
+        then = self.compile(keywords.get("then", True))
+        otherwise = self.compile(keywords.get("else", True))
+
+        def check_if(instance: Any, pointer: str, errors: Errors) -> None:
+            if _is_valid(condition, instance, pointer):
+                then(instance, pointer, errors)
+            else:
+                otherwise(instance, pointer, errors)
+
+        return check_if
+
+    def _ref(self, ref: str, keywords: dict) -> Check:
+        if not ref.startswith("#"):
+            raise ValueError(f"Only local $ref is supported: {ref}")
+
+        # Resolved on first use so recursive references compile.
+        def check_ref(instance: Any, pointer: str, errors: Errors) -> None:
+            if ref not in self.refs:
+                target: Any = self.root
+                for part in ref[1:].split("/")[1:]:
+                    target = target[part.replace("~1", "/").replace("~0", "~")]
+                self.refs[ref] = self.compile(target)
+            self.refs[ref](instance, pointer, errors)
+
+        return check_ref
+
+
+def compile_schema(schema: dict) -> Callable[[Any], list[str]]:
+    check = SchemaCompiler(schema).compile(schema)
+
+    def validate(instance: Any) -> list[str]:
+        errors: Errors = []
+        check(instance, "", errors)
+        return [f"{pointer or '/'}: {message}" for pointer, message in errors]
+
+    return validate
+
+
+@functools.cache
+def get_validator(schema_path: Path = SCHEMA_PATH) -> Callable[[Any], list[str]]:
+    return compile_schema(get_registry(schema_path).schema)
+
+
+def validate_blueprint(blueprint: Any) -> list[str]:
+    return get_validator()(blueprint)
+
+
+def find_blueprints(path: Path) -> list[Path]:
+    # Files named like blueprint.yaml, blueprint-c.yaml or blueprint_ci.json.
+    if path.is_file():
+        return [path]
+
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in PRUNED_DIRS)
+        found.extend(
+            Path(root) / name
+            for name in sorted(files)
+            if name.startswith("blueprint") and name.endswith(BLUEPRINT_SUFFIXES)
+        )
+    return found
+
+
+def validate_file(file: Path) -> tuple[str, list[str]]:
+    from citool.blueprint import resolve_blueprint
+
+    try:
+        blueprint = resolve_blueprint(file)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        return str(file), [f"/: could not be read: {e}"]
+    return str(file), validate_blueprint(blueprint)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="citool validate",
+        description="Validate blueprints against the blueprint schema",
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        type=Path,
+        help="Blueprint files, or directories to search for blueprints",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+
+    files = []
+    for path in args.paths:
+        found = find_blueprints(path)
+        if not found:
+            print(f"Error: no blueprints found in {path}", file=sys.stderr)
+            sys.exit(1)
+        files.extend(found)
+    invalid = 0
+
+    if args.workers > 1 and len(files) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            chunksize = max(1, len(files) // (args.workers * 4))
+            results = list(pool.map(validate_file, files, chunksize=chunksize))
+    else:
+        results = [validate_file(file) for file in files]
+
+    for file, errors in results:
+        if errors:
+            invalid += 1
+            for error in errors:
+                print(f"{file}: {error}")
+
+    print(
+        f"Validated {len(files)} blueprint(s): {invalid} invalid",
+        file=sys.stderr,
+    )
+    if invalid:
+        sys.exit(1)
@@ -0,0 +1,77 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from citool.batch import discover_projects, main, process_project
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def make_fleet(root: Path) -> None:
+    shutil.copytree(FIXTURES / "python_deploy", root / "deploy")
+    shutil.copytree(FIXTURES / "python_setup", root / "group" / "setup")
+    (root / "group" / "setup" / ".git").mkdir()
+    (root / "unknown" / ".git").mkdir(parents=True)
+    (root / "docs").mkdir()
+
+
+def test_discover_projects_from_directory(tmp_path: Path):
+    make_fleet(tmp_path)
+
+    projects = discover_projects(tmp_path)
+
+    assert projects == [
+        tmp_path / "deploy",
+        tmp_path / "group" / "setup",
+        tmp_path / "unknown",
+    ]
+
+
+def test_discover_projects_from_list_file(tmp_path: Path):
+    list_file = tmp_path / "projects.txt"
+    list_file.write_text("# fleet\nrepo-a\n\nrepo-b\n")
+
+    assert discover_projects(list_file) == [tmp_path / "repo-a", tmp_path / "repo-b"]
+
+
+def test_process_project_never_prompts(tmp_path: Path, monkeypatch):
+    make_fleet(tmp_path)
+    monkeypatch.setattr("citool.blueprint.ask", lambda msg: pytest.fail(msg))
+    options = {"ci": "gitlab", "env": "dev", "template": None, "dry_run": False}
+
+    written = process_project(tmp_path / "deploy", {**options, "force": False})
+    unknown = process_project(tmp_path / "unknown", {**options, "force": False})
+
+    assert written["status"] == "written"
+    assert (tmp_path / "deploy" / ".gitlab-ci.yml").exists()
+    assert unknown["status"] == "error"
+    assert "Unable to detect" in unknown["error"]
+
+
+def test_process_project_lets_bugs_propagate(tmp_path: Path, monkeypatch):
+    make_fleet(tmp_path)
+
+    def broken(path, config):
+        raise RuntimeError("bug")
+
+    monkeypatch.setattr("citool.batch.load_or_generate_blueprint", broken)
+    options = {"ci": "gitlab", "env": "dev", "template": None, "dry_run": True}
+
+    with pytest.raises(RuntimeError, match="bug"):
+        process_project(tmp_path / "deploy", options)
+
+
+def test_batch_main_prints_summary(tmp_path: Path, capsys):
+    make_fleet(tmp_path)
+
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--ci", "gitlab", "--env", "dev", "--dry-run"])
+
+    lines = capsys.readouterr().out.splitlines()
+    results = {Path(r["path"]).name: r for r in map(json.loads, lines)}
+    assert results["deploy"]["status"] == "rendered"
+    assert results["setup"]["status"] == "rendered"
+    assert results["unknown"]["status"] == "error"
+    assert not (tmp_path / "deploy" / ".gitlab-ci.yml").exists()
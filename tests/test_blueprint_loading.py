@@ -3,6 +3,7 @@ import yaml
 import pytest
 from pathlib import Path
 
+from citool import blueprint
 from citool.blueprint import load_or_generate_blueprint
 from citool.config import Config
 
@@ -56,6 +57,18 @@ def test_unknown_stack_user_accepts(tmp_path: Path, monkeypatch):
     assert blueprint_file.exists()
 
 
+def test_generated_blueprints_load_again(tmp_path: Path, monkeypatch):
+    (tmp_path / "main.go").write_text("package main\n" * 20)
+    (tmp_path / "README.md").write_text("# Service\n")
+    monkeypatch.setattr("citool.blueprint.ask", lambda msg: True)
+    config = Config(ci="gitlab", env="dev", dry_run=False)
+
+    assert load_or_generate_blueprint(tmp_path, config)["language"] == "go"
+    # Read back from blueprint.yaml, so validated against the schema.
+    result = load_or_generate_blueprint(tmp_path, config)
+    assert (result["language"], result["build_system"]) == ("go", "none")
+
+
 def test_abort_on_unknown_stack_and_user_declines(tmp_path: Path, monkeypatch):
     # No files -> unknown stack
     config = Config(ci="gitlab", env="dev", dry_run=True)
@@ -102,3 +115,135 @@ def test_detected_but_user_declines_write(tmp_path: Path, monkeypatch):
     result = load_or_generate_blueprint(tmp_path, config)
     assert result["language"] == "python"
     assert not (tmp_path / "blueprint.yaml").exists()
+
+
+def test_cache_key_files_found_from_build_system(tmp_path: Path):
+    blueprint_data = {
+        "language": "python",
+        "build_system": "pip",
+        "build_commands": ["pip install -r requirements.txt"],
+        "caching": {"paths": [".venv/"]},
+        "ci": "gitlab",
+        "env": "dev",
+    }
+    (tmp_path / "blueprint.yaml").write_text(yaml.dump(blueprint_data))
+    for name in ("requirements.txt", "requirements-dev.txt", "poetry.lock"):
+        (tmp_path / name).write_text("")
+
+    config = Config(ci="gitlab", env="dev", dry_run=True)
+
+    result = load_or_generate_blueprint(tmp_path, config)
+    assert result["caching"]["key_files"] == [
+        "requirements-dev.txt",
+        "requirements.txt",
+    ]
+
+    # Explicit key files are kept as they are.
+    blueprint_data["caching"]["key_files"] = ["constraints.txt"]
+    (tmp_path / "blueprint.yaml").write_text(yaml.dump(blueprint_data))
+    result = load_or_generate_blueprint(tmp_path, config)
+    assert result["caching"]["key_files"] == ["constraints.txt"]
+
+
+def write_layers(tmp_path: Path) -> Path:
+    (tmp_path / "org").mkdir()
+    (tmp_path / "org" / "base.yaml").write_text(
+        yaml.dump(
+            {
+                "branching": {
+                    "strategy": "gitflow",
+                    "protected_branches": ["main", "develop"],
+                },
+                "tagging": {"scheme": "semantic", "prefix": "v"},
+                "language": "python",
+                "build_system": "pip",
+                "build_commands": ["pip install ."],
+            }
+        )
+    )
+    (tmp_path / "app").mkdir()
+    (tmp_path / "app" / "blueprint.yaml").write_text(
+        yaml.dump(
+            {
+                "extends": "../org/base.yaml",
+                "branching": {"protected_branches": ["main"]},
+                "ci": "gitlab",
+                "env": "dev",
+            }
+        )
+    )
+    return tmp_path / "app"
+
+
+def test_extends_deep_merges_base_blueprints(tmp_path: Path, monkeypatch):
+    project = write_layers(tmp_path)
+    config = Config(ci="gitlab", env="dev", dry_run=True)
+
+    result = load_or_generate_blueprint(project, config)
+    assert "extends" not in result
+    assert result["branching"] == {
+        "strategy": "gitflow",
+        "protected_branches": ["main"],
+    }
+    assert result["tagging"]["prefix"] == "v"
+
+    # The base is served from memory while it is unchanged...
+    read = blueprint.read_blueprint
+    reads = []
+    monkeypatch.setattr(
+        blueprint, "read_blueprint", lambda f: reads.append(f.name) or read(f)
+    )
+    result["tagging"]["prefix"] = "mutated"
+    assert load_or_generate_blueprint(project, config)["tagging"]["prefix"] == "v"
+    assert reads == ["blueprint.yaml"]
+
+    # ...and read again once it changes.
+    base = yaml.safe_load((tmp_path / "org" / "base.yaml").read_text())
+    base["tagging"]["prefix"] = "release-"
+    (tmp_path / "org" / "base.yaml").write_text(yaml.dump(base) + "\n")
+    assert (
+        load_or_generate_blueprint(project, config)["tagging"]["prefix"] == "release-"
+    )
+
+
+def test_extends_cycles_and_explain(tmp_path: Path):
+    project = write_layers(tmp_path)
+    base = str(tmp_path / "org" / "base.yaml")
+    app = str(project / "blueprint.yaml")
+
+    assert dict(blueprint.explain_blueprint(project / "blueprint.yaml")) == {
+        "branching.strategy": base,
+        "branching.protected_branches": app,
+        "tagging.scheme": base,
+        "tagging.prefix": base,
+        "language": base,
+        "build_system": base,
+        "build_commands": base,
+        "ci": app,
+        "env": app,
+    }
+
+    (tmp_path / "org" / "base.yaml").write_text("extends: ../app/blueprint.yaml\n")
+    with pytest.raises(
+        ValueError, match="cycle: .*blueprint.yaml -> .*base.yaml -> .*blueprint.yaml"
+    ):
+        blueprint.resolve_blueprint(project / "blueprint.yaml")
+
+
+def test_resolved_bases_are_bounded(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(blueprint, "MAX_RESOLVED_BASES", 2)
+    monkeypatch.setattr(blueprint, "_resolved_bases", {})
+    for name in "abc":
+        (tmp_path / f"{name}.yaml").write_text(f"{name}: 1\n")
+        (tmp_path / f"{name}-app.yaml").write_text(f"extends: {name}.yaml\n")
+
+    for name in "abac":
+        blueprint.resolve_blueprint(tmp_path / f"{name}-app.yaml")
+
+    # b was used least recently.
+    assert [Path(f).name for f in blueprint._resolved_bases] == ["a.yaml", "c.yaml"]
+
+    (tmp_path / "b.yaml").unlink()
+    with pytest.raises(FileNotFoundError, match="extends missing file") as error:
+        blueprint.resolve_blueprint(tmp_path / "b-app.yaml")
+    assert isinstance(error.value.__cause__, FileNotFoundError)
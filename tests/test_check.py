@@ -0,0 +1,64 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from citool.check import check_project, main
+from citool.main import main as citool_main
+from citool.manifest import LOCK_NAME
+
+FIXTURES = Path(__file__).parent / "fixtures"
+OPTIONS = {"ci": None, "env": None, "platforms": [], "envs": []}
+
+
+def test_check_project_compares_with_rendered(tmp_path: Path):
+    project = tmp_path / "deploy"
+    shutil.copytree(FIXTURES / "python_deploy", project)
+    output = project / ".gitlab-ci.yml"
+
+    missing = check_project(project, OPTIONS)
+    assert missing["status"] == "drift"
+    assert missing["outputs"][0]["status"] == "missing"
+
+    citool_main([str(project), "--ci", "gitlab", "--env", "dev"])
+    assert check_project(project, OPTIONS)["status"] == "in-sync"
+
+    # Without the lock the output is rendered and compared by hash.
+    (project / LOCK_NAME).unlink()
+    assert check_project(project, OPTIONS)["status"] == "in-sync"
+
+    output.write_text(output.read_text().replace("stages:", "stages: # edited"))
+    drift = check_project(project, OPTIONS)["outputs"][0]
+    assert drift["status"] == "drift"
+    assert "-stages: # edited\n+stages:\n" in drift["diff"]
+
+
+def test_check_main_over_many_projects(tmp_path: Path, capsys):
+    for name in ("a", "b"):
+        shutil.copytree(FIXTURES / "python_deploy", tmp_path / name)
+        citool_main([str(tmp_path / name), "--ci", "gitlab", "--env", "dev"])
+    capsys.readouterr()
+
+    main([str(tmp_path), "--workers", "2"])
+    assert "Checked 2 project(s): 2 in-sync" in capsys.readouterr().err
+
+    (tmp_path / "b" / ".gitlab-ci.yml").write_text("stages: []\n")
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--workers", "2"])
+    captured = capsys.readouterr()
+    assert f"{tmp_path / 'b' / '.gitlab-ci.yml'}: drift" in captured.out
+    assert "+stages:" in captured.out
+    assert "1 drift, 1 in-sync" in captured.err
+
+
+def test_check_skips_checkouts_without_blueprint(tmp_path: Path, capsys):
+    shutil.copytree(FIXTURES / "python_deploy", tmp_path / "a")
+    citool_main([str(tmp_path / "a"), "--ci", "gitlab", "--env", "dev"])
+    (tmp_path / "b" / ".git").mkdir(parents=True)
+    capsys.readouterr()
+
+    main([str(tmp_path), "--workers", "1"])
+
+    captured = capsys.readouterr()
+    assert f"{tmp_path / 'b'}: skipped (no blueprint)" in captured.out
+    assert "Checked 2 project(s): 1 in-sync, 1 skipped" in captured.err
@@ -25,3 +25,63 @@ def test_detect_stack(fixture, expected, tmp_path: Path):
         "build_commands": [],
     }
     assert result["language"] == expected
+
+
+def test_primary_language_is_weighted_by_size(tmp_path: Path):
+    (tmp_path / "helper.c").write_text("int x;\n")
+    (tmp_path / "setup.py").write_text("from setuptools import setup\n")
+    for i in range(20):
+        (tmp_path / f"module_{i}.py").write_text("print('hello')\n" * 50)
+
+    result = detect_stack(tmp_path)
+
+    assert result["language"] == "python"
+    assert list(result["metadata"]["languages"]) == ["Python", "C"]
+    assert result["metadata"]["languages"]["C"] == 7
+
+
+def test_sampling_stops_once_primary_is_settled(tmp_path: Path):
+    from citool.util.langmap import EXTENSION_MAP, histogram_from_walk
+
+    for i in range(2000):
+        (tmp_path / f"module_{i}.py").write_text("x = 1\n")
+    (tmp_path / "zz_helper.c").write_text("int x;\n")
+
+    full = histogram_from_walk(tmp_path, EXTENSION_MAP)
+    sampled = histogram_from_walk(tmp_path, EXTENSION_MAP, sample=True)
+
+    assert full.files == 2001
+    assert sampled.files < full.files
+    assert sampled.ranked()[0] == full.ranked()[0] == "Python"
+
+
+@pytest.mark.parametrize("source", ["walk", "git index"])
+def test_sampling_is_not_biased_by_directory_order(tmp_path: Path, source):
+    import subprocess
+
+    from citool.util.langmap import (
+        EXTENSION_MAP,
+        histogram_from_git_index,
+        histogram_from_walk,
+    )
+
+    # The C files are listed first, but Python has 91% of the bytes.
+    (tmp_path / "a_native").mkdir()
+    (tmp_path / "b_app").mkdir()
+    for i in range(600):
+        (tmp_path / "a_native" / f"ext_{i}.c").write_text("x" * 2000)
+    for i in range(3000):
+        (tmp_path / "b_app" / f"module_{i}.py").write_text("x" * 4000)
+
+    if source == "walk":
+        sampled = histogram_from_walk(tmp_path, EXTENSION_MAP, sample=True)
+    else:
+        if shutil.which("git") is None:
+            pytest.skip("git not installed")
+        subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+        subprocess.run(["git", "add", "."], cwd=tmp_path, check=True)
+        sampled = histogram_from_git_index(tmp_path, EXTENSION_MAP, sample=True)
+
+    assert sampled.files < 3600
+    assert sampled.ranked() == ["Python", "C"]
+    assert 0.85 < sampled.bytes["Python"] / sampled.total < 0.95
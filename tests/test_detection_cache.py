@@ -0,0 +1,75 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from citool.blueprint import detect_stack
+from citool.util.cache import DetectionCache, repository_state
+
+
+def test_detection_is_served_from_cache(tmp_path: Path, monkeypatch):
+    (tmp_path / "setup.py").write_text("from setuptools import setup\n")
+
+    first = detect_stack(tmp_path, use_cache=True)
+    monkeypatch.setattr(
+        "citool.blueprint.detect_language_histogram",
+        lambda *a, **kw: pytest.fail("detection ran despite a cache hit"),
+    )
+    second = detect_stack(tmp_path, use_cache=True)
+
+    assert second == first
+    assert second["build_system"] == "setuptools"
+
+
+def test_cache_key_changes_with_directory_contents(tmp_path: Path):
+    (tmp_path / "src").mkdir()
+    before = repository_state(tmp_path)
+
+    (tmp_path / "src" / "main.c").write_text("int main;")
+    os.utime(tmp_path / "src", ns=(1, 1))
+
+    assert repository_state(tmp_path) != before
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+def test_cache_key_uses_git_head_tree(tmp_path: Path):
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+            cwd=tmp_path,
+            check=True,
+            capture_output=True,
+        )
+
+    (tmp_path / "app.py").write_text("print(1)")
+    git("init", "-q")
+    git("add", ".")
+    git("commit", "-qm", "init")
+    tree = subprocess.run(
+        ["git", "rev-parse", "HEAD^{tree}"],
+        cwd=tmp_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+    assert repository_state(tmp_path).startswith(f"git:tree:{tree}:")
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    cache = DetectionCache(tmp_path)
+    projects = {}
+    for name, last_used in (("a", 3), ("b", 1), ("c", 2)):
+        projects[name] = tmp_path / name
+        projects[name].mkdir()
+        cache.put(projects[name], "k", {"language": name})
+        os.utime(cache._entry_path(projects[name]), ns=(last_used, last_used))
+
+    cache.max_bytes = 2 * cache._entry_path(projects["a"]).stat().st_size
+    cache.evict()
+
+    assert cache.get(projects["b"], "k") is None
+    assert cache.get(projects["a"], "k")["result"] == {"language": "a"}
+    assert cache.get(projects["c"], "other") is None
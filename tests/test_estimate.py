@@ -0,0 +1,248 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from citool.estimate import estimate, github_jobs, gitlab_jobs, main, read_history
+
+GITLAB = """
+stages: [lint, test, build, deploy]
+default:
+  cache: {key: k, paths: [.venv/]}
+lint:
+  stage: lint
+  script: [ruff check .]
+  rules:
+    - changes: [src/**/*]
+test:
+  stage: test
+  parallel:
+    matrix:
+      - TEST_FILES: [a.py, b.py, c.py]
+  script: [pytest $TEST_FILES]
+build:
+  stage: build
+  needs: []
+  script: [make]
+  cache: []
+deploy:
+  stage: deploy
+  script: [./deploy]
+.hidden:
+  script: [true]
+"""
+
+GITHUB = """
+on:
+  push:
+    paths: [src/**]
+jobs:
+  test:
+    strategy:
+      matrix:
+        python: ["3.11", "3.12"]
+        os: [ubuntu, macos]
+    steps:
+      - uses: actions/cache@v4
+  build:
+    needs: test
+    steps: []
+"""
+
+
+def test_gitlab_jobs_follow_stages_and_needs():
+    jobs = gitlab_jobs(yaml.safe_load(GITLAB))
+
+    assert {name: job.needs for name, job in jobs.items()} == {
+        "lint": [],
+        "test": ["lint"],
+        "build": [],
+        "deploy": ["build"],
+    }
+    assert jobs["test"].instances == 3
+    assert (jobs["lint"].cached, jobs["build"].cached) == (True, False)
+    assert (jobs["lint"].path_filtered, jobs["deploy"].path_filtered) == (True, False)
+
+
+def test_github_jobs():
+    jobs = github_jobs(yaml.safe_load(GITHUB))
+
+    assert jobs["test"].instances == 4 and jobs["test"].cached
+    assert jobs["build"].needs == ["test"] and not jobs["build"].cached
+    assert jobs["build"].path_filtered
+
+
+def test_read_history_formats(tmp_path: Path):
+    csv_file = tmp_path / "jobs.csv"
+    csv_file.write_text(
+        "name,seconds,cache\ntest 1/3,100,hit\ntest: [b.py],300,miss\nlint,20,\n"
+    )
+    api_file = tmp_path / "jobs.json"
+    api_file.write_text(
+        json.dumps(
+            {
+                "jobs": [
+                    {
+                        "name": "test (3.11)",
+                        "started_at": "2026-01-01T10:00:00Z",
+                        "completed_at": "2026-01-01T10:02:00Z",
+                    },
+                ]
+            }
+        )
+    )
+
+    history = read_history(csv_file)
+    assert history["test"] == {"all": [100.0, 300.0], "hit": [100.0], "miss": [300.0]}
+    assert history["lint"]["all"] == [20.0]
+    assert read_history(api_file)["test"]["all"] == [120.0]
+
+
+def test_read_history_skips_rows_that_are_not_objects(tmp_path: Path, caplog):
+    history_file = tmp_path / "jobs.json"
+    history_file.write_text(json.dumps([["test", 10], {"job": "test", "duration": 30}]))
+
+    assert read_history(history_file) == {
+        "test": {"all": [30.0], "hit": [], "miss": []}
+    }
+    assert "Skipping history entry 1" in caplog.text
+
+    history_file.write_text("42")
+    with pytest.raises(ValueError):
+        read_history(history_file)
+
+
+def test_gitlab_pages_is_a_job():
+    jobs = gitlab_jobs({"pages": {"stage": "deploy", "script": ["make docs"]}})
+
+    assert list(jobs) == ["pages"]
+
+
+def test_estimate_critical_path_and_minutes():
+    jobs = gitlab_jobs(yaml.safe_load(GITLAB))
+    history = {
+        "lint": {"all": [60.0], "hit": [], "miss": []},
+        "test": {"all": [60.0, 180.0], "hit": [60.0], "miss": [180.0]},
+        "build": {"all": [600.0], "hit": [], "miss": []},
+    }
+
+    result = estimate(jobs, history, cache_hit_rate=0.5)
+
+    # build (10 min) -> deploy (1 min, default) beats lint -> test (1 + 2).
+    assert result["critical_path"] == ["build", "deploy"]
+    assert result["wall_minutes"] == 11.0
+    # lint 1 + test 3 x 2 + build 10 + deploy 1
+    assert result["runner_minutes"] == 18.0
+    assert result["cache_saves_minutes"] == 3.0
+    assert result["path_filtered_minutes"] == 1.0
+    assert result["without_history"] == ["deploy"]
+    assert estimate(jobs, history, 0.5, change_rate=0.0)["runner_minutes"] == 17.0
+
+
+def test_main_compares_template_sets(tmp_path: Path, capsys):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "blueprint.yaml").write_text(
+        yaml.dump(
+            {
+                "language": "python",
+                "build_system": "pip",
+                "build_commands": ["pip install ."],
+                "ci": "gitlab",
+                "env": "dev",
+            }
+        )
+    )
+    templates = tmp_path / "templates" / "gitlab"
+    (templates / "base").mkdir(parents=True)
+    (templates / "base" / "python-dev.yml.j2").write_text(
+        "stages: [test, build]\ntest: {stage: test, script: [t]}\nbuild: {stage: build, script: [b]}\n"
+    )
+    (templates / "fast").mkdir()
+    (templates / "fast" / "python-dev.yml.j2").write_text(
+        "test: {script: [t], needs: []}\nbuild: {script: [b], needs: []}\n"
+    )
+    history = tmp_path / "history.json"
+    history.write_text(json.dumps({"test": 120, "build": 60}))
+
+    main(
+        [
+            str(project),
+            "--history",
+            str(history),
+            "--compare",
+            "fast",
+            "--user-templates",
+            str(tmp_path / "templates"),
+        ]
+    )
+
+    out = capsys.readouterr().out
+    assert "test -> build (3.0 min)" in out
+    assert "fast vs base: wall clock -1.0 min, runner minutes +0.0" in out
+
+    with pytest.raises(SystemExit):
+        main([str(project), "--history", str(tmp_path / "missing.csv")])
+
+
+def test_rendered_rules_limit_jobs_to_their_refs():
+    from citool.config import Config
+    from citool.renderer import render_template
+
+    blueprint = {
+        "language": "python",
+        "build_commands": ["poetry build"],
+        "test_commands": ["pytest"],
+        "branching": {"protected_branches": ["main"]},
+        "tagging": {"scheme": "semantic"},
+        "deployments": [{"method": "ssh", "target_server": "h", "target_path": "/opt"}],
+        "ci": "gitlab",
+        "env": "dev",
+    }
+    document = yaml.safe_load(
+        render_template(blueprint, Config(ci="gitlab", env="dev"))
+    )
+    jobs = gitlab_jobs(document)
+
+    assert jobs["build"].ref_filtered and not jobs["build"].path_filtered
+    assert not jobs["test"].ref_filtered and not jobs["ssh_deploy"].ref_filtered
+
+    history = {
+        name: {"all": [60.0 * m], "hit": [], "miss": []}
+        for name, m in (("test", 2), ("build", 10), ("ssh_deploy", 1))
+    }
+    result = estimate(jobs, history, ref_rate=0.25)
+
+    assert result["critical_path"] == ["test", "build", "ssh_deploy"]
+    assert result["wall_minutes"] == 13.0
+    # A push to another branch runs test and the deploy, not the build.
+    assert result["other_refs_critical_path"] == ["test", "ssh_deploy"]
+    assert result["other_refs_wall_minutes"] == 3.0
+    # test 2 + build 10 x 0.25 + deploy 1
+    assert result["runner_minutes"] == 5.5
+    assert result["ref_filtered_minutes"] == 10.0
+
+
+def test_gitlab_when_and_except():
+    jobs = gitlab_jobs(
+        yaml.safe_load("""
+stages: [test, deploy]
+unit: {stage: test, script: [t], except: [tags]}
+docs: {stage: test, script: [d], rules: [{if: '$CI_COMMIT_TAG', when: never}, {when: on_success}]}
+audit: {stage: test, script: [a], rules: [{when: never}, {if: '$NIGHTLY'}]}
+release: {stage: deploy, script: [r], when: manual}
+rollback: {stage: deploy, script: [r], rules: [{if: '$CI_COMMIT_BRANCH', when: manual}]}
+""")
+    )
+
+    assert "audit" not in jobs
+    assert jobs["release"].needs == ["unit", "docs"]
+    assert jobs["unit"].ref_filtered and jobs["docs"].ref_filtered
+    assert jobs["release"].manual and jobs["rollback"].manual
+
+    history = {"unit": {"all": [120.0], "hit": [], "miss": []}}
+    result = estimate(jobs, history, default_seconds=60.0)
+    assert result["manual"] == ["release", "rollback"]
+    assert result["jobs"] == 2
+    assert result["runner_minutes"] == 3.0
@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from citool.util import langmap
+
+LANGUAGES = """\
+Python:
+  type: programming
+  extensions:
+  - ".py"
+YAML:
+  type: data
+  extensions:
+  - ".yml"
+"""
+PYTHON = ({"py": "Python", "yml": "YAML"}, {"Python"})
+
+
+def test_compiled_map_is_reused(tmp_path: Path, monkeypatch):
+    source = tmp_path / "languages.yml"
+    source.write_text(LANGUAGES)
+    compiled = tmp_path / "map.marshal"
+
+    assert langmap.load_compiled_extension_map(source, compiled) == PYTHON
+
+    monkeypatch.setattr(
+        langmap, "load_extension_map", lambda path: pytest.fail("YAML parsed again")
+    )
+    assert langmap.load_compiled_extension_map(source, compiled) == PYTHON
+
+    # A touched but unchanged source is revalidated by its content hash.
+    os.utime(source, ns=(1, 1))
+    assert langmap.load_compiled_extension_map(source, compiled) == PYTHON
+
+
+def test_compiled_map_is_rebuilt_when_source_changes(tmp_path: Path):
+    source = tmp_path / "languages.yml"
+    source.write_text(LANGUAGES)
+    compiled = tmp_path / "map.marshal"
+    langmap.load_compiled_extension_map(source, compiled)
+
+    source.write_text(LANGUAGES.replace('".py"', '".pyw"'))
+
+    assert langmap.load_compiled_extension_map(source, compiled) == (
+        {"pyw": "Python", "yml": "YAML"},
+        {"Python"},
+    )
+
+
+def test_extension_map_is_loaded_lazily():
+    langmap.get_languages.cache_clear()
+
+    assert langmap.get_languages.cache_info().currsize == 0
+    assert langmap.EXTENSION_MAP["py"] == "Python"
+    assert langmap.get_languages.cache_info().currsize == 1
+
+
+def test_prose_and_data_are_mapped_but_not_counted(tmp_path: Path):
+    # Extensions of data and prose languages stay theirs rather than going to
+    # a programming language that also lists them.
+    assert langmap.get_extension_map()["md"] == "Markdown"
+    assert "Markdown" not in langmap.get_counted_languages()
+
+    (tmp_path / "README.md").write_text("# Docs\n" * 5000)
+    (tmp_path / "app.py").write_text("print(1)\n")
+
+    assert langmap.detect_language_histogram(tmp_path) == {"Python": 9}
@@ -0,0 +1,227 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from citool import generator, manifest
+from citool.config import Config
+from citool.generator import generate, select_targets
+from citool.main import main
+from citool.manifest import LOCK_NAME
+
+
+def make_project(tmp_path: Path, **extra) -> Path:
+    blueprint = {
+        "language": "python",
+        "build_system": "pip",
+        "build_commands": ["pip install ."],
+        "ci": {"platform": "gitlab", "output_path": ".gitlab-ci.yml"},
+        "env": "dev",
+        **extra,
+    }
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "blueprint.yaml").write_text(yaml.dump(blueprint))
+
+    for ci in ("gitlab", "github"):
+        for env in ("dev", "prod"):
+            template = tmp_path / "templates" / ci / "base" / f"python-{env}.yml.j2"
+            template.parent.mkdir(parents=True, exist_ok=True)
+            template.write_text(f"{ci}: {{{{ env }}}}\n")
+    return project
+
+
+def test_select_targets():
+    blueprint = {
+        "targets": [
+            {"ci": "gitlab", "env": "dev"},
+            {"ci": "github", "env": "dev"},
+            {"ci": "github", "env": "prod"},
+        ]
+    }
+
+    assert select_targets(["gitlab", "github"], ["dev", "prod"], {}) == [
+        ("gitlab", "dev"),
+        ("gitlab", "prod"),
+        ("github", "dev"),
+        ("github", "prod"),
+    ]
+    assert select_targets([], [], blueprint) == [
+        ("gitlab", "dev"),
+        ("github", "dev"),
+        ("github", "prod"),
+    ]
+    assert select_targets(["github"], [], blueprint) == [
+        ("github", "dev"),
+        ("github", "prod"),
+    ]
+    assert select_targets([], ["prod"], blueprint) == [("github", "prod")]
+
+
+def test_render_every_target_then_write(tmp_path: Path):
+    project = make_project(tmp_path)
+    config = Config(
+        ci=None, env=None, path=project, user_templates=tmp_path / "templates"
+    )
+    blueprint = yaml.safe_load((project / "blueprint.yaml").read_text())
+    targets = select_targets(["gitlab", "github"], ["dev", "prod"], blueprint)
+
+    statuses = generate(blueprint, config, targets)
+
+    assert list(statuses.values()) == ["written"] * 4
+    assert not list(project.rglob("*.tmp"))
+    assert (project / ".gitlab-ci-dev.yml").read_text() == "gitlab: dev"
+    assert (project / ".gitlab-ci-prod.yml").read_text() == "gitlab: prod"
+    assert (
+        project / ".github" / "workflows" / "ci-prod.yml"
+    ).read_text() == "github: prod"
+
+
+def test_blueprint_targets_and_all_or_nothing(tmp_path: Path, capsys):
+    targets = [
+        {"ci": "github", "env": "dev"},
+        {"ci": "gitlab", "env": "prod", "output_path": "ci/prod.yml"},
+    ]
+    project = make_project(tmp_path, targets=targets)
+    templates = str(tmp_path / "templates")
+
+    main([str(project), "--user-templates", templates])
+    assert (project / ".github" / "workflows" / "ci.yml").read_text() == "github: dev"
+    assert (project / "ci" / "prod.yml").read_text() == "gitlab: prod"
+
+    # There is no staging template: nothing is written, not even dev.
+    with pytest.raises(SystemExit):
+        main(
+            [
+                str(project),
+                "--ci",
+                "gitlab",
+                "--env",
+                "dev,staging",
+                "--user-templates",
+                templates,
+            ]
+        )
+    assert (
+        "Template missing in Jinja: gitlab/base/python-staging.yml.j2"
+        in capsys.readouterr().err
+    )
+    assert not (project / ".gitlab-ci-dev.yml").exists()
+
+
+def test_blueprint_with_targets_only(tmp_path: Path):
+    project = make_project(tmp_path, targets=[{"ci": "github", "env": "prod"}])
+    blueprint = yaml.safe_load((project / "blueprint.yaml").read_text())
+    del blueprint["ci"], blueprint["env"]
+    (project / "blueprint.yaml").write_text(yaml.dump(blueprint))
+
+    main([str(project), "--user-templates", str(tmp_path / "templates")])
+
+    assert (project / ".github" / "workflows" / "ci.yml").read_text() == "github: prod"
+
+
+def test_generate_skips_unchanged_inputs(tmp_path: Path, monkeypatch):
+    project = make_project(tmp_path)
+    config = Config(
+        ci="gitlab", env="dev", path=project, user_templates=tmp_path / "templates"
+    )
+    blueprint = yaml.safe_load((project / "blueprint.yaml").read_text())
+    output = project / ".gitlab-ci.yml"
+
+    assert generate(blueprint, config, [("gitlab", "dev")]) == {output: "written"}
+    assert (project / LOCK_NAME).exists()
+    mtime = output.stat().st_mtime_ns
+
+    def fail(*args, **kwargs):
+        raise AssertionError("rendered although nothing changed")
+
+    monkeypatch.setattr(generator, "stream_template", fail)
+    assert generate(blueprint, config, [("gitlab", "dev")]) == {output: "up-to-date"}
+    monkeypatch.undo()
+
+    # A template change re-renders, but identical output leaves the file alone.
+    template = tmp_path / "templates" / "gitlab" / "base" / "python-dev.yml.j2"
+    template.write_text("{# comment #}gitlab: {{ env }}\n")
+    manifest.templates_hash.cache_clear()
+    assert generate(blueprint, config, [("gitlab", "dev")]) == {output: "unchanged"}
+    assert output.stat().st_mtime_ns == mtime
+
+    # Output citool wrote itself is replaced without --force.
+    template.write_text("gitlab: {{ env }} v2\n")
+    manifest.templates_hash.cache_clear()
+    assert generate(blueprint, config, [("gitlab", "dev")]) == {output: "written"}
+    assert output.read_text() == "gitlab: dev v2"
+
+
+def test_generate_keeps_hand_edits_without_force(tmp_path: Path, capsys):
+    project = make_project(tmp_path)
+    templates = str(tmp_path / "templates")
+    output = project / ".gitlab-ci.yml"
+    main(
+        [str(project), "--ci", "gitlab", "--env", "dev", "--user-templates", templates]
+    )
+    main(
+        [str(project), "--ci", "gitlab", "--env", "dev", "--user-templates", templates]
+    )
+    assert "Pipeline up to date" in capsys.readouterr().out
+
+    output.write_text("gitlab: edited by hand\n")
+    with pytest.raises(SystemExit):
+        main(
+            [
+                str(project),
+                "--ci",
+                "gitlab",
+                "--env",
+                "dev",
+                "--user-templates",
+                templates,
+            ]
+        )
+    assert "Pipeline already exists" in capsys.readouterr().out
+    assert output.read_text() == "gitlab: edited by hand\n"
+
+    main(
+        [
+            str(project),
+            "--ci",
+            "gitlab",
+            "--env",
+            "dev",
+            "--user-templates",
+            templates,
+            "--force",
+        ]
+    )
+    assert output.read_text() == "gitlab: dev"
+
+
+def test_generate_streams_large_outputs(tmp_path):
+    import tracemalloc
+
+    template = tmp_path / "templates" / "gitlab" / "base" / "python-dev.yml.j2"
+    template.parent.mkdir(parents=True)
+    template.write_text(
+        "{% for i in range(jobs) %}job-{{ i }}: {script: [make]}\n{% endfor %}"
+    )
+    project = tmp_path / "project"
+    project.mkdir()
+    config = Config(
+        ci="gitlab", env="dev", path=project, user_templates=template.parents[2]
+    )
+
+    # Warm the template cache so only rendering and writing are measured.
+    blueprint = {"language": "python", "ci": "gitlab", "jobs": 1}
+    generate(blueprint, config, [("gitlab", "dev")])
+    tracemalloc.start()
+    try:
+        statuses = generate(dict(blueprint, jobs=100_000), config, [("gitlab", "dev")])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    [(output_path, status)] = statuses.items()
+    assert status == "written"
+    assert output_path.stat().st_size > 2_500_000
+    assert peak < 1_000_000
+    assert not list(output_path.parent.glob("*.tmp"))
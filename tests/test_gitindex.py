@@ -0,0 +1,71 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from citool.util.gitindex import parse_index, read_tracked_files
+from citool.util.langmap import detect_from_git_index
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+
+MAPPING = {"py": "Python", "js": "JavaScript", "c": "C"}
+
+
+def git(repo: Path, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+def make_repo(repo: Path) -> None:
+    for name in ("app.py", "pkg/module.py", "pkg/deeply/nested/helper.c", "README"):
+        (repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (repo / name).write_text("x" * len(name))
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    # Untracked build output must not be seen by detection.
+    (repo / "out").mkdir()
+    (repo / "out" / "bundle.js").write_text("console.log(1)")
+
+
+@pytest.mark.parametrize("version", ["2", "3", "4"])
+def test_parse_index_versions(tmp_path: Path, version):
+    make_repo(tmp_path)
+    git(tmp_path, "update-index", "--index-version", version)
+
+    entries = parse_index((tmp_path / ".git" / "index").read_bytes())
+
+    assert sorted(entries) == [
+        ("README", 6),
+        ("app.py", 6),
+        ("pkg/deeply/nested/helper.c", 26),
+        ("pkg/module.py", 13),
+    ]
+
+
+def test_read_tracked_files_from_subdirectory(tmp_path: Path):
+    make_repo(tmp_path)
+
+    entries = read_tracked_files(tmp_path / "pkg")
+
+    assert sorted(name for name, _ in entries) == [
+        "deeply/nested/helper.c",
+        "module.py",
+    ]
+
+
+def test_detect_from_git_index_ignores_untracked(tmp_path: Path):
+    make_repo(tmp_path)
+
+    assert detect_from_git_index(tmp_path, MAPPING) == ["C", "Python"]
+
+
+def test_detect_from_git_index_falls_back(tmp_path: Path):
+    (tmp_path / "app.py").write_text("")
+    assert detect_from_git_index(tmp_path, MAPPING) is None
+
+    git(tmp_path, "init", "-q")
+    (tmp_path / ".git" / "index").write_bytes(b"DIRC\x00\x00\x00\x09\x00\x00\x00\x00")
+    assert detect_from_git_index(tmp_path, MAPPING) is None
+
+    with pytest.raises(ValueError, match="Unsupported"):
+        parse_index((tmp_path / ".git" / "index").read_bytes())
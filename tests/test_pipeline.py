@@ -0,0 +1,139 @@
+import pytest
+import yaml
+
+from citool.config import Config
+from citool.main import main
+from citool.pipeline import critical_path, job_graph, topological_order
+from citool.renderer import render_template
+
+
+def make_blueprint(**extra) -> dict:
+    return {
+        "language": "python",
+        "build_system": "poetry",
+        "build_commands": ["poetry build"],
+        "test_commands": ["pytest"],
+        "lint_commands": ["ruff check ."],
+        "security_scan_commands": ["pip-audit"],
+        "deployments": [{"method": "ssh", "target_server": "h", "target_path": "/opt"}],
+        "ci": "gitlab",
+        "env": "dev",
+        **extra,
+    }
+
+
+def test_stages_mode_chains_stages():
+    assert job_graph(make_blueprint()) == {
+        "lint": [],
+        "security_scan": [],
+        "test": ["lint", "security_scan"],
+        "build": ["test"],
+        "ssh_deploy": ["build"],
+    }
+
+
+def test_dag_mode_runs_checks_alongside_tests():
+    graph = job_graph(make_blueprint(pipeline={"mode": "dag"}))
+
+    assert graph == {
+        "lint": [],
+        "security_scan": [],
+        "test": [],
+        "build": [],
+        "ssh_deploy": ["build", "lint", "security_scan", "test"],
+    }
+    assert len(critical_path(graph)) == 2
+    assert critical_path(graph, {"test": 300, "build": 60, "ssh_deploy": 30}) == [
+        "test",
+        "ssh_deploy",
+    ]
+
+
+def test_needs_overrides_are_checked():
+    blueprint = make_blueprint(pipeline={"mode": "dag", "needs": {"build": ["test"]}})
+    assert job_graph(blueprint)["build"] == ["test"]
+
+    blueprint["pipeline"]["needs"] = {
+        "lint": ["security_scan"],
+        "security_scan": ["lint"],
+    }
+    with pytest.raises(ValueError, match="cycle: lint -> security_scan -> lint"):
+        topological_order(job_graph(blueprint))
+
+    blueprint["pipeline"]["needs"] = {"package": ["build"]}
+    with pytest.raises(ValueError, match="unknown job 'package'"):
+        job_graph(blueprint)
+
+    blueprint["pipeline"]["needs"] = {"test": ["build"]}
+    with pytest.raises(ValueError, match="'test' needs 'build', which runs in a later"):
+        job_graph(blueprint)
+
+
+@pytest.mark.parametrize("ci", ["gitlab", "github"])
+def test_templates_emit_needs(ci, caplog, capsys):
+    caplog.set_level("INFO", logger="citool")
+    blueprint = make_blueprint(pipeline={"mode": "dag"})
+    config = Config(ci=ci, env="dev")
+
+    pipeline = yaml.safe_load(render_template(blueprint, config))
+
+    jobs = pipeline["jobs"] if ci == "github" else pipeline
+    assert jobs["ssh_deploy"]["needs"] == ["build", "lint", "security_scan", "test"]
+    assert jobs["security_scan"]["script" if ci == "gitlab" else "steps"]
+    if ci == "gitlab":
+        assert jobs["test"]["needs"] == []
+    else:
+        assert "needs" not in jobs["test"]
+    # Reported by generate only, so it doesn't show up in check or estimate.
+    assert "Critical path" not in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+def test_generate_reports_critical_path(tmp_path, caplog, capsys):
+    caplog.set_level("INFO", logger="citool")
+    (tmp_path / "blueprint.yaml").write_text(
+        yaml.safe_dump(make_blueprint(pipeline={"mode": "dag"}))
+    )
+
+    main([str(tmp_path), "--ci", "gitlab", "--env", "dev", "--dry-run"])
+
+    assert "Critical path: build -> ssh_deploy (2 jobs)" in caplog.text
+    assert "ssh_deploy:" in capsys.readouterr().out
+
+
+def test_dag_needs_on_jobs_with_rules_are_optional():
+    # Rules can leave build, lint and test out of a branch pipeline; a plain
+    # need on a missing job makes GitLab reject the whole pipeline.
+    blueprint = make_blueprint(
+        pipeline={"mode": "dag"},
+        incremental_build={"enabled": True, "trigger_paths": ["src/"]},
+        branching={"protected_branches": ["main"]},
+        deployments=[
+            {"method": "ssh", "target_server": "h", "target_path": "/opt"},
+            {"method": "docker", "registry": "r.io", "image_name": "app", "tag": "1"},
+        ],
+    )
+
+    pipeline = yaml.safe_load(
+        render_template(blueprint, Config(ci="gitlab", env="dev"))
+    )
+
+    for job in ("build", "lint", "security_scan", "test"):
+        assert "rules" in pipeline[job]
+    for deploy in ("ssh_deploy", "docker_deploy"):
+        assert pipeline[deploy]["needs"] == [
+            {"job": job, "optional": True}
+            for job in ("build", "lint", "security_scan", "test")
+        ]
+
+    # Only build has rules when branching alone is set.
+    del blueprint["incremental_build"]
+    pipeline = yaml.safe_load(
+        render_template(blueprint, Config(ci="gitlab", env="dev"))
+    )
+    assert pipeline["ssh_deploy"]["needs"] == [
+        {"job": "build", "optional": True},
+        "lint",
+        "security_scan",
+        "test",
+    ]
@@ -1,6 +1,7 @@
 import pytest
 from pathlib import Path
 from citool.config import Config
+from citool import renderer
 from citool.renderer import render_template
 from src.citool.renderer import get_output_path
 
@@ -159,3 +160,238 @@ def test_render_template_with_branching_and_tagging(tmp_path):
     assert "if: '$CI_COMMIT_TAG =~ /^v\\d+\\.\\d+\\.\\d+$/'" in output
     assert "if: '$CI_COMMIT_BRANCH == \"main\"'" in output
     assert "if: '$CI_COMMIT_BRANCH == \"develop\"'" in output
+
+
+def test_schema_registry_indexes(monkeypatch):
+    from citool.util.schema_helper import get_registry
+
+    registry = get_registry()
+    monkeypatch.setattr("builtins.open", lambda *a, **kw: pytest.fail("re-read"))
+
+    assert registry.enum_choices("ci.platform") == ["gitlab", "github"]
+    assert registry.examples_for("env") == ["dev", "test", "staging", "prod"]
+    assert registry.output_path("github") == ".github/workflows/ci.yml"
+    assert get_registry() is registry
+    with pytest.raises(ValueError, match="No enum found"):
+        registry.enum_choices("ci.output_path")
+    with pytest.raises(ValueError, match="Unknown CI platform"):
+        registry.output_path("jenkins")
+
+
+def test_environment_is_shared_and_user_templates_win(tmp_path):
+    from citool.renderer import get_environment
+
+    builtin = tmp_path / "templates" / "gitlab" / "base"
+    builtin.mkdir(parents=True)
+    (builtin / "python-dev.yml.j2").write_text("builtin {{ language }}")
+    user_root = tmp_path / "user"
+    config = Config(ci="gitlab", env="dev", user_templates=user_root)
+    blueprint = {"language": "python"}
+
+    env = get_environment(tmp_path / "templates", user_root)
+    assert get_environment(tmp_path / "templates", user_root) is env
+    assert (
+        render_template(blueprint, config, tmp_path / "templates") == "builtin python"
+    )
+
+    # An override added after the built-in template was cached takes effect.
+    override = user_root / "gitlab" / "base" / "python-dev.yml.j2"
+    override.parent.mkdir(parents=True)
+    override.write_text("user {{ language }}")
+    assert render_template(blueprint, config, tmp_path / "templates") == "user python"
+
+    override.unlink()
+    assert (
+        render_template(blueprint, config, tmp_path / "templates") == "builtin python"
+    )
+
+
+def test_compiled_templates_are_cached_on_disk(tmp_path):
+    from citool.util.cache import cache_dir
+
+    template = tmp_path / "templates" / "gitlab" / "base" / "python-dev.yml.j2"
+    template.parent.mkdir(parents=True)
+    template.write_text("{{ language }}")
+
+    config = Config(ci="gitlab", env="dev")
+    render_template({"language": "python"}, config, tmp_path / "templates")
+
+    assert list((cache_dir() / "jinja").glob("__jinja2_*.cache"))
+
+
+def test_precompiled_bundle_is_used_until_stale(tmp_path, monkeypatch):
+    from jinja2 import Environment
+    from citool.precompile import build_bundle
+
+    root = tmp_path / "templates"
+    template = root / "gitlab" / "base" / "python-dev.yml.j2"
+    template.parent.mkdir(parents=True)
+    template.write_text("compiled {{ language }}")
+    bundle = tmp_path / "bundle.zip"
+    config = Config(
+        ci="gitlab", env="dev", user_templates=tmp_path / "user", bundle=bundle
+    )
+
+    # The template and the shared macro library.
+    macros = len(list(renderer.MACRO_ROOT.glob("*.j2")))
+    assert build_bundle(bundle, root, tmp_path / "user") == 1 + macros
+
+    with monkeypatch.context() as m:
+        m.setattr(Environment, "_parse", lambda *a: pytest.fail("template parsed"))
+        assert (
+            render_template({"language": "python"}, config, root) == "compiled python"
+        )
+
+    # Freshness is checked once per process; start over like a new run would.
+    template.write_text("fresh {{ language }}")
+    renderer._load_bundle.cache_clear()
+    assert render_template({"language": "python"}, config, root) == "fresh python"
+
+
+def render_builtin(blueprint: dict, ci: str) -> dict:
+    import yaml
+
+    config = Config(ci=ci, env="dev", user_templates=Path("/nonexistent"))
+    return yaml.safe_load(render_template(blueprint, config))
+
+
+@pytest.mark.parametrize("ci", ["gitlab", "github"])
+def test_builtin_templates_render_valid_yaml(ci):
+    import yaml
+
+    for fixture in ("python_deploy", "python_branch_tag"):
+        path = Path(__file__).parent / "fixtures" / fixture / "blueprint.yaml"
+        assert render_builtin(yaml.safe_load(path.read_text()), ci)
+
+
+def test_caching_and_incremental_build_rules():
+    blueprint = {
+        "language": "python",
+        "build_commands": ["pip install ."],
+        "test_commands": ["pytest"],
+        "lint_commands": ["ruff check ."],
+        "caching": {"paths": [".venv/"], "key": "py"},
+        "incremental_build": {"trigger_paths": ["src/", "pyproject.toml"]},
+        "branching": {"strategy": "gitflow", "protected_branches": ["main"]},
+    }
+
+    gitlab = render_builtin(blueprint, "gitlab")
+    assert gitlab["default"]["cache"] == {"key": "py", "paths": [".venv/"]}
+    assert gitlab["lint"]["rules"] == [
+        {"changes": ["src/**/*", "pyproject.toml", ".gitlab-ci.yml"]}
+    ]
+    assert gitlab["build"]["rules"] == [
+        {
+            "if": '$CI_COMMIT_BRANCH == "main"',
+            "changes": ["src/**/*", "pyproject.toml", ".gitlab-ci.yml"],
+            "when": "always",
+        }
+    ]
+
+    github = render_builtin(blueprint, "github")
+    paths = ["src/**", "pyproject.toml", ".github/workflows/**"]
+    # YAML 1.1 reads the 'on' key as True.
+    assert github[True]["push"]["paths"] == paths
+    assert github[True]["pull_request"]["paths"] == paths
+    cache = github["jobs"]["test"]["steps"][1]
+    assert cache["uses"] == "actions/cache@v4"
+    assert cache["with"]["path"] == ".venv/\n"
+
+    blueprint["caching"]["enabled"] = False
+    blueprint["incremental_build"]["enabled"] = False
+    assert "default" not in render_builtin(blueprint, "gitlab")
+    assert "rules" not in render_builtin(blueprint, "gitlab")["test"]
+    assert "paths" not in render_builtin(blueprint, "github")[True]["push"]
+
+
+def test_cache_keys_hash_key_files():
+    blueprint = {
+        "language": "python",
+        "build_commands": ["poetry install"],
+        "test_commands": ["pytest"],
+        "caching": {
+            "paths": [".venv/"],
+            "key": "py",
+            "key_files": ["poetry.lock", "requirements.txt", "requirements-dev.txt"],
+        },
+    }
+
+    cache = render_builtin(blueprint, "gitlab")["default"]["cache"]
+    assert cache["key"] == {
+        "files": ["poetry.lock", "requirements.txt"],
+        "prefix": "py",
+    }
+    assert "fallback_keys" not in cache
+
+    step = render_builtin(blueprint, "github")["jobs"]["test"]["steps"][1]["with"]
+    assert step["key"] == (
+        "py-${{ runner.os }}-"
+        "${{ hashFiles('poetry.lock', 'requirements.txt', 'requirements-dev.txt') }}"
+    )
+    assert step["restore-keys"] == "py-${{ runner.os }}-\n"
+
+
+def test_docker_deploy_uses_buildkit_cache():
+    deploy = {"method": "docker", "registry": "r.io", "image_name": "app", "tag": "1"}
+    blueprint = {
+        "language": "python",
+        "build_commands": ["make"],
+        "deployments": [
+            {**deploy, "target": "runtime", "cache": {"ref": "r.io/cache"}}
+        ],
+    }
+
+    script = render_builtin(blueprint, "gitlab")["docker_deploy"]["script"]
+    assert script[1] == "docker buildx create --use --driver docker-container"
+    assert script[2] == (
+        "docker buildx build --tag r.io/app:1 --target runtime"
+        " --cache-from type=registry,ref=r.io/cache:$CI_COMMIT_REF_SLUG"
+        " --cache-from type=registry,ref=r.io/cache:$CI_DEFAULT_BRANCH"
+        " --cache-to type=registry,ref=r.io/cache:$CI_COMMIT_REF_SLUG,mode=max --push ."
+    )
+
+    blueprint["deployments"] = [{**deploy, "cache": {"inline": True}}]
+    steps = render_builtin(blueprint, "github")["jobs"]["docker_deploy"]["steps"]
+    assert steps[-1]["run"].splitlines()[-1] == (
+        "docker buildx build --tag r.io/app:1"
+        " --cache-from type=registry,ref=r.io/app:1 --cache-to type=inline --push ."
+    )
+
+
+def test_docker_deploy_without_cache_needs_no_buildx():
+    deploy = {"method": "docker", "registry": "r.io", "image_name": "app", "tag": "1"}
+    blueprint = {
+        "language": "python",
+        "build_commands": ["make"],
+        "deployments": [{**deploy, "target": "runtime"}],
+    }
+
+    assert render_builtin(blueprint, "gitlab")["docker_deploy"]["script"] == [
+        "docker login r.io",
+        "docker build -t r.io/app:1 --target runtime .",
+        "docker push r.io/app:1",
+    ]
+    steps = render_builtin(blueprint, "github")["jobs"]["docker_deploy"]["steps"]
+    assert steps[-1]["run"] == (
+        "docker build -t r.io/app:1 --target runtime .\ndocker push r.io/app:1\n"
+    )
+
+
+def test_stream_template_matches_render(tmp_path):
+    from citool.renderer import stream_template
+
+    template = tmp_path / "templates" / "gitlab" / "base" / "python-dev.yml.j2"
+    template.parent.mkdir(parents=True)
+    template.write_text("{% for step in steps %}- {{ step }}\n{% endfor %}")
+    config = Config(ci="gitlab", env="dev")
+    blueprint = {"language": "python", "steps": ["lint", "test", "build"]}
+
+    chunks = stream_template(blueprint, config, tmp_path / "templates")
+    assert not isinstance(chunks, str)
+    assert "".join(chunks) == render_template(blueprint, config, tmp_path / "templates")
+
+    # A missing template fails when the stream is opened, before any output.
+    with pytest.raises(FileNotFoundError):
+        stream_template(
+            dict(blueprint, language="rust"), config, tmp_path / "templates"
+        )
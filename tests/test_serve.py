@@ -0,0 +1,101 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from citool.serve import RenderServer, WatchedFiles, send_request, start_server
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_server_answers_json_lines(tmp_path: Path):
+    project = tmp_path / "deploy"
+    shutil.copytree(FIXTURES / "python_deploy", project)
+    socket_path = tmp_path / "citool.sock"
+    requests = [
+        {"path": str(project), "ci": "gitlab", "env": "dev", "dry_run": True},
+        {"path": str(project), "ci": "gitlab"},
+        {"path": str(project), "ci": "gitlab", "env": "dev"},
+    ]
+
+    async def roundtrip():
+        server = await start_server(socket_path, RenderServer())
+        async with server:
+            reader, writer = await asyncio.open_unix_connection(str(socket_path))
+            for request in requests:
+                writer.write(json.dumps(request).encode() + b"\n")
+            writer.write(b"not json\n")
+            await writer.drain()
+            responses = [json.loads(await reader.readline()) for _ in range(4)]
+            writer.close()
+            # The blocking client from another thread, against the same server.
+            responses.append(
+                await asyncio.to_thread(send_request, socket_path, requests[2])
+            )
+            return responses
+
+    rendered, missing, written, invalid, again = asyncio.run(roundtrip())
+
+    assert rendered["ok"] and "stages:" in rendered["output"]
+    assert rendered["output_path"] == str(project / ".gitlab-ci.yml")
+    assert missing == {
+        "ok": False,
+        "error": "ValueError: Missing required field 'env'",
+        "seconds": missing["seconds"],
+    }
+    assert written["status"] == "written"
+    assert (project / ".gitlab-ci.yml").read_text() == rendered["output"]
+    assert invalid["error"].startswith("Invalid JSON")
+    assert again["status"] == "up-to-date"
+
+
+def test_server_never_prompts(tmp_path: Path, monkeypatch):
+    project = tmp_path / "setup"
+    shutil.copytree(FIXTURES / "python_setup", project)
+    (project / "blueprint.yaml").unlink(missing_ok=True)
+    monkeypatch.setattr("citool.blueprint.ask", lambda msg: pytest.fail(msg))
+
+    response = RenderServer().handle(
+        {"path": str(project), "ci": "gitlab", "env": "dev", "dry_run": True}
+    )
+
+    assert response["ok"], response
+    assert "Detected language: Python" in response["messages"]
+    assert not (project / "blueprint.yaml").exists()
+
+
+def test_server_reloads_changed_templates(tmp_path: Path):
+    project = tmp_path / "deploy"
+    shutil.copytree(FIXTURES / "python_deploy", project)
+    template = tmp_path / "templates" / "gitlab" / "base" / "python-dev.yml.j2"
+    template.parent.mkdir(parents=True)
+    template.write_text("first: {{ env }}\n")
+    server = RenderServer(user_templates=tmp_path / "templates")
+    server.warm()
+    request = {"path": str(project), "ci": "gitlab", "env": "dev", "dry_run": True}
+
+    assert server.handle(request)["output"] == "first: dev"
+    assert server.reload_changed() == []
+
+    template.write_text("second: {{ env }}\n")
+    assert server.reload_changed() == ["templates"]
+    assert server.handle(request)["output"] == "second: dev"
+
+
+def test_watched_files_notice_edits_and_new_files(tmp_path: Path):
+    nested = tmp_path / "templates" / "gitlab" / "base"
+    nested.mkdir(parents=True)
+    (nested / "a.j2").write_text("a")
+    watched = WatchedFiles([tmp_path / "templates", tmp_path / "missing"])
+
+    assert not watched.changed()
+    (nested / "a.j2").write_text("ab")
+    assert watched.changed() and not watched.changed()
+    (nested / "b.j2").write_text("b")
+    assert watched.changed()
+    (tmp_path / "missing").mkdir()
+    (tmp_path / "missing" / "c.j2").write_text("c")
+    assert watched.changed()
+    assert len(watched.files) == 3
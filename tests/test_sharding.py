@@ -0,0 +1,113 @@
+import json
+from pathlib import Path
+
+import yaml
+
+from citool.config import Config
+from citool.renderer import render_template
+from citool.sharding import balance, load_shard_plan, main, read_durations, shard_count
+
+
+def write_report(file: Path, cases: list) -> Path:
+    testcases = "".join(
+        f"<testcase {' '.join(f'{k}={v!r}' for k, v in case.items())}><system-out>x</system-out></testcase>"
+        for case in cases
+    )
+    file.write_text(
+        f'<testsuites><testsuite name="s">{testcases}</testsuite></testsuites>'
+    )
+    return file
+
+
+def test_read_durations_per_file(tmp_path: Path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_b.py").write_text("")
+    first = write_report(
+        tmp_path / "a.xml",
+        [
+            {"file": "tests/test_a.py", "name": "t1", "time": "1.5"},
+            {"file": "tests/test_a.py", "name": "t2", "time": "2.5"},
+            {"classname": "tests.test_b.TestB", "name": "t3", "time": "3"},
+            {"classname": "com.example.FooTest", "name": "t4", "time": "1"},
+        ],
+    )
+    second = write_report(
+        tmp_path / "b.xml", [{"file": "tests/test_a.py", "time": "6"}]
+    )
+
+    assert read_durations([first, second], tmp_path) == {
+        "tests/test_a.py": 5.0,
+        "tests/test_b.py": 3.0,
+        "com.example.FooTest": 1.0,
+    }
+
+
+def test_balance_is_longest_processing_time_first():
+    durations = {"a": 7, "b": 5, "c": 4, "d": 3, "e": 1}
+
+    plan = balance(durations, 2)
+
+    assert plan == [
+        {"files": ["a", "d"], "seconds": 10},
+        {"files": ["b", "c", "e"], "seconds": 10},
+    ]
+    assert shard_count(durations, None, 6) == 4
+    assert shard_count(durations, 10, None) == 5
+
+
+def test_shard_command_and_sharded_pipeline(tmp_path: Path, capsys):
+    blueprint = {
+        "language": "python",
+        "build_system": "poetry",
+        "build_commands": ["poetry build"],
+        "test_commands": ["poetry install", "pytest"],
+        "test_sharding": {"shards": 2},
+        "ci": "gitlab",
+        "env": "dev",
+    }
+    (tmp_path / "blueprint.yaml").write_text(yaml.dump(blueprint))
+    reports = tmp_path / "reports"
+    reports.mkdir()
+    write_report(
+        reports / "junit.xml",
+        [{"file": f"tests/test_{i}.py", "time": str(i)} for i in range(1, 5)],
+    )
+
+    main([str(reports), "--path", str(tmp_path)])
+
+    plan = json.loads((tmp_path / ".citool-shards.json").read_text())
+    assert [shard["files"] for shard in plan["shards"]] == [
+        ["tests/test_1.py", "tests/test_4.py"],
+        ["tests/test_2.py", "tests/test_3.py"],
+    ]
+    assert "Shard plan written" in capsys.readouterr().out
+
+    config = Config(ci="gitlab", env="dev", path=tmp_path)
+    test = yaml.safe_load(render_template(blueprint, config))["test"]
+    assert test["parallel"]["matrix"] == [
+        {
+            "TEST_FILES": [
+                "tests/test_1.py tests/test_4.py",
+                "tests/test_2.py tests/test_3.py",
+            ]
+        }
+    ]
+    assert test["script"] == ["poetry install", "pytest $TEST_FILES"]
+
+    blueprint["test_sharding"]["command"] = "python -m pytest -n 2 $TEST_FILES"
+    config = Config(ci="github", env="dev", path=tmp_path)
+    test = yaml.safe_load(render_template(blueprint, config))["jobs"]["test"]
+    assert len(test["strategy"]["matrix"]["files"]) == 2
+    assert (
+        test["steps"][-1]["run"]
+        == "poetry install\npython -m pytest -n 2 $TEST_FILES\n"
+    )
+
+
+def test_missing_plan_is_logged_not_printed(tmp_path: Path, capsys, caplog):
+    caplog.set_level("INFO", logger="citool")
+
+    assert load_shard_plan(tmp_path, {"test_sharding": {"shards": 2}}) is None
+
+    assert capsys.readouterr().out == ""
+    assert "No shard plan at" in caplog.text
@@ -0,0 +1,111 @@
+from pathlib import Path
+
+import pytest
+
+from citool.util import sniff
+from citool.util.langmap import histogram_from_walk
+from citool.util.sniff import sniff_files, sniff_language
+
+MAPPING = {
+    "py": "Python",
+    "c": "C",
+    "h": "Objective-C",
+    "pl": "Raku",
+    "m": "Objective-C",
+}
+
+
+@pytest.mark.parametrize(
+    "head, language",
+    [
+        (b"#!/bin/sh\nexec make\n", "Shell"),
+        (b"#!/usr/bin/env python3.12\n", "Python"),
+        (b"#!/usr/bin/env -S PYTHONUNBUFFERED=1 python3 -u\n", "Python"),
+        (b"#! /usr/local/bin/perl -w\n", "Perl"),
+        (b"#!/usr/bin/env node\n", "JavaScript"),
+        (b"#!/usr/bin/awesome-interpreter\n", None),
+        (b"# -*- mode: ruby -*-\nputs 1\n", "Ruby"),
+        (b"echo hi\n# vim: set ft=bash :\n", "Shell"),
+        (b"Copyright (c) 2024\n", None),
+    ],
+)
+def test_extensionless_files_need_a_shebang_or_modeline(head, language):
+    assert sniff_language("tool", head) == language
+
+
+@pytest.mark.parametrize(
+    "name, head, language",
+    [
+        ("api.h", b"int add(int a, int b);\n", "C"),
+        ("api.h", b"namespace geo {\nclass Point {};\n}\n", "C++"),
+        (
+            "api.h",
+            b"#import <Foundation/Foundation.h>\n@interface Point\n@end\n",
+            "Objective-C",
+        ),
+        ("api.h", b"// -*- C++ -*-\nint add(int, int);\n", "C++"),
+        ("run.pl", b"use strict;\nuse warnings;\nprint 1;\n", "Perl"),
+        ("run.pl", b"use v6;\nsay 1;\n", "Raku"),
+        ("run.pl", b"parent(tom, bob).\nancestor(X, Y) :- parent(X, Y).\n", "Prolog"),
+        ("run.pl", b"#!/usr/bin/env raku\n", "Raku"),
+        ("fit.m", b"function y = fit(x)\n  y = x;\nend\n", "MATLAB"),
+        ("App.m", b'#import "App.h"\n@implementation App\n@end\n', "Objective-C"),
+        ("blob.h", b"\0\0\0binary", "C"),
+    ],
+)
+def test_ambiguous_extensions_are_decided_by_content(name, head, language):
+    assert sniff_language(name, head) == language
+
+
+def test_sniffing_reads_only_the_head_within_the_budget(tmp_path: Path, monkeypatch):
+    reads = []
+    read_head = sniff.read_head
+
+    def counting_read(path, limit):
+        reads.append(limit)
+        return read_head(path, limit)
+
+    monkeypatch.setattr(sniff, "read_head", counting_read)
+
+    (tmp_path / "a.h").write_text("class A {};\n" + "// filler\n" * 1000)
+    (tmp_path / "b.h").write_text("class B {};\n")
+    (tmp_path / "build").write_text("#!/bin/bash\n" + "echo\n" * 1000)
+    files = [
+        (name, (tmp_path / name).stat().st_size) for name in ("a.h", "build", "b.h")
+    ]
+
+    assert sniff_files(tmp_path, files) == ["C++", "Shell", "C++"]
+    assert sorted(reads) == [files[2][1], sniff.SHEBANG_BYTES, sniff.SNIFF_BYTES]
+
+    # Past the budget a file gets its extension's default, or nothing.
+    reads.clear()
+    assert sniff_files(tmp_path, files, budget=sniff.SNIFF_BYTES) == ["C++", None, "C"]
+    assert reads == [sniff.SNIFF_BYTES]
+
+
+def test_detection_counts_scripts_and_resolves_headers(tmp_path: Path):
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "deploy").write_text(
+        "#!/usr/bin/env perl\n" + "print 1;\n" * 50
+    )
+    (tmp_path / "LICENSE").write_text("MIT License\n" * 20)
+    (tmp_path / "lib.c").write_text("int x;\n")
+    (tmp_path / "lib.h").write_text("extern int x;\n")
+    (tmp_path / "Build.pl").write_text("use strict;\n")
+
+    histogram = histogram_from_walk(tmp_path, MAPPING)
+
+    assert histogram.ranked() == ["Perl", "C"]
+    assert histogram.bytes["C"] == len("int x;\n") + len("extern int x;\n")
+
+
+def test_many_files_are_read_in_parallel_in_order(tmp_path: Path):
+    files = []
+    for i in range(sniff.SNIFF_PARALLEL_MIN * 2):
+        script = tmp_path / f"tool{i}"
+        script.write_text("#!/bin/sh\n" if i % 3 else "#!/usr/bin/env python3\n")
+        files.append((script.name, script.stat().st_size))
+
+    languages = sniff_files(tmp_path, files)
+
+    assert languages == ["Shell" if i % 3 else "Python" for i in range(len(files))]
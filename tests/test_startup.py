@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC = Path(__file__).parents[1] / "src"
+
+IMPORTS = """
+import sys
+from citool.main import main
+try:
+    main(%r)
+except SystemExit:
+    pass
+print(",".join(m for m in ("jinja2", "yaml", "citool.blueprint", "citool.util.langmap") if m in sys.modules))
+"""
+
+
+@pytest.mark.parametrize(
+    "argv, output",
+    [(["--help"], "--ci"), (["--ci", "gitlab", "."], "Available CI platforms")],
+)
+def test_help_and_usage_errors_skip_heavy_imports(argv, output, tmp_path: Path):
+    proc = subprocess.run(
+        [sys.executable, "-c", IMPORTS % argv],
+        capture_output=True,
+        text=True,
+        env={"PYTHONPATH": str(SRC)},
+        cwd=tmp_path,
+        check=True,
+    )
+    assert output in proc.stdout
+    assert proc.stdout.splitlines()[-1] == ""
+
+
+def test_lazy_module_constants():
+    from citool import main
+
+    assert main.CI_CHOICES == ["gitlab", "github"]
+    assert "dev" in main.RECOMMENDED_ENVS
@@ -0,0 +1,70 @@
+import json
+import shutil
+from pathlib import Path
+
+from citool.batch import process_project
+from citool.main import main
+from citool.util import timing
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_spans_are_free_when_disabled():
+    assert timing.span("render") is timing.span("write")
+
+    calls = []
+    traced = timing.timed("phase")(lambda x: calls.append(x) or x)
+    assert traced(1) == 1 and calls == [1]
+
+
+def test_recorder_nests_spans():
+    recorder = timing.enable()
+    try:
+        with timing.span("outer", path="p"):
+            timing.timed("inner")(lambda: None)()
+    finally:
+        timing.disable()
+
+    inner, outer = recorder.events
+    assert (inner["name"], outer["name"]) == ("inner", "outer")
+    assert outer["ts"] <= inner["ts"] and inner["dur"] <= outer["dur"]
+    assert outer["args"] == {"path": "p"}
+    assert "outer" in timing.format_summary(recorder.events)
+
+
+def test_main_writes_chrome_trace(tmp_path: Path, capsys):
+    project = tmp_path / "deploy"
+    shutil.copytree(FIXTURES / "python_deploy", project)
+    trace = tmp_path / "trace.json"
+
+    main(
+        [
+            str(project),
+            "--ci",
+            "gitlab",
+            "--env",
+            "dev",
+            "--timings",
+            "--trace-file",
+            str(trace),
+        ]
+    )
+
+    names = {event["name"] for event in json.loads(trace.read_text())["traceEvents"]}
+    assert {"blueprint", "template_load", "render", "write"} <= names
+    assert "template_load" in capsys.readouterr().err
+    assert timing.span("render") is timing.span("write")
+
+
+def test_batch_records_timings_per_project(tmp_path: Path):
+    project = tmp_path / "deploy"
+    shutil.copytree(FIXTURES / "python_deploy", project)
+    options = {"ci": "gitlab", "env": "dev", "dry_run": True, "timings": True}
+
+    result = process_project(project, options)
+
+    assert set(result["timings"]) == {"project", "blueprint", "template_load", "render"}
+    assert all(
+        event["name"] != "project" or event["args"] == {"path": str(project)}
+        for event in result["trace"]
+    )
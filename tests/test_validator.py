@@ -0,0 +1,158 @@
+import json
+from pathlib import Path
+
+import pytest
+import yaml
+
+from citool.blueprint import load_or_generate_blueprint
+from citool.config import Config
+from citool.validator import compile_schema, main, validate_blueprint
+
+FIXTURES = Path(__file__).parent / "fixtures"
+EXAMPLES = Path(__file__).parent.parent / "examples"
+
+
+def base_blueprint(**extra) -> dict:
+    return {
+        "language": "python",
+        "build_system": "setuptools",
+        "build_commands": ["python setup.py install"],
+        "ci": "gitlab",
+        "env": "dev",
+        **extra,
+    }
+
+
+@pytest.mark.parametrize(
+    "file",
+    [
+        FIXTURES / "python_deploy" / "blueprint.yaml",
+        FIXTURES / "python_branch_tag" / "blueprint.yaml",
+        EXAMPLES / "blueprint-c.yaml",
+        EXAMPLES / "blueprint-python.json",
+    ],
+)
+def test_shipped_blueprints_are_valid(file: Path):
+    text = file.read_text()
+    data = json.loads(text) if file.suffix == ".json" else yaml.safe_load(text)
+
+    assert validate_blueprint(data) == []
+
+
+def test_errors_report_json_pointers():
+    blueprint = base_blueprint(
+        language="cobol",
+        ci={"platform": "gitlab"},
+        deployments=[{"method": "ssh", "target_server": "host"}],
+        extra_key=True,
+    )
+    del blueprint["build_commands"]
+
+    errors = validate_blueprint(blueprint)
+
+    assert "/: 'build_commands' is a required property" in errors
+    assert "/: additional property 'extra_key' is not allowed" in errors
+    assert any(e.startswith("/language: 'cobol' is not one of") for e in errors)
+    assert "/ci: 'output_path' is a required property" in errors
+    assert "/deployments/0: 'target_path' is a required property" in errors
+
+
+def test_ci_shorthand_must_name_a_platform():
+    assert validate_blueprint(base_blueprint(ci="jenkins")) == [
+        "/ci: 'jenkins' is not one of ['gitlab', 'github']"
+    ]
+
+
+def test_compiler_supports_combinators_and_refs():
+    validate = compile_schema(
+        {
+            "$defs": {"port": {"type": "integer", "minimum": 1}},
+            "type": "object",
+            "properties": {
+                "a/b": {"$ref": "#/$defs/port"},
+                "mode": {"anyOf": [{"const": "x"}, {"const": "y"}]},
+            },
+            "dependentRequired": {"mode": ["a/b"]},
+            "not": {"required": ["forbidden"]},
+        }
+    )
+
+    assert validate({"a/b": 2, "mode": "x"}) == []
+    assert validate({"a/b": 0}) == ["/a~1b: 0 is less than 1"]
+    assert validate({"mode": "z", "forbidden": 1}) == [
+        "/mode: does not match any of the allowed forms",
+        "/: 'a/b' is required when 'mode' is set",
+        "/: matches a form that is not allowed",
+    ]
+
+    with pytest.raises(ValueError, match="Unsupported schema keyword"):
+        compile_schema({"unevaluatedProperties": False})
+
+
+def test_loading_an_invalid_blueprint_fails(tmp_path: Path):
+    (tmp_path / "blueprint.yaml").write_text(yaml.dump(base_blueprint(env=3)))
+
+    with pytest.raises(ValueError, match="/env: expected string, got integer"):
+        load_or_generate_blueprint(tmp_path, Config(ci="gitlab", env="dev"))
+
+
+def test_validate_command(tmp_path: Path, capsys):
+    (tmp_path / "good").mkdir()
+    (tmp_path / "good" / "blueprint.yaml").write_text(yaml.dump(base_blueprint()))
+    (tmp_path / "bad").mkdir()
+    (tmp_path / "bad" / "blueprint.json").write_text(json.dumps(base_blueprint(ci=1)))
+
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--workers", "1"])
+
+    out = capsys.readouterr()
+    assert out.out.strip() == (
+        f"{tmp_path / 'bad' / 'blueprint.json'}: /ci: expected object or string, got integer"
+    )
+    assert "Validated 2 blueprint(s): 1 invalid" in out.err
+
+
+def test_validate_finds_named_blueprints(tmp_path: Path, capsys):
+    main([str(EXAMPLES), "--workers", "1"])
+    assert "Validated 2 blueprint(s): 0 invalid" in capsys.readouterr().err
+
+    (tmp_path / "docker-compose.yml").write_text("services: {}\n")
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--workers", "1"])
+    assert f"no blueprints found in {tmp_path}" in capsys.readouterr().err
+
+
+def test_docker_cache_options():
+    def docker(**options) -> dict:
+        deploy = {
+            "method": "docker",
+            "registry": "r.io",
+            "image_name": "app",
+            "tag": "1",
+        }
+        return base_blueprint(deployments=[{**deploy, **options}])
+
+    assert (
+        validate_blueprint(
+            docker(target="runtime", cache={"ref": "r.io:5000/app/cache"})
+        )
+        == []
+    )
+    assert validate_blueprint(docker(cache={"inline": True})) == []
+
+    assert validate_blueprint(docker(cache={"ref": "r.io/app:cache"})) == [
+        (
+            "/deployments/0/cache/ref: 'r.io/app:cache' does not match "
+            "'^([^/@\\\\s]+/)*[^/:@\\\\s]+$'"
+        )
+    ]
+    assert validate_blueprint(docker(cache={"inline": True, "mode": "max"})) == [
+        "/deployments/0/cache: 'ref' is required when 'mode' is set"
+    ]
+    assert validate_blueprint(docker(cache={"inline": False})) == [
+        "/deployments/0/cache: does not match any of the allowed forms"
+    ]
+    ssh = {"method": "ssh", "target_server": "h", "target_path": "/opt", "target": "x"}
+    assert validate_blueprint(base_blueprint(deployments=[ssh])) == [
+        "/deployments/0: matches a form that is not allowed"
+    ]
@@ -0,0 +1,111 @@
+from pathlib import Path
+
+from citool.util.langmap import detect_from_extensions
+from citool.util.walk import IgnoreRules, WalkStats, walk_files
+
+
+def touch(path: Path, content: str = "") -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_walk_prunes_deny_listed_directories(tmp_path: Path):
+    touch(tmp_path / "src" / "app.py")
+    touch(tmp_path / "node_modules" / "left-pad" / "index.js")
+    touch(tmp_path / ".git" / "HEAD")
+    touch(tmp_path / "target" / "Main.class")
+
+    stats = WalkStats()
+    files = [rel for rel, _ in walk_files(tmp_path, stats=stats)]
+
+    assert files == ["src/app.py"]
+    assert stats.skipped == 3
+
+
+def test_walk_honors_ignore_files(tmp_path: Path):
+    touch(tmp_path / ".gitignore", "*.log\ngenerated/\n/docs/*.md\n!keep.log\n")
+    touch(tmp_path / ".citoolignore", "**/fixtures/**/*.c\n")
+    touch(tmp_path / "app.py")
+    touch(tmp_path / "debug.log")
+    touch(tmp_path / "keep.log")
+    touch(tmp_path / "generated" / "parser.py")
+    touch(tmp_path / "docs" / "index.md")
+    touch(tmp_path / "docs" / "api" / "index.md")
+    touch(tmp_path / "tests" / "fixtures" / "deep" / "sample.c")
+
+    files = sorted(rel for rel, _ in walk_files(tmp_path))
+
+    assert files == [
+        ".citoolignore",
+        ".gitignore",
+        "app.py",
+        "docs/api/index.md",
+        "keep.log",
+    ]
+
+
+def test_walk_max_depth_and_file_budget(tmp_path: Path):
+    touch(tmp_path / "a.py")
+    touch(tmp_path / "pkg" / "b.py")
+    touch(tmp_path / "pkg" / "sub" / "c.py")
+
+    shallow = [rel for rel, _ in walk_files(tmp_path, max_depth=1)]
+    stats = WalkStats()
+    budget = [rel for rel, _ in walk_files(tmp_path, max_files=2, stats=stats)]
+
+    assert shallow == ["a.py", "pkg/b.py"]
+    assert budget == ["a.py", "pkg/b.py"]
+    assert stats.truncated
+
+
+def test_ignore_rules_exclude_parent_directories():
+    rules = IgnoreRules(["generated/"])
+
+    assert rules.excludes("generated/deep/file.py")
+    assert rules.excludes("node_modules/pkg/index.js")
+    assert not rules.excludes("src/generated.py")
+
+
+def test_detection_skips_vendored_trees(tmp_path: Path):
+    touch(tmp_path / "main.py")
+    touch(tmp_path / "node_modules" / "pkg" / "index.js")
+
+    assert detect_from_extensions(tmp_path, {"py": "Python", "js": "JavaScript"}) == [
+        "Python"
+    ]
+
+
+def test_ignore_rules_last_match_wins_across_runs():
+    rules = IgnoreRules(
+        ["*.log", "build/", "!keep*.log", "!important/", "keep-not.log"]
+    )
+
+    assert rules.match("debug.log")
+    assert not rules.match("keep.log")
+    assert rules.match("keep-not.log")
+    assert rules.match("build", is_dir=True)
+    assert not rules.match("build")
+    assert not rules.match("important", is_dir=True)
+
+    rules.add("*.log")
+    assert rules.match("keep.log")
+
+
+def test_large_groups_are_sized_from_a_sample(tmp_path: Path, monkeypatch):
+    from citool.util import langmap
+
+    monkeypatch.setattr(langmap, "SIZE_SAMPLE", 10)
+    sized = []
+    entry_size = langmap._entry_size
+    monkeypatch.setattr(
+        langmap, "_entry_size", lambda e: sized.append(e) or entry_size(e)
+    )
+    for i in range(40):
+        touch(tmp_path / f"pkg{i % 4}" / f"m{i}.py", "x" * 100)
+    touch(tmp_path / "lib.c", "int x;\n")
+
+    histogram = langmap.histogram_from_walk(tmp_path, {"py": "Python", "c": "C"})
+
+    assert histogram.as_dict() == {"Python": 4000, "C": 7}
+    assert histogram.files == 41
+    assert len(sized) == 11